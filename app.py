@@ -1,215 +1,176 @@
+import logging
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
 import plotly.express as px
-import io
-import json
-from fpdf import FPDF
-
-# Placeholder for google.generativeai - actual implementation would connect to the API
-
-# --- Helper classes (mimicking TypeScript interfaces for type hinting) ---
-
-class Product:
-    def __init__(self, id, name, purchasePrice, sellingPrice, unitsSoldWeek, category=None, stockLevel=None, supplier=None):
-        self.id = id
-        self.name = name
-        self.purchasePrice = purchasePrice
-        self.sellingPrice = sellingPrice
-        self.unitsSoldWeek = unitsSoldWeek
-        self.category = category
-        self.stockLevel = stockLevel
-        self.supplier = supplier
-
-class CalculatedProduct(Product):
-    def __init__(self, id, name, purchasePrice, sellingPrice, unitsSoldWeek, weeklyProfit, margin, weeklyRevenue, category=None, stockLevel=None, supplier=None):
-        super().__init__(id, name, purchasePrice, sellingPrice, unitsSoldWeek, category, stockLevel, supplier)
-        self.weeklyProfit = weeklyProfit
-        self.margin = margin
-        self.weeklyRevenue = weeklyRevenue
-
-
-# --- Helper functions (to be developed/translated from .ts files) ---
-
-def calculate_product_metrics(df):
-    if df is not None and not df.empty:
-        df['weeklyProfit'] = (df['sellingPrice'] - df['purchasePrice']) * df['unitsSoldWeek']
-        df['margin'] = ((df['sellingPrice'] - df['purchasePrice']) / df['sellingPrice']) * 100
-        df['weeklyRevenue'] = df['sellingPrice'] * df['unitsSoldWeek']
-    return df
-
-
-def get_ai_insight(products_data, question):
-    st.info(f"AI Insight request for: '{question}' with {len(products_data)} products.")
-    # In a real app, this would call the Gemini API in Python
-    # For now, it's a placeholder response
-    return {"insight": "This is a placeholder AI insight based on your question.", "visualization": None}
-
-def generate_compliance_checklist(location, business_type):
-    st.info(f"Generating compliance checklist for {business_type} in {location}.")
-    return [{"task": "Placeholder Task 1", "details": "Details for task 1"}, {"task": "Placeholder Task 2", "details": "Details for task 2"}]
-
-def get_marketing_advice(product, discount, lift, new_price, simulated_profit):
-    st.info(f"Generating marketing advice for {product.name}.")
-    return {"advice": "Placeholder marketing advice.", "visualization": None}
-
-def parse_unstructured_data(file_content):
-    st.info("Parsing unstructured data with AI.")
-    try:
-        df_parsed = pd.read_csv(io.StringIO(file_content))
-        if all(col in df_parsed.columns for col in ['name', 'sellingPrice', 'purchasePrice', 'unitsSoldWeek']):
-            products = []
-            for _, row in df_parsed.iterrows():
-                products.append({
-                    "name": row.get('name', 'Unknown'),
-                    "purchasePrice": float(row.get('purchasePrice', 0)),
-                    "sellingPrice": float(row.get('sellingPrice', 0)),
-                    "unitsSoldWeek": int(row.get('unitsSoldWeek', 0))
-                })
-            return products
-        else:
-            st.warning("Uploaded data does not contain expected columns: name, sellingPrice, purchasePrice, unitsSoldWeek. Using placeholder.")
-            return []
-    except Exception as e:
-        st.warning(f"Could not parse unstructured data as CSV: {e}. Using placeholder.")
-        return []
-
-def get_sales_forecast_and_suggestions(products_data):
-    st.info("Generating sales forecast and suggestions.")
-    forecasted_products = []
-    for p in products_data:
-        forecasted_sales = p.unitsSoldWeek * 1.05
-        stock = p.stockLevel if p.stockLevel is not None else 0
-        reorder_amount = max(0, forecasted_sales - stock)
-        reorder_suggestion = f"Reorder {int(reorder_amount)}" if reorder_amount > 0 else "Sufficient Stock"
-        if stock > forecasted_sales * 2:
-            reorder_suggestion = "Potentially Overstocked"
-
-        forecasted_products.append({
-            **p.__dict__, # Convert CalculatedProduct to dict
-            "forecastedSales": forecasted_sales,
-            "reorderSuggestion": reorder_suggestion
-        })
-    return forecasted_products
-
-def generate_full_pdf_report_content(metrics, products_data):
-    st.info("Generating full PDF report content.")
-    report_content = {
-        "reportTitle": "MSPCC Audit Report",
-        "reportDate": pd.Timestamp.now().strftime('%Y-%m-%d'),
-        "executiveSummary": {
-            "overview": "This is a placeholder executive summary. Overall business performance is fair.",
-            "keyMetrics": [
-                {"label": "Total Weekly Profit", "value": f"${metrics['totalWeeklyProfit']:.2f}", "status": "Neutral"},
-                {"label": "Total Weekly Revenue", "value": f"${metrics['totalWeeklyRevenue']:.2f}", "status": "Neutral"},
-            ]
-        },
-        "dataQuality": {
-            "summary": "Placeholder data quality summary. Data seems generally good.",
-            "score": "Good",
-            "checks": []
-        },
-        "categoryAnalysis": [],
-        "marketAnalysis": {
-            "topPerformers": ["Product A"],
-            "underPerformers": ["Product X"],
-            "opportunityGaps": ["Expand into new categories"]
-        },
-        "strategicRecommendations": [],
-        "conclusion": "Placeholder conclusion."
-    }
-    return report_content
-
-def generate_business_overview_stream(metrics, products_data):
-    st.info("Generating business overview stream.")
-    yield "### Business Overview"
-    yield f"Current total weekly profit: **${metrics['totalWeeklyProfit']:.2f}**
-    yield "No critical alerts at this time."
-
-def extract_web_data(products_data, query):
-    st.info(f"Extracting web data for query: '{query}'")
-    return {
-        "headers": ["Item", "Price", "Source"],
-        "data": [
-            ["Example Item 1", 10.99, "Simulated Website A"],
-            ["Example Item 2", 24.50, "Simulated Website B"]
-        ]
-    }
-
-
-# FPDF Report Generation (translation from reportGenerator.ts)
-def generate_pdf_report(report_content, metrics, products):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt=report_content["reportTitle"], ln=True, align='C')
-    pdf.cell(200, 10, txt=f"Report Date: {report_content['reportDate']}", ln=True, align='C')
-    pdf.ln(10)
-
-    pdf.set_font("Arial", 'B', size=14)
-    pdf.cell(200, 10, txt="Executive Summary", ln=True)
-    pdf.set_font("Arial", size=10)
-    pdf.multi_cell(0, 5, report_content["executiveSummary"]["overview"])
-    pdf.ln(5)
-
-    for metric in report_content["executiveSummary"]["keyMetrics"]:
-        pdf.cell(0, 5, txt=f"{metric['label']}: {metric['value']} ({metric['status']})", ln=True)
-    pdf.ln(10)
-
-    pdf.set_font("Arial", 'B', size=14)
-    pdf.cell(200, 10, txt="Detailed Product Data (Sample)", ln=True)
-    pdf.set_font("Arial", size=10)
-    
-    headers = ["Name", "Selling Price", "Weekly Profit"]
-    data = []
-    for p in products[:5]:
-        data.append([p.name, f"${p.sellingPrice:.2f}", f"${p.weeklyProfit:.2f}"])
-
-    col_widths = [60, 40, 40]
-    
-    for i, header in enumerate(headers):
-        pdf.cell(col_widths[i], 7, header, 1, 0, 'C')
-    pdf.ln()
-
-    for row in data:
-        for i, item in enumerate(row):
-            pdf.cell(col_widths[i], 7, item, 1, 0, 'C')
-        pdf.ln()
-    
-    pdf_output = pdf.output(dest='S').encode('latin-1')
-    return io.BytesIO(pdf_output)
+import os
+
+from mspcc.aggregates import DEFAULT_TOP_K, DEFAULT_TOP_K_CAPACITY, MARGIN_BANDS, downsample, filter_mask, margin_band_codes
+from mspcc.dataset import ProductDataset
+from mspcc.instrumentation import FILE_INTERVAL_SECONDS, METRICS_FILE, METRICS_PORT, get_instrumentation, span
+from mspcc.jobs import CANCELLED as JOB_CANCELLED, DONE as JOB_DONE, FAILED as JOB_FAILED, get_job_manager
+from mspcc.pipeline import (calculate_product_metrics, extract_web_data, generate_business_overview_stream,
+                            generate_compliance_checklist, generate_full_pdf_report_content, generate_pdf_report,
+                            get_ai_insight, get_marketing_advice, get_sales_forecast_and_suggestions, parse_unstructured_data)
+from mspcc.products import Product, memory_report
+from mspcc.simulator import simulate_promotion_grid
+from mspcc.store import DEFAULT_STORE_DIR, DatasetStore
+from mspcc.streaming import render_stream
+
+# The analytics helpers live in mspcc.pipeline so they also run without Streamlit (see mspcc.batch)
+
+
+class PageMessages(logging.Handler):
+    """Shows pipeline log messages on the page of the script run that logged them.
+
+    Records logged from background jobs have no script run context and are dropped.
+    """
+
+    def emit(self, record):
+        if get_script_run_ctx(suppress_warning=True) is None:
+            return
+        show = st.warning if record.levelno >= logging.WARNING else st.info
+        show(record.getMessage())
+
+
+# Reruns re-execute this module, so the handler is found by name instead of being added again
+pipeline_log = logging.getLogger('mspcc.pipeline')
+pipeline_log.setLevel(logging.INFO)
+if not any(handler.name == 'page-messages' for handler in pipeline_log.handlers):
+    page_messages = PageMessages()
+    page_messages.name = 'page-messages'
+    pipeline_log.addHandler(page_messages)
+
+
+# --- Background jobs (run on the shared JobManager; must not touch the page) ---
+
+def step_progress(job, start, end, message):
+    # Maps one step's 0-1 progress onto the job's bar; job.report raises once the job is cancelled
+    return lambda fraction: job.report(start + (end - start) * fraction, message)
+
+def ingest_job(job, dataset, uploaded_file):
+    job.report(0.1, "Parsing data...")
+    parse_result = parse_unstructured_data(uploaded_file, progress=step_progress(job, 0.1, 0.6, "Parsing data..."))
+    upsert_result = None
+    if parse_result:
+        job.report(0.6, "Updating products...")
+        # Matched by product name; metrics are only recalculated for new and changed rows
+        upsert_result = dataset.upsert(parse_result.products_df, compute_metrics=calculate_product_metrics)
+    return parse_result, upsert_result
+
+def forecast_job(job, dataset, products):
+    job.report(0.1, "Fitting demand models...")
+    return get_sales_forecast_and_suggestions(products, dataset.sales_history, dataset.forecasts,
+                                              progress=step_progress(job, 0.1, 0.9, "Fitting demand models..."))
+
+def web_extraction_job(job, products, query):
+    job.report(0.1, "Extracting web data...")
+    return extract_web_data(products, query)
+
+def report_job(job, products, metrics, category_totals):
+    job.report(0.1, "Generating report content...")
+    report_content = generate_full_pdf_report_content(metrics, products)
+    job.report(0.4, "Rendering PDF...")
+    return generate_pdf_report(report_content, metrics, products, category_totals,
+                               progress=step_progress(job, 0.4, 0.95, "Rendering PDF..."))
+
+def remove_report_file(pdf_path):
+    if os.path.exists(pdf_path):
+        os.remove(pdf_path)
 
 
 # --- Streamlit UI ---
 
+# Only the head of an upload is decoded for the preview; parsing streams the file
+UPLOAD_PREVIEW_BYTES = 64 * 1024
+# Products listed as top/under-performers in the PDF report
+REPORT_TOP_K = 5
+# Products shown as rows of the promotion planner heatmap
+PLANNER_HEATMAP_PRODUCTS = 30
+# How often a running background job's progress is refreshed
+JOB_POLL_SECONDS = 1
+# Groups shown in a drill-down bar chart, and products plotted in the price/profit scatter
+DRILL_DOWN_BARS = 25
+SCATTER_MAX_POINTS = 20_000
+DRILL_DOWN_DIMENSIONS = {"Category": 'category', "Supplier": 'supplier', "Margin band": 'marginBand'}
+DRILL_DOWN_MEASURES = {"Weekly Profit": 'weeklyProfit', "Weekly Revenue": 'weeklyRevenue', "Units Sold": 'unitsSoldWeek',
+                       "Stock Level": 'stockLevel', "Products": 'products', "Margin (%)": 'margin'}
+
 st.set_page_config(layout="wide", page_title="MSPCC Analytical Dashboard")
 
-# Initialize session state for product data
-if 'products_df' not in st.session_state:
-    st.session_state.products_df = pd.DataFrame(columns=[
-        'id', 'name', 'purchasePrice', 'sellingPrice', 'unitsSoldWeek',
-        'category', 'stockLevel', 'supplier', 'weeklyProfit', 'margin', 'weeklyRevenue'
-    ])
-    st.session_state.next_product_id = 1
+@st.cache_resource
+def get_shared_dataset():
+    # One dataset per server process, persisted on disk and shared by every session
+    return ProductDataset(DatasetStore(DEFAULT_STORE_DIR))
+
+# Per-session state only remembers which dataset version it last rendered
+dataset = get_shared_dataset()
+dataset.refresh()
+# Uploads change the dataset in place while a page renders; the page reads one version's frame and views
+view = dataset.snapshot()
+st.session_state.dataset_version = view.version
+products_df = view.frame
+
+job_manager = get_job_manager()
+instrumentation = get_instrumentation()
+
+@st.cache_resource
+def start_metrics_server():
+    # Prometheus scrape endpoint, once per server process
+    return instrumentation.serve(METRICS_PORT) if METRICS_PORT else None
+
+start_metrics_server()
+
+def products_memory_bytes():
+    # Sessions share the dataset frame, so its deep size is measured once per version
+    return view.cached('memory_bytes', lambda: int(products_df.memory_usage(deep=True).sum()))
+
+def show_job(job_id, render_result):
+    # Polls a background job without blocking the script; the result renders on the next full rerun
+    job = job_manager.get(job_id) if job_id is not None else None
+    if job is None:
+        return
+    if job.status == JOB_DONE:
+        render_result(job.result)
+    elif job.status == JOB_FAILED:
+        st.error(f"{job.kind.replace('_', ' ').capitalize()} failed: {job.error}")
+    elif job.status == JOB_CANCELLED:
+        st.info("Cancelled.")
+    else:
+        @st.fragment(run_every=JOB_POLL_SECONDS)
+        def job_progress():
+            if job.done:
+                st.rerun()
+            st.progress(job.progress, text=job.message or "Waiting to start...")
+            if st.button("Cancel", key=f"cancel_job_{job.id}", disabled=job.cancel_requested):
+                job.cancel()
+        job_progress()
 
 st.sidebar.title("Navigation")
-page = st.sidebar.radio("Go to", ["Dashboard", "Data Upload", "AI Insights", "Marketing Simulator", "Sales Forecast", "Compliance Checklist", "Web Data Extractor", "Report Generator"])
+pages = ["Dashboard", "Data Upload", "AI Insights", "Marketing Simulator", "Sales Forecast", "Compliance Checklist", "Web Data Extractor", "Report Generator"]
+# Diagnostics stays hidden unless instrumentation is on or the URL carries ?diagnostics
+if instrumentation.enabled or 'diagnostics' in st.query_params:
+    pages.append("Diagnostics")
+page = st.sidebar.radio("Go to", pages)
+
+if instrumentation.enabled:
+    instrumentation.count('reruns_total', page=page)
+    session_ctx = get_script_run_ctx()
+    instrumentation.gauge('session_products_df_bytes', products_memory_bytes(), session=session_ctx.session_id if session_ctx else 'bare')
+# Stopped at the end of the script; reruns that abort the script early are not recorded
+page_span = span(f"page:{page}")
 
 
 if page == "Dashboard":
     st.title("📊 Analytical Dashboard")
     st.markdown("Welcome to your MSPCC Analytical Dashboard. Gain insights into your product performance.")
 
-    if not st.session_state.products_df.empty:
-        total_profit = st.session_state.products_df['weeklyProfit'].sum()
-        total_revenue = st.session_state.products_df['weeklyRevenue'].sum()
-        avg_margin = st.session_state.products_df['margin'].mean() if not st.session_state.products_df.empty else 0
-
-        metrics_data = {
-            'totalWeeklyProfit': total_profit,
-            'totalWeeklyRevenue': total_revenue,
-            'averageMargin': avg_margin
-        }
+    if not products_df.empty:
+        metrics_data = view.aggregates.metrics()
+        total_profit = metrics_data['totalWeeklyProfit']
+        total_revenue = metrics_data['totalWeeklyRevenue']
+        avg_margin = metrics_data['averageMargin']
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -220,40 +181,81 @@ if page == "Dashboard":
             st.metric("Average Margin", f"{avg_margin:.1f}%")
 
         st.subheader("Product Performance Overview")
-        st.dataframe(st.session_state.products_df[['name', 'category', 'sellingPrice', 'unitsSoldWeek', 'weeklyProfit', 'margin']].head(10), use_container_width=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            top_k = st.slider("Products to show", 5, DEFAULT_TOP_K_CAPACITY, DEFAULT_TOP_K)
+        with col2:
+            categories = [c for c in view.aggregates.groups['category'] if c is not None]
+            selected_category = st.selectbox("Category", ["All Categories"] + sorted(categories))
+        ranking_category = None if selected_category == "All Categories" else selected_category
+        with span('dashboard.rankings'):
+            top_products_df = view.rankings.rows(products_df, 'weeklyProfit', top_k, category=ranking_category)
+        st.dataframe(top_products_df[['name', 'category', 'sellingPrice', 'unitsSoldWeek', 'weeklyProfit', 'margin']], use_container_width=True)
 
         st.subheader("Profitability Charts")
-        fig = px.bar(st.session_state.products_df.sort_values('weeklyProfit', ascending=False).head(10),
-                     x='name', y='weeklyProfit', title='Top 10 Products by Weekly Profit')
+        with span('dashboard.chart'):
+            fig = px.bar(top_products_df, x='name', y='weeklyProfit', title=f'Top {top_k} Products by Weekly Profit')
         st.plotly_chart(fig, use_container_width=True)
 
+        st.subheader("Drill-down")
+        # Charts read the category x supplier x margin band cube, which is kept up to date on upload
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            filter_categories = st.multiselect("Categories", view.cube.labels('category'))
+        with col2:
+            filter_suppliers = st.multiselect("Suppliers", view.cube.labels('supplier'))
+        with col3:
+            filter_bands = st.multiselect("Margin bands", view.cube.labels('marginBand'))
+        drill_filters = {'category': filter_categories, 'supplier': filter_suppliers, 'marginBand': filter_bands}
+        col1, col2 = st.columns(2)
+        with col1:
+            group_label = st.selectbox("Group by", list(DRILL_DOWN_DIMENSIONS))
+        with col2:
+            measure_label = st.selectbox("Measure", list(DRILL_DOWN_MEASURES))
+        group_by, measure = DRILL_DOWN_DIMENSIONS[group_label], DRILL_DOWN_MEASURES[measure_label]
+
+        col1, col2 = st.columns(2)
+        with col1:
+            with span('dashboard.drill_down'):
+                totals = view.cube.slice(group_by, drill_filters)
+                totals[group_by] = totals[group_by].fillna("Unspecified")
+                if group_by != 'marginBand':
+                    totals = totals.sort_values(measure, ascending=False).head(DRILL_DOWN_BARS)
+                fig = px.bar(totals, x=group_by, y=measure, hover_data=['products', 'weeklyProfit', 'weeklyRevenue'],
+                             category_orders={'marginBand': MARGIN_BANDS + ["Unspecified"]},
+                             labels={group_by: group_label, measure: measure_label}, title=f"{measure_label} by {group_label}")
+            st.plotly_chart(fig, use_container_width=True)
+        with col2:
+            with span('dashboard.scatter'):
+                # Band codes are computed once per version; the mask and sample are cheap per rerun
+                band_codes = view.cached('margin_band_codes', lambda: margin_band_codes(products_df['margin']))
+                mask = filter_mask(products_df, drill_filters, band_codes)
+                points = downsample(products_df, mask, SCATTER_MAX_POINTS)
+                # One WebGL trace: a continuous colour scale instead of a trace per category
+                fig = px.scatter(points, x='sellingPrice', y='weeklyProfit', color='margin', hover_name='name',
+                                 hover_data=['category', 'supplier'], render_mode='webgl', opacity=0.6,
+                                 color_continuous_scale='RdYlGn',
+                                 title=f"Price vs Weekly Profit ({len(points):,} of {int(mask.sum()):,} products)")
+            st.plotly_chart(fig, use_container_width=True)
+
         st.subheader("Live Business Overview (AI)")
         overview_metrics = {
             'totalWeeklyProfit': total_profit,
         }
-        products_for_ai = [
-            CalculatedProduct(
-                id=row['id'],
-                name=row['name'],
-                purchasePrice=row['purchasePrice'],
-                sellingPrice=row['sellingPrice'],
-                unitsSoldWeek=row['unitsSoldWeek'],
-                weeklyProfit=row['weeklyProfit'],
-                margin=row['margin'],
-                weeklyRevenue=row['weeklyRevenue'],
-                category=row.get('category'),
-                stockLevel=row.get('stockLevel'),
-                supplier=row.get('supplier')
-            )
-            for _, row in st.session_state.products_df.iterrows()
-        ]
+        products_for_ai = view.products
         
-        overview_generator = generate_business_overview_stream(overview_metrics, products_for_ai)
-        overview_text = st.empty()
-        full_overview = ""
-        for chunk in overview_generator:
-            full_overview += chunk
-            overview_text.markdown(full_overview)
+        # The finished overview is kept on the snapshot it was written from, so reruns of that version show it
+        # without regenerating; a placeholder or a stream that broke off is not kept
+        overview_container = st.container()
+        full_overview = view.get_cached('business_overview')
+        if full_overview is None:
+            with span('dashboard.overview_stream'):
+                overview_stream = generate_business_overview_stream(overview_metrics, products_for_ai)
+                full_overview = render_stream(overview_stream, overview_container)
+            if overview_stream.complete:
+                view.set_cached('business_overview', full_overview)
+        else:
+            overview_container.markdown(full_overview)
     else:
         st.info("Please upload product data via the 'Data Upload' page to see dashboard insights.")
 
@@ -264,31 +266,31 @@ elif page == "Data Upload":
     uploaded_file = st.file_uploader("Choose a file", type=["csv", "txt"])
 
     if uploaded_file is not None:
-        file_content = uploaded_file.getvalue().decode("utf-8")
-        st.text_area("File Content Preview", file_content, height=200)
+        preview = uploaded_file.read(UPLOAD_PREVIEW_BYTES).decode("utf-8", errors="ignore")
+        uploaded_file.seek(0)
+        st.text_area("File Content Preview", preview, height=200)
 
         if st.button("Process Data with AI"):
-            with st.spinner("Parsing data and calculating metrics..."):
-                parsed_products_list = parse_unstructured_data(file_content)
-
-                if parsed_products_list:
-                    new_products_df = pd.DataFrame(parsed_products_list)
-                    
-                    current_id = st.session_state.next_product_id
-                    new_products_df['id'] = range(current_id, current_id + len(new_products_df))
-                    st.session_state.next_product_id += len(new_products_df)
-
-                    new_products_df = calculate_product_metrics(new_products_df)
-                    
-                    st.session_state.products_df = pd.concat([st.session_state.products_df, new_products_df], ignore_index=True)
-                    st.success("Data processed and added to dashboard!")
-                    st.dataframe(new_products_df) # Show newly added data
-                else:
-                    st.error("AI could not extract valid product data from the file. Please check format.")
+            job = job_manager.submit("ingest", ingest_job, dataset, uploaded_file, key_parts=(uploaded_file.file_id,))
+            st.session_state.ingest_job_id = job.id
+
+        def show_ingest_result(result):
+            parse_result, upsert_result = result
+            if not parse_result.rejected_df.empty:
+                with st.expander("Rejected rows"):
+                    st.dataframe(parse_result.rejected_df, use_container_width=True)
+            if upsert_result is not None:
+                st.success(f"Data processed: {upsert_result.inserted} new, {upsert_result.updated} updated, "
+                           f"{upsert_result.unchanged} unchanged products.")
+                st.dataframe(upsert_result.rows) # Show new and changed products
+            else:
+                st.error("AI could not extract valid product data from the file. Please check format.")
+
+        show_job(st.session_state.get('ingest_job_id'), show_ingest_result)
     
     st.subheader("Current Loaded Data Sample")
-    if not st.session_state.products_df.empty:
-        st.dataframe(st.session_state.products_df.head())
+    if not products_df.empty:
+        st.dataframe(products_df.head())
     else:
         st.info("No product data loaded yet.")
 
@@ -297,27 +299,12 @@ elif page == "AI Insights":
     st.title("💡 AI-Powered Business Insights")
     st.markdown("Ask a question about your product data and get AI-driven insights and visualizations.")
 
-    if not st.session_state.products_df.empty:
+    if not products_df.empty:
         question = st.text_area("What would you like to know about your products?", "What are my most profitable products and why?")
 
         if st.button("Get Insight"):
             with st.spinner("Generating AI insight..."):
-                products_for_ai = [
-                    CalculatedProduct(
-                        id=row['id'],
-                        name=row['name'],
-                        purchasePrice=row['purchasePrice'],
-                        sellingPrice=row['sellingPrice'],
-                        unitsSoldWeek=row['unitsSoldWeek'],
-                        weeklyProfit=row['weeklyProfit'],
-                        margin=row['margin'],
-                        weeklyRevenue=row['weeklyRevenue'],
-                        category=row.get('category'),
-                        stockLevel=row.get('stockLevel'),
-                        supplier=row.get('supplier')
-                    )
-                    for _, row in st.session_state.products_df.iterrows()
-                ]
+                products_for_ai = view.products
                 insight_response = get_ai_insight(products_for_ai, question)
                 st.subheader("AI Insight")
                 st.markdown(insight_response["insight"])
@@ -333,11 +320,16 @@ elif page == "Marketing Simulator":
     st.title("📈 Marketing Promotion Simulator")
     st.markdown("Simulate the impact of price changes and sales lift on product profitability.")
 
-    if not st.session_state.products_df.empty:
-        selected_product_name = st.selectbox("Select a Product", st.session_state.products_df['name'].unique())
+    if not products_df.empty:
+        # The what-if grid covers the whole catalog and only changes with the data
+        promotion_grid = view.cached('promotion_grid', lambda: simulate_promotion_grid(view.products))
+
+        # Names are unique (uploads are upserted by name), and the lookup goes through the name index
+        selected_product_name = st.selectbox("Select a Product", products_df['name'])
         
         if selected_product_name:
-            selected_product_row = st.session_state.products_df[st.session_state.products_df['name'] == selected_product_name].iloc[0]
+            selected_position = dataset.table.position_of_name(selected_product_name)
+            selected_product_row = products_df.iloc[selected_position]
             
             current_product = Product(
                 id=selected_product_row['id'],
@@ -363,6 +355,14 @@ elif page == "Marketing Simulator":
             st.write(f"**Simulated Weekly Units Sold:** {simulated_units:.0f}")
             st.write(f"**Simulated Weekly Profit:** ${simulated_profit:.2f}")
 
+            with col2:
+                with span('simulator.surface_chart'):
+                    surface = promotion_grid.profit_surface(selected_position)
+                    fig = px.imshow(surface, x=promotion_grid.lifts, y=promotion_grid.discounts, origin='lower', aspect='auto',
+                                    labels={'x': 'Sales Lift (%)', 'y': 'Discount (%)', 'color': 'Weekly Profit'},
+                                    title='Simulated Weekly Profit', color_continuous_scale='RdYlGn')
+                st.plotly_chart(fig, use_container_width=True)
+
             if st.button("Get Marketing Advice"):
                 with st.spinner("Generating marketing advice..."):
                     marketing_response = get_marketing_advice(current_product, discount_percent, lift_percent, new_price, simulated_profit)
@@ -371,6 +371,23 @@ elif page == "Marketing Simulator":
                     if marketing_response["visualization"]:
                         st.subheader("Comparison Visualization")
                         st.json(marketing_response["visualization"]) # Display raw JSON for now
+
+        st.subheader("Catalog-wide Promotion Planner")
+        st.markdown("Best discount for every product, assuming the deepest discount achieves the given sales lift and shallower discounts proportionally less.")
+        planner_lift = st.slider("Sales Lift at Maximum Discount (%)", 0, 200, 100)
+        with span('simulator.planner'):
+            best_discount_df = promotion_grid.best_discount_table(planner_lift)
+            st.dataframe(best_discount_df.sort_values('profitUplift', ascending=False), use_container_width=True)
+
+            heatmap_labels = view.rankings.labels('weeklyRevenue', PLANNER_HEATMAP_PRODUCTS)
+            heatmap_positions = products_df.index.get_indexer(heatmap_labels)
+            # -1 would silently show the last product; only ranked products in this frame are plotted
+            heatmap_positions = heatmap_positions[heatmap_positions >= 0]
+            best_discounts, _ = promotion_grid.best_discounts(heatmap_positions)
+            fig = px.imshow(best_discounts, x=promotion_grid.lifts, y=products_df['name'].to_numpy()[heatmap_positions],
+                            aspect='auto', labels={'x': 'Sales Lift at Maximum Discount (%)', 'y': 'Product', 'color': 'Best Discount (%)'},
+                            title=f'Profit-Maximizing Discount (Top {len(heatmap_positions)} Products by Revenue)')
+        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Please upload product data to use the Marketing Simulator.")
 
@@ -378,30 +395,16 @@ elif page == "Sales Forecast":
     st.title("🔮 Sales Forecast & Inventory Suggestions")
     st.markdown("Get AI-powered sales forecasts and reorder suggestions for your products.")
 
-    if not st.session_state.products_df.empty:
+    if not products_df.empty:
         if st.button("Generate Forecasts"):
-            with st.spinner("Generating sales forecasts..."):
-                products_for_ai = [
-                    CalculatedProduct(
-                        id=row['id'],
-                        name=row['name'],
-                        purchasePrice=row['purchasePrice'],
-                        sellingPrice=row['sellingPrice'],
-                        unitsSoldWeek=row['unitsSoldWeek'],
-                        weeklyProfit=row['weeklyProfit'],
-                        margin=row['margin'],
-                        weeklyRevenue=row['weeklyRevenue'],
-                        category=row.get('category'),
-                        stockLevel=row.get('stockLevel'),
-                        supplier=row.get('supplier')
-                    )
-                    for _, row in st.session_state.products_df.iterrows()
-                ]
-                forecasted_data = get_sales_forecast_and_suggestions(products_for_ai)
-                forecast_df = pd.DataFrame(forecasted_data)
-                
-                st.subheader("Sales Forecast and Reorder Suggestions")
-                st.dataframe(forecast_df[['name', 'unitsSoldWeek', 'stockLevel', 'forecastedSales', 'reorderSuggestion']], use_container_width=True)
+            job = job_manager.submit("forecast", forecast_job, dataset, view.products, key_parts=(view.version,))
+            st.session_state.forecast_job_id = job.id
+
+        def show_forecast(forecast_df):
+            st.subheader("Sales Forecast and Reorder Suggestions")
+            st.dataframe(forecast_df[['name', 'unitsSoldWeek', 'stockLevel', 'forecastedSales', 'safetyStock', 'forecastModel', 'reorderSuggestion']], use_container_width=True)
+
+        show_job(st.session_state.get('forecast_job_id'), show_forecast)
     else:
         st.info("Please upload product data to generate sales forecasts.")
 
@@ -423,36 +426,27 @@ elif page == "Web Data Extractor":
     st.title("🌐 Web Data Extractor")
     st.markdown("Use AI to extract structured data from web content based on your query.")
 
-    if not st.session_state.products_df.empty:
-        query = st.text_area("Enter your query (e.g., 'latest prices for laptops from bestbuy.com' or 'compare features of Samsung Galaxy S23 vs iPhone 15')",
+    if not products_df.empty:
+        # Queries containing URLs fetch those pages and match their prices to the catalog; others go to the AI
+        query = st.text_area("Enter your query (e.g., 'latest prices for laptops from bestbuy.com' or 'compare features of Samsung Galaxy S23 vs iPhone 15'), "
+                             "or paste product page URLs to compare their prices with your catalog",
                              "latest prices for laptops on amazon.com")
         
         if st.button("Extract Data"):
-            with st.spinner("Extracting web data..."):
-                products_for_ai = [
-                    CalculatedProduct(
-                        id=row['id'],
-                        name=row['name'],
-                        purchasePrice=row['purchasePrice'],
-                        sellingPrice=row['sellingPrice'],
-                        unitsSoldWeek=row['unitsSoldWeek'],
-                        weeklyProfit=row['weeklyProfit'],
-                        margin=row['margin'],
-                        weeklyRevenue=row['weeklyRevenue'],
-                        category=row.get('category'),
-                        stockLevel=row.get('stockLevel'),
-                        supplier=row.get('supplier')
-                    )
-                    for _, row in st.session_state.products_df.iterrows()
-                ]
-                extracted_data = extract_web_data(products_for_ai, query)
-                
-                if extracted_data and extracted_data['data']:
-                    st.subheader("Extracted Data")
-                    extracted_df = pd.DataFrame(extracted_data['data'], columns=extracted_data['headers'])
-                    st.dataframe(extracted_df, use_container_width=True)
-                else:
-                    st.info("No data extracted for this query.")
+            job = job_manager.submit("web_extraction", web_extraction_job, view.products, query, key_parts=(view.version, query))
+            st.session_state.web_extraction_job_id = job.id
+
+        def show_extracted_data(extracted_data):
+            for error in (extracted_data or {}).get('errors', []):
+                st.warning(f"Could not fetch {error}")
+            if extracted_data and extracted_data['data']:
+                st.subheader("Extracted Data")
+                extracted_df = pd.DataFrame(extracted_data['data'], columns=extracted_data['headers'])
+                st.dataframe(extracted_df, use_container_width=True)
+            else:
+                st.info("No data extracted for this query.")
+
+        show_job(st.session_state.get('web_extraction_job_id'), show_extracted_data)
     else:
         st.info("Upload product data to give AI context for web data extraction.")
 
@@ -460,47 +454,70 @@ elif page == "Report Generator":
     st.title("📄 Generate Detailed Report")
     st.markdown("Generate a comprehensive PDF report summarizing your product performance.")
 
-    if not st.session_state.products_df.empty:
+    if not products_df.empty:
         if st.button("Generate PDF Report"):
-            with st.spinner("Generating report content..."):
-                total_profit = st.session_state.products_df['weeklyProfit'].sum()
-                total_revenue = st.session_state.products_df['weeklyRevenue'].sum()
-                avg_margin = st.session_state.products_df['margin'].mean() if not st.session_state.products_df.empty else 0
-
-                metrics_for_report = {
-                    'totalWeeklyProfit': total_profit,
-                    'totalWeeklyRevenue': total_revenue,
-                    'averageMargin': avg_margin,
-                    'profitTrend': [total_profit * (0.9 + i*0.02) for i in range(7)] # Sample trend
-                }
-                
-                products_for_ai = [
-                    CalculatedProduct(
-                        id=row['id'],
-                        name=row['name'],
-                        purchasePrice=row['purchasePrice'],
-                        sellingPrice=row['sellingPrice'],
-                        unitsSoldWeek=row['unitsSoldWeek'],
-                        weeklyProfit=row['weeklyProfit'],
-                        margin=row['margin'],
-                        weeklyRevenue=row['weeklyRevenue'],
-                        category=row.get('category'),
-                        stockLevel=row.get('stockLevel'),
-                        supplier=row.get('supplier')
-                    )
-                    for _, row in st.session_state.products_df.iterrows()
-                ]
-
-                report_content = generate_full_pdf_report_content(metrics_for_report, products_for_ai)
-                
-            st.success("Report content generated. Creating PDF...")
-            pdf_buffer = generate_pdf_report(report_content, metrics_for_report, products_for_ai)
-            
-            st.download_button(
-                label="Download PDF Report",
-                data=pdf_buffer,
-                file_name=f"MSPCC_Audit_Report_{pd.Timestamp.now().strftime('%Y-%m-%d')}.pdf",
-                mime="application/pdf"
-            )
+            metrics_for_report = view.aggregates.metrics()
+            total_profit = metrics_for_report['totalWeeklyProfit']
+            metrics_for_report['profitTrend'] = [total_profit * (0.9 + i*0.02) for i in range(7)] # Sample trend
+            metrics_for_report['topPerformers'] = view.rankings.rows(products_df, 'weeklyProfit', REPORT_TOP_K)['name'].tolist()
+            metrics_for_report['underPerformers'] = view.rankings.rows(products_df, 'weeklyProfit', REPORT_TOP_K, largest=False)['name'].tolist()
+
+            job = job_manager.submit("report", report_job, view.products, metrics_for_report, view.aggregates.group_totals('category'),
+                                     key_parts=(view.version,), cleanup=remove_report_file)
+            st.session_state.report_job_id = job.id
+
+        def show_report_download(pdf_path):
+            st.success("Report generated.")
+            with open(pdf_path, 'rb') as pdf_file:
+                st.download_button(
+                    label="Download PDF Report",
+                    data=pdf_file,
+                    file_name=f"MSPCC_Audit_Report_{pd.Timestamp.now().strftime('%Y-%m-%d')}.pdf",
+                    mime="application/pdf"
+                )
+
+        show_job(st.session_state.get('report_job_id'), show_report_download)
     else:
         st.info("Please upload product data to generate a report.")
+
+elif page == "Diagnostics":
+    st.title("🩺 Diagnostics")
+    st.markdown("Timing spans for helpers and page sections, reruns per page and dataset memory, for this server process.")
+
+    recording = st.toggle("Record timings", value=instrumentation.enabled)
+    if recording != instrumentation.enabled:
+        instrumentation.enabled = recording
+        st.rerun()
+    if st.button("Reset"):
+        instrumentation.reset()
+
+    span_rows = instrumentation.span_summary()
+    if span_rows:
+        st.subheader("Spans")
+        st.dataframe(pd.DataFrame(span_rows), use_container_width=True)
+    else:
+        st.info("No spans recorded yet. Turn recording on and use the other pages.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Reruns")
+        rerun_rows = [row for row in instrumentation.counters() if row['name'] == 'reruns_total']
+        if rerun_rows:
+            st.dataframe(pd.DataFrame(rerun_rows)[['page', 'value']].rename(columns={'value': 'reruns'}), use_container_width=True)
+    with col2:
+        st.subheader("Products Data Memory")
+        st.metric("Current dataset", f"{products_memory_bytes() / 2**20:,.1f} MB")
+        memory_rows = instrumentation.gauges('session_products_df_bytes')
+        if memory_rows:
+            st.dataframe(pd.DataFrame(memory_rows).rename(columns={'value': 'bytes'}), use_container_width=True)
+
+    if not products_df.empty:
+        st.subheader("Products Data Layout")
+        st.markdown("Bytes per column in the compact schema compared with the untyped (object/float64) layout it replaces.")
+        st.dataframe(view.cached('memory_report', lambda: memory_report(products_df)), use_container_width=True)
+
+    st.download_button("Download Prometheus metrics", instrumentation.to_prometheus(), file_name="mspcc_metrics.prom", mime="text/plain")
+
+page_span.stop()
+if METRICS_FILE and instrumentation.enabled:
+    instrumentation.write_textfile(METRICS_FILE, min_interval=FILE_INTERVAL_SECONDS)
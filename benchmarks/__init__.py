@@ -0,0 +1 @@
+# Scaling benchmarks for the dashboard's hot paths; run with `python -m benchmarks.run`.
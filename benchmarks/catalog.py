@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+
+MIN_SKUS = 1_000
+MAX_SKUS = 5_000_000
+# Rows generated per chunk, so multi-million SKU catalogs can be written without holding them twice
+CHUNK_SKUS = 250_000
+
+CATEGORY_WORDS = ['Home', 'Garden', 'Toys', 'Grocery', 'Beauty', 'Sports', 'Office', 'Pets', 'Auto', 'Tools',
+                  'Kitchen', 'Baby', 'Books', 'Music', 'Outdoor', 'Health', 'Crafts', 'Lighting', 'Storage', 'Party']
+NAME_WORDS = ['Classic', 'Premium', 'Mini', 'Deluxe', 'Eco', 'Smart', 'Pro', 'Compact', 'Family', 'Travel',
+              'Organic', 'Heavy-Duty', 'Wireless', 'Bamboo', 'Steel', 'Cotton', 'Glass', 'Ceramic', 'Vintage', 'Ultra']
+NOUN_WORDS = ['Mug', 'Lamp', 'Blender', 'Notebook', 'Brush', 'Bottle', 'Chair', 'Cable', 'Basket', 'Candle',
+              'Towel', 'Speaker', 'Planter', 'Kettle', 'Backpack', 'Puzzle', 'Scissors', 'Leash', 'Jar', 'Pillow']
+
+
+def _check_size(n_skus):
+    if not MIN_SKUS <= n_skus <= MAX_SKUS:
+        raise ValueError(f"n_skus must be between {MIN_SKUS:,} and {MAX_SKUS:,}, got {n_skus:,}")
+
+
+def _chunk(start, stop, seed, n_categories, n_suppliers):
+    # Seeded per chunk so any slice of a catalog is reproducible on its own
+    rng = np.random.default_rng([seed, start])
+    n = stop - start
+    ids = np.arange(start, stop)
+
+    category_codes = np.minimum(rng.zipf(1.6, n) - 1, n_categories - 1)
+    categories = np.array([f"{CATEGORY_WORDS[i % len(CATEGORY_WORDS)]} {i // len(CATEGORY_WORDS) + 1}" for i in range(n_categories)], dtype=object)
+    suppliers = np.array([f"Supplier {i + 1:03d}" for i in range(n_suppliers)], dtype=object)
+
+    names = (pd.Series(np.array(NAME_WORDS, dtype=object)[ids % len(NAME_WORDS)])
+             + ' ' + np.array(NOUN_WORDS, dtype=object)[(ids // len(NAME_WORDS)) % len(NOUN_WORDS)]
+             + ' #' + pd.Series(ids).astype(str))
+
+    purchase = np.round(rng.lognormal(2.0, 0.8, n), 2)
+    markup = rng.uniform(0.9, 2.5, n)
+    # Weekly demand is heavy-tailed and frequently zero, like real long-tail catalogs
+    units = np.where(rng.random(n) < 0.2, 0, rng.negative_binomial(2, 0.1, n))
+    stock = rng.integers(0, 500, n).astype(float)
+    stock[rng.random(n) < 0.05] = np.nan
+
+    return pd.DataFrame({
+        'name': names.to_numpy(),
+        'purchasePrice': purchase,
+        'sellingPrice': np.round(purchase * markup, 2),
+        'unitsSoldWeek': units,
+        'category': categories[category_codes],
+        'stockLevel': pd.array(stock, dtype='Int64'),
+        'supplier': suppliers[rng.integers(0, n_suppliers, n)],
+    })
+
+
+def iter_catalog(n_skus, seed=0, n_categories=None, n_suppliers=None, chunk_skus=CHUNK_SKUS):
+    """Yield a deterministic synthetic catalog in DataFrame chunks."""
+    _check_size(n_skus)
+    n_categories = n_categories or int(min(200, max(10, np.sqrt(n_skus) / 5)))
+    n_suppliers = n_suppliers or int(min(1000, max(5, n_skus / 2000)))
+    for start in range(0, n_skus, chunk_skus):
+        yield _chunk(start, min(n_skus, start + chunk_skus), seed, n_categories, n_suppliers)
+
+
+def generate_catalog(n_skus, seed=0, **kwargs):
+    """Raw upload-shaped catalog: name, prices, units, category, stockLevel, supplier."""
+    return pd.concat(iter_catalog(n_skus, seed, **kwargs), ignore_index=True)
+
+
+def write_catalog_csv(path, n_skus, seed=0, **kwargs):
+    for i, chunk in enumerate(iter_catalog(n_skus, seed, **kwargs)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    return path
@@ -0,0 +1,400 @@
+"""Benchmark the dashboard's hot paths against synthetic catalogs.
+
+    python -m benchmarks.run                              # default sizes, compare to baseline
+    python -m benchmarks.run --sizes 1000 1000000 --only page:Dashboard
+    python -m benchmarks.run --save-baseline              # record the current numbers
+
+Reports best-of-N wall time and peak traced memory per benchmark and size, and
+exits non-zero when a result regresses past the tolerance of the stored baseline,
+or has no baseline to compare with (unless --allow-missing-baseline).
+"""
+import argparse
+import http.server
+import importlib.util
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# The app and library read their store location at import time; keep benchmarks off the real data
+_STORE_ROOT = tempfile.mkdtemp(prefix='mspcc_bench_')
+os.environ['MSPCC_DATA_DIR'] = os.path.join(_STORE_ROOT, 'default')
+os.environ['MSPCC_HTTP_CACHE_DIR'] = os.path.join(_STORE_ROOT, 'http_cache')
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import mspcc.store  # noqa: E402
+import mspcc.web  # noqa: E402
+from mspcc import pipeline  # noqa: E402
+from mspcc.aggregates import AggregateCube  # noqa: E402
+from benchmarks.catalog import generate_catalog  # noqa: E402
+from mspcc.dataset import ProductDataset  # noqa: E402
+from mspcc.forecast import SalesHistory  # noqa: E402
+from mspcc.insights import answer_locally  # noqa: E402
+from mspcc.jobs import DONE as JOB_DONE, get_job_manager  # noqa: E402
+from mspcc.products import CalculatedProduct, ProductCollection  # noqa: E402
+from mspcc.store import DatasetStore  # noqa: E402
+from mspcc.web import HTTPCache, WebFetcher  # noqa: E402
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_TOLERANCE = 0.25
+HISTORY_WEEKS = 12
+# Pages served by the stand-in web server, and product offers on each
+WEB_PAGES = 20
+OFFERS_PER_PAGE = 50
+PAGES = ["Dashboard", "Data Upload", "AI Insights", "Marketing Simulator", "Sales Forecast",
+         "Compliance Checklist", "Web Data Extractor", "Report Generator"]
+# Pages whose work starts from a button: (button label, session key of the job it submits)
+PAGE_ACTIONS = {
+    "Sales Forecast": ("Generate Forecasts", 'forecast_job_id'),
+    "Report Generator": ("Generate PDF Report", 'report_job_id'),
+}
+JOB_POLL_SECONDS = 0.05
+
+
+def quiet_streamlit():
+    # Bare-mode runs warn about the missing script context on every st.* call
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith('streamlit'):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def load_app():
+    # app.py is a Streamlit script: loading it renders the default page in bare mode
+    import streamlit  # noqa: F401
+    quiet_streamlit()
+    spec = importlib.util.spec_from_file_location('mspcc_app', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    quiet_streamlit()
+    return module
+
+
+class Benchmark:
+    def __init__(self, name, setup, run, max_size=None, repeat=3):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.max_size = max_size
+        self.repeat = repeat
+
+
+# --- Setups ---
+
+_catalogs = {}
+
+
+def catalog(size):
+    if size not in _catalogs:
+        _catalogs.clear()
+        _catalogs[size] = generate_catalog(size)
+    return _catalogs[size]
+
+
+def calculated_catalog(app, size):
+    df = app.calculate_product_metrics(catalog(size).copy())
+    df['id'] = np.arange(1, len(df) + 1)
+    return df
+
+
+def sales_history(df):
+    rng = np.random.default_rng(0)
+    history = SalesHistory()
+    base = df['unitsSoldWeek'].to_numpy(dtype=float)
+    for week in pd.period_range(end=pd.Timestamp.now(), periods=HISTORY_WEEKS, freq='W'):
+        history.record(df['id'].to_numpy(), rng.poisson(base), week)
+    return history
+
+
+def reupload_setup(app, size):
+    # A dataset holding the catalog and a re-upload of it with 1% of prices changed. The traced run
+    # applies the changes, so the timed runs measure re-uploading a file that is already in the dataset.
+    dataset = ProductDataset()
+    dataset.upsert(catalog(size).copy(), compute_metrics=app.calculate_product_metrics)
+    upload = catalog(size).copy()
+    changed = np.random.default_rng(0).random(len(upload)) < 0.01
+    upload.loc[changed, 'sellingPrice'] += 1
+    return dataset, upload
+
+
+def cube_setup(app, size):
+    cube = AggregateCube()
+    cube.add(calculated_catalog(app, size))
+    cube.frame()
+    # A drill-down a user would click: a few categories, grouped by supplier
+    return cube, {'category': cube.labels('category')[:3], 'marginBand': ['10-20%', '20-30%']}
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Serves ``server.pages`` with ETags and Cache-Control: no-cache, so repeat fetches revalidate (304)."""
+
+    def do_GET(self):
+        body = self.server.pages.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = f'"{len(body)}-{hash(body) & 0xFFFFFFFF:x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stand_in_pages(df):
+    # Offers named like catalog products (case and spacing changed), half as JSON-LD and half as plain listings
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(df), min(WEB_PAGES * OFFERS_PER_PAGE, len(df)), replace=False)
+    names = df['name'].to_numpy()[picked]
+    prices = df['sellingPrice'].to_numpy(dtype=float)[picked] * rng.uniform(0.8, 1.2, len(picked))
+    pages = {}
+    for page in range(WEB_PAGES):
+        offers = list(zip(names[page::WEB_PAGES], prices[page::WEB_PAGES]))
+        if page % 2:
+            items = [{'@type': 'Product', 'name': name.upper(), 'offers': {'@type': 'Offer', 'price': f"{price:.2f}"}}
+                     for name, price in offers]
+            body = f'<html><script type="application/ld+json">{json.dumps({"@graph": items})}</script></html>'
+        else:
+            body = '<html><ul>' + ''.join(f"<li>{'  '.join(name.split())} - ${price:.2f}</li>" for name, price in offers) + '</ul></html>'
+        pages[f'/products/{page}'] = body.encode('utf-8')
+    return pages
+
+
+def web_setup(app, size):
+    df = calculated_catalog(app, size)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.pages = stand_in_pages(df)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # The stand-in server is on loopback, which the app's fetcher refuses
+    fetcher = WebFetcher(HTTPCache(os.path.join(_STORE_ROOT, f'http-{size}')), allow_private=True)
+    close_default_fetcher()
+    mspcc.web._default_fetcher = fetcher
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    urls = [base_url + path for path in server.pages]
+    return df, urls
+
+
+def close_default_fetcher():
+    if mspcc.web._default_fetcher is not None:
+        mspcc.web._default_fetcher.close()
+        mspcc.web._default_fetcher = None
+
+
+def page_setup(page):
+    def setup(app, size):
+        from streamlit.testing.v1 import AppTest
+        import streamlit as st
+
+        store_dir = os.path.join(_STORE_ROOT, f'pages-{size}')
+        if not os.path.exists(store_dir):
+            dataset = ProductDataset(DatasetStore(store_dir))
+            dataset.upsert(catalog(size).copy(), compute_metrics=app.calculate_product_metrics)
+        mspcc.store.DEFAULT_STORE_DIR = store_dir
+        st.cache_resource.clear()
+        at = AppTest.from_file(APP_PATH, default_timeout=600)
+        at.run()
+        return (at,)
+
+    def run(at):
+        at.sidebar.radio[0].set_value(page).run()
+        if at.exception:
+            raise RuntimeError(f"{page} raised: {at.exception}")
+        if page in PAGE_ACTIONS:
+            click_and_wait(at, *PAGE_ACTIONS[page])
+    return setup, run
+
+
+def click_and_wait(at, label, job_state):
+    # Finished jobs are reused by key; forget them so every click does the work again
+    manager = get_job_manager()
+    manager.clear_finished()
+    next(button for button in at.button if button.label == label).click().run()
+    job = manager.get(at.session_state[job_state])
+    while not job.done:
+        time.sleep(JOB_POLL_SECONDS)
+    if job.status != JOB_DONE:
+        raise RuntimeError(f"{label} job {job.status}: {job.error}")
+    # The result renders on the rerun after the job finishes
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"{label} result raised: {at.exception}")
+
+
+def legacy_materialize(df):
+    return [
+        CalculatedProduct(
+            id=row['id'], name=row['name'], purchasePrice=row['purchasePrice'], sellingPrice=row['sellingPrice'],
+            unitsSoldWeek=row['unitsSoldWeek'], weeklyProfit=row['weeklyProfit'], margin=row['margin'],
+            weeklyRevenue=row['weeklyRevenue'], category=row.get('category'), stockLevel=row.get('stockLevel'),
+            supplier=row.get('supplier'))
+        for _, row in df.iterrows()
+    ]
+
+
+def report_content(app, df):
+    metrics = {'totalWeeklyProfit': float(df['weeklyProfit'].sum()), 'totalWeeklyRevenue': float(df['weeklyRevenue'].sum())}
+    return app.generate_full_pdf_report_content(metrics, ProductCollection(df)), metrics
+
+
+def run_pdf_report(content, metrics, products):
+    os.remove(APP.generate_pdf_report(content, metrics, products))
+
+
+def benchmarks():
+    items = [
+        Benchmark('calculate_product_metrics',
+                  lambda app, size: (catalog(size).copy(),),
+                  lambda df: APP.calculate_product_metrics(df)),
+        Benchmark('parse_unstructured_data',
+                  lambda app, size: (catalog(size).to_csv(index=False).encode('utf-8'),),
+                  lambda data: APP.parse_unstructured_data(io.BytesIO(data)),
+                  repeat=2),
+        Benchmark('dataset.upsert_reupload', reupload_setup,
+                  lambda dataset, upload: dataset.upsert(upload, compute_metrics=APP.calculate_product_metrics),
+                  repeat=1),
+        Benchmark('cube_drill_down', cube_setup, lambda cube, filters: cube.slice('supplier', filters)),
+        Benchmark('answer_locally',
+                  lambda app, size: (calculated_catalog(app, size),),
+                  lambda df: [answer_locally(df, q) for q in ("What are my 10 most profitable products?",
+                                                              "lowest margin items", "what's overstocked",
+                                                              "profit by category")]),
+        # A fresh collection per run, so the catalog index is rebuilt each time
+        Benchmark('extract_web_pages', web_setup,
+                  lambda df, urls: pipeline.extract_web_pages(ProductCollection(df), urls)),
+        Benchmark('materialize_products_iterrows',
+                  lambda app, size: (calculated_catalog(app, size),),
+                  legacy_materialize, max_size=100_000, repeat=1),
+        Benchmark('materialize_products_collection',
+                  lambda app, size: (calculated_catalog(app, size),),
+                  lambda df: sum(p.weeklyProfit for p in ProductCollection(df))),
+        Benchmark('get_sales_forecast_and_suggestions',
+                  lambda app, size: (lambda df: (ProductCollection(df), sales_history(df)))(calculated_catalog(app, size)),
+                  lambda products, history: APP.get_sales_forecast_and_suggestions(products, history)),
+        Benchmark('generate_pdf_report',
+                  lambda app, size: (lambda df: (*report_content(app, df), ProductCollection(df)))(calculated_catalog(app, size)),
+                  run_pdf_report, max_size=1_000_000, repeat=1),
+    ]
+    for page in PAGES:
+        setup, run = page_setup(page)
+        items.append(Benchmark(f'page:{page}', setup, run, max_size=1_000_000, repeat=2))
+    return items
+
+
+# --- Measurement ---
+
+def measure(benchmark, size):
+    args = benchmark.setup(APP, size)
+    # Peak memory on a traced run, timing on separate untraced runs
+    tracemalloc.start()
+    benchmark.run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times = []
+    for _ in range(benchmark.repeat):
+        start = time.perf_counter()
+        benchmark.run(*args)
+        times.append(time.perf_counter() - start)
+    return {'seconds': min(times), 'peak_mb': peak / 2**20}
+
+
+def compare(result, baseline, tolerance):
+    """Regressions of ``result`` against ``baseline`` ('' if none), or None when there is no baseline."""
+    if baseline is None:
+        return None
+    problems = []
+    for metric in ('seconds', 'peak_mb'):
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            problems.append(f"{metric} {result[metric] / baseline[metric]:.2f}x baseline")
+    return '; '.join(problems)
+
+
+def main(argv=None):
+    global APP
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="catalog sizes (1k to 5M SKUs)")
+    parser.add_argument('--only', nargs='+', help="benchmark names to run (prefix match)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown/growth before failing")
+    parser.add_argument('--allow-missing-baseline', action='store_true',
+                        help="warn instead of failing when a result has no baseline entry")
+    args = parser.parse_args(argv)
+
+    APP = load_app()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        print(f"WARNING: no baseline at {args.baseline}; record one with --save-baseline", file=sys.stderr)
+
+    results, regressions, unbaselined = {}, [], []
+    print(f"{'benchmark':<40} {'size':>10} {'seconds':>10} {'peak MB':>10}  status")
+    try:
+        for benchmark in benchmarks():
+            if args.only and not any(benchmark.name.startswith(prefix) for prefix in args.only):
+                continue
+            for size in args.sizes:
+                if benchmark.max_size and size > benchmark.max_size:
+                    continue
+                result = measure(benchmark, size)
+                results.setdefault(benchmark.name, {})[str(size)] = result
+                problem = compare(result, baseline.get(benchmark.name, {}).get(str(size)), args.tolerance)
+                if problem is None:
+                    unbaselined.append((benchmark.name, size))
+                elif problem:
+                    regressions.append((benchmark.name, size, problem))
+                status = 'no baseline' if problem is None else problem or 'ok'
+                print(f"{benchmark.name:<40} {size:>10,} {result['seconds']:>10.3f} {result['peak_mb']:>10.1f}  {status}", flush=True)
+    finally:
+        close_default_fetcher()
+        shutil.rmtree(_STORE_ROOT, ignore_errors=True)
+
+    if args.save_baseline:
+        for name, sizes in results.items():
+            baseline.setdefault(name, {}).update(sizes)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    failed = False
+    if unbaselined:
+        # Without a baseline nothing can regress, which must not pass silently
+        severity = 'WARNING' if args.allow_missing_baseline else 'ERROR'
+        print(f"\n{severity}: {len(unbaselined)} result(s) have no baseline in {args.baseline}:")
+        for name, size in unbaselined:
+            print(f"  {name} @ {size:,}")
+        failed = not args.allow_missing_baseline
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of baseline:")
+        for name, size, problem in regressions:
+            print(f"  {name} @ {size:,}: {problem}")
+        failed = True
+    return 1 if failed else 0
+
+
+APP = None
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+# Core analytics library for the MSPCC Analytical Dashboard.
@@ -0,0 +1,305 @@
+import numpy as np
+import pandas as pd
+
+
+GROUP_MEASURES = ['count', 'weeklyProfit', 'weeklyRevenue', 'unitsSoldWeek', 'marginSum', 'marginCount']
+
+
+def _column(batch, name):
+    if name not in batch.columns:
+        return np.zeros(len(batch))
+    return pd.to_numeric(batch[name], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+class RunningAggregates:
+    """Dashboard KPIs maintained incrementally as product batches are added.
+
+    ``add`` (and ``remove``, for rows that are replaced) costs O(batch), so the
+    KPI tiles never scan the full catalog. Per-category and per-supplier totals
+    are kept the same way.
+    """
+    GROUP_KEYS = ('category', 'supplier')
+
+    def __init__(self):
+        self.count = 0
+        self.totalWeeklyProfit = 0.0
+        self.totalWeeklyRevenue = 0.0
+        self.marginSum = 0.0
+        self.marginCount = 0
+        self.groups = {key: {} for key in self.GROUP_KEYS}
+
+    def add(self, batch, sign=1):
+        if batch is None or batch.empty:
+            return
+        profit = _column(batch, 'weeklyProfit')
+        revenue = _column(batch, 'weeklyRevenue')
+        margin = _column(batch, 'margin')
+        units = _column(batch, 'unitsSoldWeek')
+        # Same semantics as Series.mean(): NaN margins are skipped
+        margin_valid = ~np.isnan(margin)
+
+        self.count += sign * len(batch)
+        self.totalWeeklyProfit += sign * np.nansum(profit)
+        self.totalWeeklyRevenue += sign * np.nansum(revenue)
+        self.marginSum += sign * margin[margin_valid].sum()
+        self.marginCount += sign * int(margin_valid.sum())
+
+        measures = pd.DataFrame({
+            'count': 1,
+            'weeklyProfit': np.nan_to_num(profit),
+            'weeklyRevenue': np.nan_to_num(revenue),
+            'unitsSoldWeek': np.nan_to_num(units),
+            'marginSum': np.where(margin_valid, margin, 0.0),
+            'marginCount': margin_valid.astype(int),
+        })
+        for key in self.GROUP_KEYS:
+            labels = batch[key].to_numpy(dtype=object) if key in batch.columns else np.full(len(batch), None, dtype=object)
+            labels = np.where(pd.isna(labels), None, labels)
+            totals = self.groups[key]
+            for label, row in measures.groupby(labels, dropna=False, sort=False).sum().iterrows():
+                label = None if pd.isna(label) else label
+                entry = totals.setdefault(label, dict.fromkeys(GROUP_MEASURES, 0))
+                for measure in GROUP_MEASURES:
+                    entry[measure] += sign * row[measure]
+                if entry['count'] <= 0:
+                    del totals[label]
+
+    def remove(self, batch):
+        self.add(batch, sign=-1)
+
+    @property
+    def averageMargin(self):
+        return self.marginSum / self.marginCount if self.marginCount else 0
+
+    def metrics(self):
+        return {
+            'totalWeeklyProfit': self.totalWeeklyProfit,
+            'totalWeeklyRevenue': self.totalWeeklyRevenue,
+            'averageMargin': self.averageMargin,
+        }
+
+    def group_totals(self, key):
+        rows = []
+        for label, entry in self.groups[key].items():
+            rows.append({
+                key: label,
+                'products': int(entry['count']),
+                'weeklyProfit': entry['weeklyProfit'],
+                'weeklyRevenue': entry['weeklyRevenue'],
+                'unitsSoldWeek': entry['unitsSoldWeek'],
+                'averageMargin': entry['marginSum'] / entry['marginCount'] if entry['marginCount'] else 0,
+            })
+        columns = [key, 'products', 'weeklyProfit', 'weeklyRevenue', 'unitsSoldWeek', 'averageMargin']
+        return pd.DataFrame(rows, columns=columns).sort_values('weeklyProfit', ascending=False, ignore_index=True)
+
+
+# --- Top-K / bottom-K index ---
+
+RANKED_METRICS = ('weeklyProfit', 'weeklyRevenue', 'margin')
+DEFAULT_TOP_K = 10
+# Entries kept per list; lets the dashboard raise K without touching the frame
+DEFAULT_TOP_K_CAPACITY = 50
+
+
+def _select(values, labels, capacity, largest):
+    keep = ~np.isnan(values)
+    values, labels = values[keep], labels[keep]
+    if len(values) > capacity:
+        # Partial selection: O(batch) instead of sorting the whole batch
+        if largest:
+            picked = np.argpartition(values, len(values) - capacity)[-capacity:]
+        else:
+            picked = np.argpartition(values, capacity - 1)[:capacity]
+        values, labels = values[picked], labels[picked]
+    return list(zip(values.tolist(), labels.tolist()))
+
+
+def _merge(current, candidates, capacity, largest):
+    merged = current + candidates
+    merged.sort(key=lambda entry: entry[0], reverse=largest)
+    return merged[:capacity]
+
+
+class TopKIndex:
+    """Best and worst products per metric, overall and per category.
+
+    Entries are ``(value, frame label)`` pairs. Each append merges the batch's
+    own top/bottom candidates into the kept lists, so a dashboard render only
+    looks up a handful of labels instead of sorting the catalog.
+    """
+
+    def __init__(self, capacity=DEFAULT_TOP_K_CAPACITY):
+        self.capacity = capacity
+        self._lists = {}
+
+    def _entries(self, metric, category, largest):
+        return self._lists.get((metric, category, largest), [])
+
+    def add(self, batch):
+        if batch is None or batch.empty:
+            return
+        labels = batch.index.to_numpy()
+        categories = batch['category'].to_numpy(dtype=object) if 'category' in batch.columns else None
+        for metric in RANKED_METRICS:
+            if metric not in batch.columns:
+                continue
+            values = pd.to_numeric(batch[metric], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            groups = [(None, slice(None))]
+            if categories is not None:
+                for category, positions in pd.Series(categories).groupby(categories, sort=False).indices.items():
+                    if not pd.isna(category):
+                        groups.append((category, positions))
+            for category, positions in groups:
+                for largest in (True, False):
+                    key = (metric, category, largest)
+                    candidates = _select(values[positions], labels[positions], self.capacity, largest)
+                    self._lists[key] = _merge(self._lists.get(key, []), candidates, self.capacity, largest)
+
+    def rebuild(self, frame):
+        self._lists = {}
+        self.add(frame)
+
+    def labels(self, metric, k=DEFAULT_TOP_K, category=None, largest=True):
+        """Frame labels of the k best (or worst) products, or None if k exceeds the kept capacity."""
+        if k > self.capacity:
+            return None
+        return [label for _, label in self._entries(metric, category, largest)[:k]]
+
+    def rows(self, frame, metric, k=DEFAULT_TOP_K, category=None, largest=True):
+        labels = self.labels(metric, k, category, largest)
+        if labels is not None:
+            # Labels ranked after ``frame`` was taken are not in it; the rest keep their rank order
+            positions = frame.index.get_indexer(labels)
+            return frame.iloc[positions[positions >= 0]]
+        if category is not None:
+            frame = frame[frame['category'] == category]
+        values = pd.to_numeric(frame[metric], errors='coerce')
+        picked = values.nlargest(k) if largest else values.nsmallest(k)
+        return frame.loc[picked.index]
+
+
+# --- Category x supplier x margin band cube ---
+
+CUBE_DIMENSIONS = ('category', 'supplier', 'marginBand')
+CUBE_MEASURES = ('products', 'weeklyProfit', 'weeklyRevenue', 'unitsSoldWeek', 'stockLevel')
+# Upper edges (margin %) of every band but the last
+MARGIN_BAND_EDGES = [0, 10, 20, 30, 50]
+MARGIN_BANDS = ['< 0%', '0-10%', '10-20%', '20-30%', '30-50%', '50%+']
+
+
+def margin_band_codes(margin):
+    """Index into MARGIN_BANDS per margin; -1 where the margin is missing."""
+    margin = np.asarray(margin, dtype=float)
+    codes = np.searchsorted(MARGIN_BAND_EDGES, margin, side='right').astype(np.int8)
+    codes[np.isnan(margin)] = -1
+    return codes
+
+
+def _band_labels(codes):
+    labels = np.array(MARGIN_BANDS + [None], dtype=object)
+    return labels[codes]
+
+
+class AggregateCube:
+    """Product measures summed per category x supplier x margin band cell.
+
+    Maintained like RunningAggregates (``add``/``remove`` cost O(batch)), so
+    drill-down charts group and filter a few thousand cells instead of the
+    catalog. Missing labels are kept as their own ``None`` cell.
+    """
+
+    def __init__(self):
+        self._cells = {}
+        self._frame = None
+
+    def add(self, batch, sign=1):
+        if batch is None or batch.empty:
+            return
+        labels = {}
+        for dimension in CUBE_DIMENSIONS[:2]:
+            values = batch[dimension].to_numpy(dtype=object) if dimension in batch.columns else np.full(len(batch), None, dtype=object)
+            labels[dimension] = np.where(pd.isna(values), None, values)
+        labels['marginBand'] = _band_labels(margin_band_codes(_column(batch, 'margin')))
+        measures = pd.DataFrame({
+            'products': 1,
+            'weeklyProfit': np.nan_to_num(_column(batch, 'weeklyProfit')),
+            'weeklyRevenue': np.nan_to_num(_column(batch, 'weeklyRevenue')),
+            'unitsSoldWeek': np.nan_to_num(_column(batch, 'unitsSoldWeek')),
+            'stockLevel': np.nan_to_num(_column(batch, 'stockLevel')),
+        })
+        totals = measures.groupby([labels[d] for d in CUBE_DIMENSIONS], dropna=False, sort=False).sum()
+        for key, row in zip(totals.index, totals.to_numpy(dtype=float)):
+            key = tuple(None if pd.isna(label) else label for label in key)
+            cell = self._cells.setdefault(key, np.zeros(len(CUBE_MEASURES)))
+            cell += sign * row
+            if cell[0] <= 0:
+                del self._cells[key]
+        self._frame = None
+
+    def remove(self, batch):
+        self.add(batch, sign=-1)
+
+    def frame(self):
+        """One row per non-empty cell, cached until the next change."""
+        if self._frame is None:
+            keys = list(self._cells)
+            cells = pd.DataFrame(keys or None, columns=list(CUBE_DIMENSIONS), dtype=object)
+            values = np.array([self._cells[key] for key in keys]).reshape(len(keys), len(CUBE_MEASURES))
+            for i, measure in enumerate(CUBE_MEASURES):
+                cells[measure] = values[:, i]
+            cells['products'] = cells['products'].astype(np.int64)
+            self._frame = cells
+        return self._frame
+
+    def labels(self, dimension):
+        """Distinct non-missing labels of ``dimension``, in display order."""
+        if dimension == 'marginBand':
+            present = set(self.frame()['marginBand'])
+            return [band for band in MARGIN_BANDS if band in present]
+        return sorted(label for label in self.frame()[dimension].unique() if label is not None)
+
+    def slice(self, by, filters=None):
+        """Measures grouped by the dimensions in ``by`` over the cells that pass ``filters``.
+
+        ``filters`` maps a dimension to the labels to keep; empty selections
+        keep everything. Adds the revenue-weighted ``margin`` (%) of each group.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        cells = self.frame()
+        for dimension, keep in (filters or {}).items():
+            if keep:
+                cells = cells[cells[dimension].isin(list(keep))]
+        totals = cells.groupby(by, dropna=False, sort=False)[list(CUBE_MEASURES)].sum().reset_index()
+        revenue = totals['weeklyRevenue'].where(totals['weeklyRevenue'] != 0)
+        totals['margin'] = (totals['weeklyProfit'] / revenue * 100).fillna(0)
+        return totals.sort_values('weeklyProfit', ascending=False, ignore_index=True)
+
+
+def filter_mask(frame, filters, band_codes=None):
+    """Boolean mask of the products in ``frame`` that pass cube ``filters``.
+
+    Pass ``band_codes`` (margin_band_codes of the frame's margins) to reuse
+    them across calls.
+    """
+    mask = np.ones(len(frame), dtype=bool)
+    for dimension, keep in (filters or {}).items():
+        if not keep:
+            continue
+        if dimension == 'marginBand':
+            if band_codes is None:
+                band_codes = margin_band_codes(_column(frame, 'margin'))
+            mask &= np.isin(band_codes, [MARGIN_BANDS.index(band) for band in keep])
+        else:
+            mask &= frame[dimension].isin(list(keep)).to_numpy()
+    return mask
+
+
+def downsample(frame, mask=None, max_points=20_000, seed=0):
+    """At most ``max_points`` rows of ``frame`` (where ``mask`` holds), picked uniformly and kept in frame order.
+
+    The sample is seeded, so reruns plot the same points.
+    """
+    positions = np.flatnonzero(mask) if mask is not None else np.arange(len(frame))
+    if len(positions) > max_points:
+        positions = np.sort(np.random.default_rng(seed).choice(positions, max_points, replace=False))
+    return frame.iloc[positions]
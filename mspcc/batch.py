@@ -0,0 +1,166 @@
+"""Headless batch mode: run the analytics pipeline for many stores in parallel.
+
+    python -m mspcc.batch stores/ out/                    # one worker process per CPU
+    python -m mspcc.batch stores/ out/ --workers 4 --no-report
+
+Every CSV/TXT file in the input directory is one store's upload. A
+subdirectory is one store whose files are successive weekly uploads, dated
+by a YYYY-MM-DD in the file name or, failing that, taken as consecutive
+weeks up to the current one in file name order.
+
+For each store, ``out/<store>/`` gets ``metrics.parquet`` (the products with
+their calculated metrics), ``forecast.parquet`` (forecasts and reorder
+suggestions) and ``report.pdf``. ``out/summary.parquet`` has one row per
+store. The exit status is non-zero if any store failed.
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from mspcc.dataset import ProductDataset
+from mspcc.forecast import current_week
+from mspcc.pipeline import (calculate_product_metrics, generate_full_pdf_report_content, generate_pdf_report,
+                            get_sales_forecast_and_suggestions, parse_unstructured_data)
+
+
+STORE_FILE_SUFFIXES = ('.csv', '.txt')
+FILE_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+# Products listed as top/under-performers in each report (as on the Report Generator page)
+REPORT_TOP_K = 5
+SUMMARY_FILE = 'summary.parquet'
+
+log = logging.getLogger(__name__)
+
+
+def _is_store_file(path):
+    return os.path.isfile(path) and path.lower().endswith(STORE_FILE_SUFFIXES)
+
+
+def discover_stores(input_dir):
+    """``(store name, upload files in week order)`` for each store in ``input_dir``, sorted by name."""
+    stores = []
+    for entry in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, entry)
+        if _is_store_file(path):
+            stores.append((os.path.splitext(entry)[0], [path]))
+        elif os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+            files = [file for file in files if _is_store_file(file)]
+            if files:
+                stores.append((entry, files))
+    return stores
+
+
+def upload_weeks(paths):
+    """The week each upload belongs to: the date in its file name when every file has one, else consecutive weeks."""
+    dates = [FILE_DATE.search(os.path.basename(path)) for path in paths]
+    if all(dates):
+        return [pd.Period(date.group(0), freq='W') for date in dates]
+    return list(pd.period_range(end=current_week(), periods=len(paths), freq='W'))
+
+
+def run_store(name, paths, output_dir, report=True, report_workers=1):
+    """Ingest, forecast and report one store; returns its summary row."""
+    started = time.perf_counter()
+    dataset = ProductDataset()
+    rejected_rows = 0
+    for path, week in zip(paths, upload_weeks(paths)):
+        with open(path, 'rb') as f:
+            parse_result = parse_unstructured_data(f)
+        rejected_rows += len(parse_result.rejected_df)
+        if parse_result:
+            dataset.upsert(parse_result.products_df, compute_metrics=calculate_product_metrics, week=week)
+    if dataset.empty:
+        raise ValueError("no valid product rows in the store's files")
+
+    store_dir = os.path.join(output_dir, name)
+    os.makedirs(store_dir, exist_ok=True)
+    products = dataset.products()
+    dataset.frame.to_parquet(os.path.join(store_dir, 'metrics.parquet'), index=False)
+    forecast_df = get_sales_forecast_and_suggestions(products, dataset.sales_history, dataset.forecasts)
+    forecast_df.to_parquet(os.path.join(store_dir, 'forecast.parquet'), index=False)
+
+    metrics = dataset.aggregates.metrics()
+    if report:
+        report_metrics = dict(metrics)
+        report_metrics['topPerformers'] = dataset.rankings.rows(dataset.frame, 'weeklyProfit', REPORT_TOP_K)['name'].tolist()
+        report_metrics['underPerformers'] = dataset.rankings.rows(dataset.frame, 'weeklyProfit', REPORT_TOP_K, largest=False)['name'].tolist()
+        report_content = generate_full_pdf_report_content(report_metrics, products)
+        generate_pdf_report(report_content, report_metrics, products, dataset.aggregates.group_totals('category'),
+                            path=os.path.join(store_dir, 'report.pdf'), max_workers=report_workers)
+
+    return {
+        'store': name,
+        'files': len(paths),
+        'products': len(dataset.frame),
+        'rejectedRows': rejected_rows,
+        'totalWeeklyProfit': metrics['totalWeeklyProfit'],
+        'totalWeeklyRevenue': metrics['totalWeeklyRevenue'],
+        'averageMargin': metrics['averageMargin'],
+        'reorders': int(forecast_df['reorderSuggestion'].str.startswith('Reorder').sum()),
+        'seconds': time.perf_counter() - started,
+        'error': None,
+    }
+
+
+def _run_store_safely(name, paths, output_dir, report, report_workers):
+    # One bad store must not take the batch down; its error goes into the summary instead
+    started = time.perf_counter()
+    try:
+        return run_store(name, paths, output_dir, report, report_workers)
+    except Exception as e:
+        return {'store': name, 'files': len(paths), 'seconds': time.perf_counter() - started,
+                'error': f"{type(e).__name__}: {e}"}
+
+
+def run_batch(input_dir, output_dir, workers=None, report=True):
+    """Process every store in ``input_dir`` across a pool of ``workers`` processes; returns the summary frame."""
+    stores = discover_stores(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count(), len(stores) or 1))
+    # Reports render in parallel parts too; share the CPUs instead of oversubscribing them
+    report_workers = max(1, (os.cpu_count() or 1) // workers)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_store_safely, name, paths, output_dir, report, report_workers) for name, paths in stores]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            status = f"failed: {row['error']}" if row['error'] else f"{row['products']:,} products"
+            log.info("%-30s %8.2fs  %s", row['store'], row['seconds'], status)
+    columns = ['store', 'files', 'products', 'rejectedRows', 'totalWeeklyProfit', 'totalWeeklyRevenue', 'averageMargin',
+               'reorders', 'seconds', 'error']
+    summary = pd.DataFrame(rows, columns=columns).sort_values('store', ignore_index=True)
+    summary.to_parquet(os.path.join(output_dir, SUMMARY_FILE), index=False)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the MSPCC analytics pipeline for a directory of store files.")
+    parser.add_argument('input_dir', help="directory of store CSV/TXT files (or one subdirectory of weekly files per store)")
+    parser.add_argument('output_dir', help="where per-store results and summary.parquet are written")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--no-report', action='store_true', help="skip the PDF reports")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # Per-step pipeline messages are for the UI; keep the batch log to one line per store
+    logging.getLogger('mspcc.pipeline').setLevel(logging.WARNING)
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"{args.input_dir} is not a directory")
+
+    summary = run_batch(args.input_dir, args.output_dir, args.workers, report=not args.no_report)
+    failed = summary['error'].notna().sum()
+    log.info("%d store(s) processed, %d failed; summary written to %s", len(summary) - failed, failed,
+             os.path.join(args.output_dir, SUMMARY_FILE))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,353 @@
+import copy
+import threading
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from mspcc.aggregates import AggregateCube, RunningAggregates, TopKIndex
+from mspcc.forecast import ForecastCache, SalesHistory, current_week
+from mspcc.instrumentation import timed
+from mspcc.products import CALCULATED_FIELDS, PRODUCT_FIELDS, ProductCollection, concat_products, enforce_schema
+from mspcc.table import ProductTable, product_key
+
+
+WEEK_COLUMN = 'week'
+# Manifest re-reads when a segment disappears underneath refresh()
+REFRESH_ATTEMPTS = 3
+
+
+class ProductDataset:
+    """The loaded product catalog plus everything derived from it.
+
+    ``version`` is bumped on every change so caches keyed on it can tell when
+    the catalog moved on. Products are upserted by name, so re-uploading a
+    file updates rows instead of duplicating them. With a DatasetStore
+    attached, changes are persisted and one instance can be shared by every
+    session of the server; each process holds its own in-memory copy of the
+    stored segments, and upserts from any process see each other's products.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._lock = threading.RLock()
+        self._reset()
+        if store is not None:
+            self.refresh()
+
+    def _reset(self):
+        self.table = ProductTable()
+        self.version = 0
+        self.next_product_id = 1
+        self.aggregates = RunningAggregates()
+        self.cube = AggregateCube()
+        self.rankings = TopKIndex()
+        self.sales_history = SalesHistory()
+        self.forecasts = ForecastCache()
+        self._segments = []
+        self._cache = {}
+
+    @property
+    def frame(self):
+        return self.table.frame()
+
+    @property
+    def empty(self):
+        return self.frame.empty
+
+    def products(self):
+        """ProductCollection over the current frame, shared by everything rendered for this version."""
+        return self.cached('products', lambda: ProductCollection(self.frame, version=self.version))
+
+    def snapshot(self):
+        """DatasetSnapshot of the current version, shared by every caller until the next change."""
+        return self.cached('snapshot', lambda: DatasetSnapshot(
+            self.version, self.frame, self.products(), copy.deepcopy(self.aggregates), copy.deepcopy(self.rankings),
+            copy.deepcopy(self.cube)))
+
+    def get_cached(self, key, default=None):
+        """Value stored under ``key`` for the current version, else ``default``."""
+        version, value = self._cache.get(key, (None, default))
+        return value if version == self.version else default
+
+    def set_cached(self, key, value):
+        self._cache[key] = (self.version, value)
+
+    def cached(self, key, build):
+        """Return ``build()`` computed at most once per dataset version."""
+        # Hits skip the lock, so reruns are not held up by a running upsert
+        version, value = self._cache.get(key, (None, None))
+        if version == self.version:
+            return value
+        with self._lock:
+            version, value = self._cache.get(key, (None, None))
+            if version != self.version:
+                value = build()
+                self._cache[key] = (self.version, value)
+            return value
+
+    def _add_totals(self, rows):
+        self.aggregates.add(rows)
+        self.cube.add(rows)
+
+    def _remove_totals(self, rows):
+        self.aggregates.remove(rows)
+        self.cube.remove(rows)
+
+    def _apply(self, batch, weeks):
+        """Apply stored rows (ids assigned, metrics calculated): new ids are appended, known ids replaced."""
+        for week, positions in pd.Series(weeks).groupby(weeks, sort=True).indices.items():
+            rows = batch.iloc[positions]
+            self.sales_history.record(rows['id'].to_numpy(), rows['unitsSoldWeek'].to_numpy(), week)
+
+        # History keeps every week; the catalog keeps the last row written per id
+        latest = batch.drop_duplicates('id', keep='last').reset_index(drop=True)
+        positions = self.table.positions_of_ids(latest['id'].tolist())
+        known = positions >= 0
+        if known.any():
+            self._remove_totals(self.table.rows(positions[known]))
+            self.table.update(positions[known], latest[known])
+            self._add_totals(latest[known])
+        # Ids are handed out in insertion order, so this reproduces the original row order on reload
+        new_rows = latest[~known].sort_values('id', kind='stable')
+        if len(new_rows):
+            self.table.append(new_rows)
+            self._add_totals(new_rows)
+        if known.any():
+            # Ranked entries may have changed value; TopKIndex cannot retract them
+            self.rankings.rebuild(self.frame)
+        elif len(new_rows):
+            self.rankings.add(self.frame.iloc[len(self.frame) - len(new_rows):])
+
+    def refresh(self):
+        """Load segments other sessions or processes have written since the last look.
+
+        Never waits: if another thread is changing the dataset, returns False
+        and leaves catching up to the next call.
+        """
+        if self.store is None:
+            return False
+        # Every rerun calls this; the common nothing-new case only reads the manifest
+        if self.store.manifest()['version'] == self.version:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            for attempt in range(REFRESH_ATTEMPTS):
+                manifest = self.store.manifest()
+                if manifest['version'] == self.version:
+                    return False
+                applied = _follow_compaction(self._segments, manifest.get('compacted'))
+                reset = not set(applied) <= set(manifest['segments'])
+                if reset:
+                    # Compacted past segments we never saw; start over from its files
+                    applied = []
+                new_segments = [name for name in manifest['segments'] if name not in applied]
+                try:
+                    # Converted per segment: older segments may predate the compact schema
+                    frames = [self.store.read_segment(name).to_pandas(split_blocks=True) for name in new_segments]
+                    break
+                except FileNotFoundError:
+                    # Removed by a compaction since the manifest was read; its newer manifest lists the files
+                    if attempt == REFRESH_ATTEMPTS - 1:
+                        raise
+            if reset:
+                self._reset()
+            if frames:
+                batch = concat_products(frames)
+                weeks = batch.pop(WEEK_COLUMN).to_numpy()
+                self._apply(batch, weeks)
+            self._segments = list(manifest['segments'])
+            self.next_product_id = manifest['next_product_id']
+            self.version = manifest['version']
+            return True
+        finally:
+            self._lock.release()
+
+    def _store_locked(self):
+        return self.store.locked() if self.store is not None else nullcontext()
+
+    def _match(self, incoming, keys, week):
+        """Compare an upload with the stored products; call with the lock held."""
+        positions = self.table.positions_of_keys(keys.tolist())
+        known = positions >= 0
+        current = self.table.rows(positions[known]).reset_index(drop=True)
+        merged = _with_stored_fields(incoming, current, np.flatnonzero(known))
+        # New products get their ids when the rows are written
+        ids = np.zeros(len(merged), dtype=np.int64)
+        ids[known] = current['id'].to_numpy()
+        merged['id'] = ids
+
+        same = np.zeros(len(merged), dtype=bool)
+        same[known] = _same_products(merged[known].reset_index(drop=True), current)
+        same_week = np.zeros(len(merged), dtype=bool)
+        same_week[known] = self.sales_history.units(ids[known], week) == merged['unitsSoldWeek'].to_numpy(dtype=float)[known]
+        return _UpsertMatch(self.version, known, current, merged, same, same & ~same_week)
+
+    @timed('dataset.upsert')
+    def upsert(self, products_df, compute_metrics=None, week=None):
+        """Insert new products and update existing ones, matched by name (see product_key).
+
+        Columns missing from ``products_df`` keep their stored values, and rows
+        identical to the stored product are skipped. ``compute_metrics`` (e.g.
+        calculate_product_metrics) is only called on new and changed rows;
+        without it, ``products_df`` must carry the metric columns already. Units
+        are recorded as sales history for ``week`` (default: the current week).
+
+        Metrics are calculated without holding the dataset lock, so sessions
+        keep rendering the previous version meanwhile.
+        """
+        week = pd.Period(week, freq='W') if week is not None else current_week()
+        incoming = enforce_schema(products_df.drop(columns='id', errors='ignore').reset_index(drop=True))
+        keys = product_key(incoming['name'])
+        # Within one upload the last row per product wins
+        last = ~keys.duplicated(keep='last').to_numpy()
+        incoming, keys = incoming[last].reset_index(drop=True), keys[last].reset_index(drop=True)
+
+        self.refresh()
+        with self._lock:
+            match = self._match(incoming, keys, week)
+        rows = match.changed_rows(compute_metrics)
+
+        # The store lock spans reading the manifest to writing it: product ids come from the
+        # manifest, and names other processes inserted meanwhile must match their ids
+        with self._lock, self._store_locked():
+            self.refresh()
+            if self.version != match.version:
+                # Another writer got in first; match and calculate again against its products
+                match = self._match(incoming, keys, week)
+                rows = match.changed_rows(compute_metrics)
+            new = ~match.known[~match.same]
+            ids = rows['id'].to_numpy(copy=True)
+            ids[new] = np.arange(self.next_product_id, self.next_product_id + int(new.sum()))
+            rows['id'] = ids
+            result = UpsertResult(rows, inserted=int(new.sum()), updated=int((~match.same[match.known]).sum()),
+                                  unchanged=int(match.same.sum()))
+            # Unchanged products still get this week's units recorded
+            written = concat_products([rows, match.current[match.history_only[match.known]]])
+            if written.empty:
+                return result
+
+            self.next_product_id += result.inserted
+            weeks = pd.Series(week.start_time.strftime('%Y-%m-%d'), index=written.index)
+            if self.store is not None:
+                table = pa.Table.from_pandas(written.assign(**{WEEK_COLUMN: weeks}), preserve_index=False)
+                manifest = self.store.append(table, self.next_product_id)
+                # refresh() above applied every other segment and the lock kept new ones out, so only ours is missing
+                self._segments = list(manifest['segments'])
+                self.next_product_id = manifest['next_product_id']
+                version = manifest['version']
+            else:
+                version = self.version + 1
+            self._apply(written, weeks.to_numpy())
+            # Raised last: caches read the version without the lock and must not pair it with a half-applied table
+            self.version = version
+        if self.store is not None:
+            # Merging segments reads the whole store; readers carry on from the manifest meanwhile
+            self.store.compact_if_needed()
+        return result
+
+
+class _UpsertMatch:
+    """An upload matched against the products of dataset ``version`` (see ProductDataset._match)."""
+
+    def __init__(self, version, known, current, merged, same, history_only):
+        self.version = version
+        self.known = known
+        self.current = current
+        self.merged = merged
+        self.same = same
+        self.history_only = history_only
+
+    def changed_rows(self, compute_metrics):
+        """New and changed rows with their metrics; new products still have id 0."""
+        rows = self.merged[~self.same].reset_index(drop=True)
+        if compute_metrics is not None and len(rows):
+            rows = compute_metrics(rows[PRODUCT_FIELDS])
+        return enforce_schema(rows.reindex(columns=CALCULATED_FIELDS))
+
+
+def _follow_compaction(segments, compacted):
+    """``segments`` with the ones a compaction merged replaced by its output, if all of them were applied."""
+    if not compacted or not set(compacted['from']) <= set(segments):
+        return list(segments)
+    merged = set(compacted['from'])
+    return [compacted['into']] + [name for name in segments if name not in merged]
+
+
+class DatasetSnapshot:
+    """The frame and derived views of one dataset version.
+
+    The dataset changes in place when an upload lands; a snapshot does not,
+    so a page that reads the frame, rankings, totals and cube from it gets
+    views that agree with each other. ``cached`` values live as long as the
+    snapshot, i.e. for one version.
+    """
+
+    def __init__(self, version, frame, products, aggregates, rankings, cube):
+        self.version = version
+        self.frame = frame
+        self.products = products
+        self.aggregates = aggregates
+        self.rankings = rankings
+        self.cube = cube
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    @property
+    def empty(self):
+        return self.frame.empty
+
+    def get_cached(self, key, default=None):
+        return self._cache.get(key, default)
+
+    def set_cached(self, key, value):
+        self._cache[key] = value
+
+    def cached(self, key, build):
+        """Return ``build()`` computed at most once for this snapshot."""
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = build()
+            return self._cache[key]
+
+
+class UpsertResult:
+    """Outcome of ProductDataset.upsert; ``rows`` are the new and changed products with their ids."""
+
+    def __init__(self, rows, inserted, updated, unchanged):
+        self.rows = rows
+        self.inserted = inserted
+        self.updated = updated
+        self.unchanged = unchanged
+
+    def __repr__(self):
+        return f"UpsertResult({self.inserted} inserted, {self.updated} updated, {self.unchanged} unchanged)"
+
+
+def _with_stored_fields(incoming, current, known_positions):
+    """Incoming rows with product fields the upload lacks filled in from the stored products."""
+    merged = incoming.copy()
+    for field in PRODUCT_FIELDS[1:]:
+        if field in incoming.columns:
+            continue
+        values = np.full(len(incoming), None, dtype=object)
+        values[known_positions] = current[field].astype(object).to_numpy()
+        merged[field] = values
+    return enforce_schema(merged)
+
+
+def _same_products(a, b):
+    """Row-wise equality of the product fields of two aligned frames (missing equals missing)."""
+    same = np.ones(len(a), dtype=bool)
+    for field in PRODUCT_FIELDS[1:]:
+        left_na, right_na = a[field].isna().to_numpy(), b[field].isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(a[field]) and pd.api.types.is_numeric_dtype(b[field]):
+            left = a[field].to_numpy(dtype=float, na_value=np.nan)
+            right = b[field].to_numpy(dtype=float, na_value=np.nan)
+        else:
+            left, right = a[field].to_numpy(dtype=object, copy=True), b[field].to_numpy(dtype=object, copy=True)
+            left[left_na], right[right_na] = '', ''
+        same &= np.where(left_na | right_na, left_na & right_na, left == right)
+    return same
@@ -0,0 +1,218 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from mspcc.instrumentation import timed
+
+
+SMOOTHING_ALPHA = 0.3
+# Average demand interval above which a SKU is treated as intermittent (Syntetos-Boylan cut-off)
+INTERMITTENT_ADI = 1.32
+# z-score for the cycle service level used in safety stock (~95%)
+SERVICE_LEVEL_Z = 1.65
+LEAD_TIME_WEEKS = 1
+# Catalogs larger than this are fitted in chunks across a process pool
+PARALLEL_MIN_SKUS = 200_000
+PARALLEL_CHUNK_SKUS = 50_000
+
+MODEL_NAMES = np.array(['Exponential Smoothing', 'Croston (SBA)'], dtype=object)
+
+
+def current_week():
+    return pd.Timestamp.now().to_period('W')
+
+
+class SalesHistory:
+    """Weekly units sold per SKU, stored as a dense SKUs x weeks matrix (NaN = not observed)."""
+
+    def __init__(self):
+        self.weeks = []
+        self.rows = {}
+        self.matrix = np.empty((0, 0))
+        # Bumped per SKU on every record, so rewritten weeks are noticed as well as new ones
+        self.revisions = np.zeros(0, dtype=np.int64)
+
+    def _grow(self, n_rows, n_weeks):
+        rows, weeks = self.matrix.shape
+        if n_rows <= rows and n_weeks <= weeks:
+            return
+        # Rows grow geometrically (SKUs arrive in bulk), weeks one at a time
+        new_rows = max(n_rows, rows * 2) if n_rows > rows else rows
+        grown = np.full((new_rows, max(n_weeks, weeks)), np.nan)
+        grown[:rows, :weeks] = self.matrix
+        self.matrix = grown
+        revisions = np.zeros(new_rows, dtype=np.int64)
+        revisions[:len(self.revisions)] = self.revisions
+        self.revisions = revisions
+
+    def record(self, ids, units, week=None):
+        week = pd.Period(week, freq='W') if week is not None else current_week()
+        if week not in self.weeks:
+            self.weeks.append(week)
+            order = np.argsort(self.weeks, kind='stable')
+            self.weeks = [self.weeks[i] for i in order]
+            self._grow(len(self.rows), len(self.weeks))
+            self.matrix[:, :len(self.weeks)] = self.matrix[:, order]
+        column = self.weeks.index(week)
+
+        positions = np.empty(len(ids), dtype=np.int64)
+        for i, sku in enumerate(ids):
+            positions[i] = self.rows.setdefault(sku, len(self.rows))
+        self._grow(len(self.rows), len(self.weeks))
+        self.matrix[positions, column] = np.asarray(units, dtype=float)
+        self.revisions[positions] += 1
+
+    def units(self, ids, week):
+        """Units recorded for ``ids`` in ``week``; NaN where nothing was recorded."""
+        week = pd.Period(week, freq='W')
+        units = np.full(len(ids), np.nan)
+        if week not in self.weeks:
+            return units
+        positions = self.positions(ids)
+        known = positions >= 0
+        units[known] = self.matrix[positions[known], self.weeks.index(week)]
+        return units
+
+    def positions(self, ids):
+        return np.array([self.rows.get(sku, -1) for sku in ids], dtype=np.int64)
+
+    def observed(self):
+        """(SKUs x weeks) view of the recorded part of the matrix."""
+        return self.matrix[:len(self.rows), :len(self.weeks)]
+
+
+def fit_demand_models(history, alpha=SMOOTHING_ALPHA):
+    """Fit SES and Croston/SBA to every row of a SKUs x weeks matrix at once.
+
+    The recursion runs over weeks; each step is vectorized across all SKUs.
+    Returns ``(forecast, sigma, model)`` where ``model`` indexes MODEL_NAMES.
+    """
+    n_skus, n_weeks = history.shape
+    level = np.full(n_skus, np.nan)
+    squared_error = np.zeros(n_skus)
+    error_count = np.zeros(n_skus)
+
+    size = np.full(n_skus, np.nan)
+    interval = np.full(n_skus, np.nan)
+    since_demand = np.ones(n_skus)
+
+    observed = np.zeros(n_skus)
+    nonzero = np.zeros(n_skus)
+
+    for week in range(n_weeks):
+        y = history[:, week]
+        seen = ~np.isnan(y)
+        observed += seen
+
+        # Simple exponential smoothing with one-step-ahead errors for the variance
+        has_level = seen & ~np.isnan(level)
+        error = np.where(has_level, y - level, 0.0)
+        squared_error += error * error
+        error_count += has_level
+        level = np.where(has_level, level + alpha * error, np.where(seen, y, level))
+
+        # Croston: smooth demand size and inter-demand interval separately
+        demand = seen & (y > 0)
+        nonzero += demand
+        first = demand & np.isnan(size)
+        update = demand & ~first
+        size = np.where(first, y, np.where(update, size + alpha * (y - size), size))
+        interval = np.where(first, since_demand, np.where(update, interval + alpha * (since_demand - interval), interval))
+        since_demand = np.where(demand, 1.0, since_demand + seen)
+
+    ses_forecast = np.nan_to_num(level)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        croston_forecast = (1 - alpha / 2) * size / interval
+        adi = observed / nonzero
+    intermittent = (adi > INTERMITTENT_ADI) & ~np.isnan(croston_forecast)
+    forecast = np.where(intermittent, croston_forecast, ses_forecast)
+
+    # Without at least two one-step errors fall back to a Poisson-like spread
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma = np.where(error_count >= 2, np.sqrt(squared_error / error_count), np.sqrt(np.maximum(forecast, 0)))
+    return forecast, sigma, intermittent.astype(np.int64)
+
+
+def _fit_chunk(args):
+    history, alpha = args
+    return fit_demand_models(history, alpha)
+
+
+def fit_demand_models_parallel(history, alpha=SMOOTHING_ALPHA, max_workers=None, progress=None):
+    """fit_demand_models, in chunks across a process pool for large catalogs.
+
+    ``progress(fraction)`` is called as chunks complete; if it raises (e.g. a
+    cancelled job), chunks not yet started are dropped and the error propagates.
+    """
+    if len(history) < PARALLEL_MIN_SKUS:
+        result = fit_demand_models(history, alpha)
+        if progress is not None:
+            progress(1.0)
+        return result
+    chunks = [(history[start:start + PARALLEL_CHUNK_SKUS], alpha) for start in range(0, len(history), PARALLEL_CHUNK_SKUS)]
+    # Fits run in job threads; forking a threaded process can deadlock the children
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context) as pool:
+        try:
+            for result in pool.map(_fit_chunk, chunks):
+                results.append(result)
+                if progress is not None:
+                    progress(len(results) / len(chunks))
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+class ForecastCache:
+    """Per-SKU forecasts that are only refitted for SKUs whose history changed since the last fit."""
+
+    def __init__(self, alpha=SMOOTHING_ALPHA):
+        self.alpha = alpha
+        self.forecast = np.empty(0)
+        self.sigma = np.empty(0)
+        self.model = np.empty(0, dtype=np.int64)
+        self.fitted_revisions = np.empty(0, dtype=np.int64)
+        # Forecast jobs for different dataset versions may update concurrently
+        self._lock = threading.Lock()
+
+    def _grow(self, n):
+        extra = n - len(self.forecast)
+        if extra <= 0:
+            return
+        self.forecast = np.concatenate([self.forecast, np.zeros(extra)])
+        self.sigma = np.concatenate([self.sigma, np.zeros(extra)])
+        self.model = np.concatenate([self.model, np.zeros(extra, dtype=np.int64)])
+        self.fitted_revisions = np.concatenate([self.fitted_revisions, np.full(extra, -1, dtype=np.int64)])
+
+    @timed('forecast.update')
+    def update(self, history, progress=None):
+        """Refit the SKUs whose history changed; returns how many. ``progress`` as in fit_demand_models_parallel."""
+        with self._lock:
+            return self._update(history, progress)
+
+    def _update(self, history, progress=None):
+        observed = history.observed()
+        self._grow(len(observed))
+        revisions = history.revisions[:len(observed)]
+        stale = np.flatnonzero(revisions != self.fitted_revisions[:len(observed)])
+        if len(stale):
+            forecast, sigma, model = fit_demand_models_parallel(observed[stale], self.alpha, progress=progress)
+            self.forecast[stale] = forecast
+            self.sigma[stale] = sigma
+            self.model[stale] = model
+            self.fitted_revisions[stale] = revisions[stale]
+        return len(stale)
+
+
+def reorder_plan(forecast, sigma, stock, lead_time_weeks=LEAD_TIME_WEEKS, service_level_z=SERVICE_LEVEL_Z):
+    """Safety stock and reorder quantity from the forecast and its one-step error spread."""
+    safety_stock = service_level_z * sigma * np.sqrt(lead_time_weeks)
+    reorder_quantity = np.maximum(0, forecast * lead_time_weeks + safety_stock - stock)
+    return safety_stock, reorder_quantity
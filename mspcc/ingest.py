@@ -0,0 +1,153 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from mspcc.instrumentation import timed
+from mspcc.products import concat_products, empty_products, enforce_schema
+
+
+REQUIRED_COLUMNS = ['name', 'sellingPrice', 'purchasePrice', 'unitsSoldWeek']
+OPTIONAL_COLUMNS = ['category', 'stockLevel', 'supplier']
+PRICE_COLUMNS = ['purchasePrice', 'sellingPrice']
+TEXT_COLUMNS = ['name', 'category', 'supplier']
+
+# Rows per parsed chunk; bounds peak memory independently of the upload size
+DEFAULT_CHUNK_ROWS = 50_000
+
+REJECTED_COLUMNS = ['row', 'reason', 'name']
+
+
+class MissingColumnsError(ValueError):
+    def __init__(self, missing):
+        super().__init__(f"Uploaded data does not contain expected columns: {', '.join(missing)}.")
+        self.missing = missing
+
+
+class IngestResult:
+    def __init__(self, products_df, rejected_df):
+        self.products_df = products_df
+        self.rejected_df = rejected_df
+
+    def __bool__(self):
+        return not self.products_df.empty
+
+    def __repr__(self):
+        return f"IngestResult({len(self.products_df)} products, {len(self.rejected_df)} rejected)"
+
+
+def _open_source(source):
+    if isinstance(source, str):
+        return io.StringIO(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+def _coerce_chunk(chunk, first_row):
+    # Row numbers are 1-based data rows (the header line is not counted)
+    row_numbers = np.arange(first_row, first_row + len(chunk))
+    name = chunk['name'].astype('string').str.strip()
+
+    numeric = {col: pd.to_numeric(chunk[col], errors='coerce') for col in REQUIRED_COLUMNS[1:]}
+    conditions = [(name.isna() | (name == '')).to_numpy(dtype=bool, na_value=True)]
+    reasons = ["missing name"]
+    for col in PRICE_COLUMNS + ['unitsSoldWeek']:
+        conditions.append(~np.isfinite(numeric[col].to_numpy(dtype=float, na_value=np.nan)))
+        reasons.append(f"invalid {col}")
+
+    rejected_mask = np.logical_or.reduce(conditions)
+    reason = np.select(conditions, reasons, default='')
+
+    valid = ~rejected_mask
+    products = pd.DataFrame({'name': name[valid].to_numpy()})
+    for col in PRICE_COLUMNS:
+        products[col] = numeric[col][valid].to_numpy(dtype=float)
+    products['unitsSoldWeek'] = numeric['unitsSoldWeek'][valid].to_numpy(dtype=float).astype(np.int64)
+    for col in OPTIONAL_COLUMNS:
+        if col not in chunk.columns:
+            continue
+        if col == 'stockLevel':
+            stock = pd.to_numeric(chunk[col][valid], errors='coerce')
+            products[col] = np.trunc(stock).astype('Int64').array
+        else:
+            products[col] = chunk[col][valid].astype('string').str.strip().to_numpy()
+
+    rejected = pd.DataFrame({
+        'row': row_numbers[rejected_mask],
+        'reason': reason[rejected_mask],
+        'name': name[rejected_mask].to_numpy(),
+    }, columns=REJECTED_COLUMNS)
+    return enforce_schema(products), rejected
+
+
+def _remaining_bytes(stream):
+    # None for streams that cannot tell their size (pipes, sockets)
+    try:
+        position = stream.tell()
+        size = stream.seek(0, io.SEEK_END)
+        stream.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return position, size
+
+
+def iter_product_chunks(source, chunksize=DEFAULT_CHUNK_ROWS, progress=None):
+    """Parse a CSV/TXT upload chunk by chunk.
+
+    Yields ``(products, rejected)`` DataFrame pairs, products in the compact
+    PRODUCT_SCHEMA layout; the file
+    is never read into a single string or converted row by row.
+    ``progress(fraction)`` is called after each chunk with the share of the
+    file read so far (0 when the size is unknown); it may raise to abort.
+    """
+    wanted = set(REQUIRED_COLUMNS + OPTIONAL_COLUMNS)
+    stream = _open_source(source)
+    extent = _remaining_bytes(stream) if progress is not None else None
+    reader = pd.read_csv(
+        stream,
+        chunksize=chunksize,
+        usecols=lambda col: col in wanted,
+        dtype={col: 'string' for col in TEXT_COLUMNS},
+        skipinitialspace=True,
+        encoding='utf-8',
+    )
+    first_row = 1
+    for chunk in reader:
+        missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+        if missing:
+            raise MissingColumnsError(missing)
+        yield _coerce_chunk(chunk, first_row)
+        first_row += len(chunk)
+        if progress is not None:
+            progress(_read_fraction(stream, extent))
+
+
+def _read_fraction(stream, extent):
+    if extent is None or extent[1] <= extent[0]:
+        return 0.0
+    start, size = extent
+    try:
+        # The parser reads ahead, so this runs slightly ahead of the rows yielded
+        return min(max((stream.tell() - start) / (size - start), 0.0), 1.0)
+    except (OSError, ValueError):
+        return 0.0
+
+
+@timed('ingest.products')
+def ingest_products(source, chunksize=DEFAULT_CHUNK_ROWS, progress=None):
+    product_chunks, rejected_chunks = [], []
+    for products, rejected in iter_product_chunks(source, chunksize=chunksize, progress=progress):
+        product_chunks.append(products)
+        if not rejected.empty:
+            rejected_chunks.append(rejected)
+
+    if product_chunks:
+        products_df = concat_products(product_chunks)
+    else:
+        products_df = empty_products(REQUIRED_COLUMNS)
+    if rejected_chunks:
+        rejected_df = pd.concat(rejected_chunks, ignore_index=True)
+    else:
+        rejected_df = pd.DataFrame(columns=REJECTED_COLUMNS)
+    return IngestResult(products_df, rejected_df)
@@ -0,0 +1,234 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from mspcc.instrumentation import timed
+
+
+# Products listed when the question does not say how many, and the most it may ask for
+DEFAULT_INSIGHT_ROWS = 10
+MAX_INSIGHT_ROWS = 50
+# Weeks of stock cover (stock / weekly units) above which a product counts as overstocked, and below which it runs low
+OVERSTOCK_WEEKS = 8
+LOW_STOCK_WEEKS = 2
+
+# Questions asking for reasons, advice or predictions need the model
+OPEN_ENDED = re.compile(r"\b(why|how (can|could|should|do|does|to)|should i|what if|recommend\w*|suggest\w*|advi[cs]e|"
+                        r"strateg\w*|explain\w*|improve\w*|boost\w*|predict\w*|forecast\w*|trend\w*|compare\w*)\b")
+LOSS = re.compile(r"\b(loss(es)?|losing|lose money|unprofitable|negative (profit|margin)s?|below cost)\b")
+OVERSTOCK = re.compile(r"\b(overstock\w*|over-stock\w*|excess (stock|inventory)|too much (stock|inventory)|dead stock|not selling)\b")
+LOW_STOCK = re.compile(r"\b(low (on )?stock|running low|run out|out of stock|stock ?outs?|re-?order\w*|re-?stock\w*|understock\w*)\b")
+GROUPS = re.compile(r"\b(categor(y|ies)|suppliers?)\b")
+BY_GROUP = re.compile(r"\b(by|per|each|breakdown|split)\b")
+GROUP_BREAKDOWN = re.compile(r"\b(which|what|top|best|worst|most|least)\b")
+TOTALS = re.compile(r"\b(total|overall|sum|average|mean|how many)\b")
+LARGEST = re.compile(r"\b(most|top|best|highest|biggest|largest|greatest|max(imum)?|strongest|fastest)\b")
+SMALLEST = re.compile(r"\b(least|bottom|worst|lowest|smallest|min(imum)?|weakest|slowest|poorest|cheapest)\b")
+# Checked in order: "profit margin" is about margin, "sales revenue" about revenue
+METRICS = [
+    ('margin', re.compile(r"\bmargins?\b")),
+    ('sellingPrice', re.compile(r"\b(prices?|priced|expensive|cheapest)\b")),
+    ('weeklyRevenue', re.compile(r"\b(revenue|turnover|takings)\b")),
+    ('weeklyProfit', re.compile(r"\b(profit\w*|earn\w*|money makers?)\b")),
+    ('unitsSoldWeek', re.compile(r"\b(sell\w*|sold|sales|units|volume|popular|movers?)\b")),
+    ('stockLevel', re.compile(r"\b(stock|inventory)\b")),
+]
+ROW_COUNT = re.compile(r"\b(?:top|bottom|best|worst|first|last|highest|lowest|most|least)\s+(\d{1,3})\b"
+                       r"|\b(\d{1,3})\s+(?:products|items|skus|categories|suppliers)\b")
+
+LABELS = {'sellingPrice': 'selling price', 'purchasePrice': 'purchase price', 'weeklyProfit': 'weekly profit',
+          'weeklyRevenue': 'weekly revenue', 'margin': 'margin', 'unitsSoldWeek': 'units sold per week', 'stockLevel': 'stock level', 'weeksOfCover': 'weeks of cover'}
+
+
+def _format(metric, value):
+    if pd.isna(value):
+        return 'n/a'
+    if metric in ('weeklyProfit', 'weeklyRevenue', 'sellingPrice', 'purchasePrice'):
+        return f"${value:,.2f}"
+    if metric == 'margin':
+        return f"{value:.1f}%"
+    if metric == 'weeksOfCover':
+        return 'no sales' if np.isinf(value) else f"{value:.1f}"
+    return f"{value:,.0f}"
+
+
+def _table(df, columns):
+    lines = ['| ' + ' | '.join(LABELS.get(c, c).capitalize() for c in columns) + ' |',
+             '|' + '---|' * len(columns)]
+    for row in df[columns].itertuples(index=False):
+        cells = [_format(c, v) if c in LABELS else ('' if pd.isna(v) else str(v)).replace('|', '/')
+                 for c, v in zip(columns, row)]
+        lines.append('| ' + ' | '.join(cells) + ' |')
+    return '\n'.join(lines)
+
+
+def _bar(x, y, title, y_label):
+    # Plotly figure JSON, the shape the model is asked to return
+    return {'data': [{'type': 'bar', 'x': [str(v) for v in x], 'y': [None if pd.isna(v) else float(v) for v in y]}],
+            'layout': {'title': {'text': title}, 'yaxis': {'title': {'text': y_label}}}}
+
+
+def _numeric(frame, field):
+    if field not in frame.columns:
+        return pd.Series(np.nan, index=frame.index)
+    return pd.to_numeric(frame[field], errors='coerce').astype(float)
+
+
+def _mentioned(frame, field, question):
+    """Labels of ``field`` named in the question (longest first, so 'Home Garden' beats 'Home')."""
+    if field not in frame.columns:
+        return []
+    column = frame[field]
+    labels = column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype) else column.dropna().unique()
+    found = []
+    for label in sorted(map(str, labels), key=len, reverse=True):
+        pattern = r"\b" + re.escape(label.casefold()) + r"\b"
+        if re.search(pattern, question) and not any(label.casefold() in other.casefold() for other in found):
+            found.append(label)
+    return found
+
+
+def _rows(question):
+    match = ROW_COUNT.search(question)
+    rows = int(match.group(1) or match.group(2)) if match else DEFAULT_INSIGHT_ROWS
+    return min(max(rows, 1), MAX_INSIGHT_ROWS)
+
+
+def _scope(frame, question):
+    """The products the question is restricted to by naming categories or suppliers, and a phrase describing them."""
+    mask = np.ones(len(frame), dtype=bool)
+    phrases = []
+    for field in ('category', 'supplier'):
+        labels = _mentioned(frame, field, question)
+        if labels:
+            mask &= frame[field].isin(labels).to_numpy()
+            phrases.append(f"{field} {', '.join(labels)}")
+    return frame[mask], (f" in {' and '.join(phrases)}" if phrases else '')
+
+
+def _answer(text, visualization=None):
+    return {'insight': text, 'visualization': visualization}
+
+
+def _ranking(frame, question, metric, largest):
+    scope, where = _scope(frame, question)
+    k = _rows(question)
+    values = _numeric(scope, metric)
+    picked = scope.loc[(values.nlargest(k) if largest else values.nsmallest(k)).index]
+    if picked.empty:
+        return _answer(f"No products{where} have a recorded {LABELS[metric]}.")
+    direction = 'Highest' if largest else 'Lowest'
+    title = f"{direction} {LABELS[metric]}{where}"
+    columns = ['name', 'category', metric] + [c for c in ('weeklyProfit', 'margin') if c != metric]
+    text = f"**{title}** ({len(picked)} of {len(scope):,} products):\n\n{_table(picked, columns)}"
+    return _answer(text, _bar(picked['name'], _numeric(picked, metric), title, LABELS[metric]))
+
+
+def _losses(frame, question):
+    scope, where = _scope(frame, question)
+    profit = _numeric(scope, 'weeklyProfit')
+    below_cost = (_numeric(scope, 'sellingPrice') < _numeric(scope, 'purchasePrice')).to_numpy()
+    losing = scope[(profit < 0).to_numpy() | below_cost]
+    if losing.empty:
+        return _answer(f"No products{where} are losing money: every product sells at or above its purchase price.")
+    picked = losing.loc[_numeric(losing, 'weeklyProfit').nsmallest(_rows(question)).index]
+    total = _numeric(losing, 'weeklyProfit').clip(upper=0).sum()
+    text = (f"**{len(losing):,} products{where} are loss-making**, costing {_format('weeklyProfit', -total)} per week. "
+            f"The biggest losses:\n\n{_table(picked, ['name', 'category', 'sellingPrice', 'purchasePrice', 'weeklyProfit'])}")
+    return _answer(text, _bar(picked['name'], _numeric(picked, 'weeklyProfit'), f"Loss-making products{where}", LABELS['weeklyProfit']))
+
+
+def _weeks_of_cover(frame):
+    stock = _numeric(frame, 'stockLevel').to_numpy()
+    units = _numeric(frame, 'unitsSoldWeek').to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(units > 0, stock / units, np.where(stock > 0, np.inf, np.nan))
+    return pd.Series(cover, index=frame.index)
+
+
+def _stock(frame, question, overstocked):
+    scope, where = _scope(frame, question)
+    if 'stockLevel' not in scope.columns or scope['stockLevel'].isna().all():
+        return _answer("Stock levels are not recorded for these products, so stock cover cannot be worked out.")
+    cover = _weeks_of_cover(scope)
+    flagged = cover[cover > OVERSTOCK_WEEKS] if overstocked else cover[cover < LOW_STOCK_WEEKS]
+    if flagged.empty:
+        limit = f"more than {OVERSTOCK_WEEKS}" if overstocked else f"less than {LOW_STOCK_WEEKS}"
+        return _answer(f"No products{where} hold {limit} weeks of stock at their current sales rate.")
+    order = flagged.sort_values(ascending=not overstocked, kind='stable')
+    order = order.iloc[:_rows(question)]
+    picked = scope.loc[order.index].assign(weeksOfCover=order)
+    if overstocked:
+        summary = (f"**{len(flagged):,} products{where} are overstocked** (more than {OVERSTOCK_WEEKS} weeks of stock "
+                   f"at the current sales rate, or stock that is not selling).")
+    else:
+        summary = f"**{len(flagged):,} products{where} are running low** (less than {LOW_STOCK_WEEKS} weeks of stock left)."
+    text = f"{summary}\n\n{_table(picked, ['name', 'category', 'stockLevel', 'unitsSoldWeek', 'weeksOfCover'])}"
+    return _answer(text, _bar(picked['name'], picked['stockLevel'], "Overstocked products" if overstocked else "Products running low",
+                              LABELS['stockLevel']))
+
+
+def _breakdown(frame, question, metric, largest):
+    field = 'supplier' if re.search(r"\bsuppliers?\b", question) else 'category'
+    if field not in frame.columns:
+        return None
+    scope, where = _scope(frame, question)
+    measures = pd.DataFrame({name: _numeric(scope, name) for name in ('weeklyProfit', 'weeklyRevenue', 'unitsSoldWeek', 'stockLevel')})
+    labels = scope[field].astype(object).fillna('Unspecified').to_numpy()
+    grouped = measures.groupby(labels, sort=False)
+    totals = grouped.sum()
+    totals['products'] = grouped.size()
+    revenue = totals['weeklyRevenue'].where(totals['weeklyRevenue'] != 0)
+    totals['margin'] = (totals['weeklyProfit'] / revenue * 100).fillna(0)
+    totals = totals.sort_values(metric, ascending=not largest).head(_rows(question))
+    totals = totals.rename_axis(field).reset_index()
+    title = f"{LABELS[metric].capitalize()} by {field}{where}"
+    text = f"**{title}**:\n\n{_table(totals, [field, 'products', metric] + [c for c in ('weeklyProfit', 'margin') if c != metric])}"
+    return _answer(text, _bar(totals[field], totals[metric], title, LABELS[metric]))
+
+
+def _totals(frame, question):
+    scope, where = _scope(frame, question)
+    profit, revenue = _numeric(scope, 'weeklyProfit'), _numeric(scope, 'weeklyRevenue')
+    lines = [f"- Products: {len(scope):,}",
+             f"- Total weekly profit: {_format('weeklyProfit', profit.sum())}",
+             f"- Total weekly revenue: {_format('weeklyRevenue', revenue.sum())}",
+             f"- Average margin: {_format('margin', _numeric(scope, 'margin').mean())}",
+             f"- Units sold per week: {_format('unitsSoldWeek', _numeric(scope, 'unitsSoldWeek').sum())}"]
+    if 'stockLevel' in scope.columns and scope['stockLevel'].notna().any():
+        lines.append(f"- Units in stock: {_format('stockLevel', _numeric(scope, 'stockLevel').sum())}")
+    return _answer(f"**Catalog totals{where}**:\n\n" + '\n'.join(lines))
+
+
+@timed('insights.answer_locally')
+def answer_locally(frame, question):
+    """Answer common analytical questions straight from the product frame.
+
+    Returns the ``{"insight", "visualization"}`` shape the model is asked for,
+    or None when the question is open-ended (or not recognised) and should go
+    to the model.
+    """
+    if frame is None or frame.empty or not question or not question.strip():
+        return None
+    question = ' '.join(question.casefold().split())
+    if OPEN_ENDED.search(question):
+        return None
+    if LOSS.search(question):
+        return _losses(frame, question)
+    if OVERSTOCK.search(question):
+        return _stock(frame, question, overstocked=True)
+    if LOW_STOCK.search(question):
+        return _stock(frame, question, overstocked=False)
+
+    metric = next((name for name, pattern in METRICS if pattern.search(question)), None)
+    largest = bool(LARGEST.search(question))
+    smallest = bool(SMALLEST.search(question))
+    if GROUPS.search(question) and (BY_GROUP.search(question) or (GROUP_BREAKDOWN.search(question) and not TOTALS.search(question))):
+        grouped = metric if metric in ('weeklyProfit', 'weeklyRevenue', 'margin', 'unitsSoldWeek') else 'weeklyProfit'
+        return _breakdown(frame, question, grouped, not smallest)
+    if TOTALS.search(question) and not (largest or smallest):
+        return _totals(frame, question)
+    if metric is not None and largest != smallest:
+        return _ranking(frame, question, metric, largest)
+    return None
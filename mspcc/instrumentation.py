@@ -0,0 +1,244 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Set to 1 to record spans from startup; the Diagnostics page can also switch recording on and off
+ENABLED_ENV = 'MSPCC_INSTRUMENTATION'
+# Optional Prometheus text file (e.g. for node_exporter's textfile collector) and scrape port
+METRICS_FILE = os.environ.get('MSPCC_METRICS_FILE')
+METRICS_PORT = os.environ.get('MSPCC_METRICS_PORT')
+FILE_INTERVAL_SECONDS = 15
+# Histogram bucket upper bounds in seconds
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Sessions kept per gauge before the least recently updated are dropped
+MAX_GAUGE_SERIES = 200
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def stop(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('_registry', '_name', '_start')
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+        self._start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def stop(self):
+        if self._start is not None:
+            self._registry.observe(self._name, time.perf_counter() - self._start)
+            self._start = None
+
+
+class SpanStats:
+    __slots__ = ('count', 'total', 'max', 'last', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.buckets = [0] * (len(SPAN_BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+        self.buckets[bisect.bisect_left(SPAN_BUCKETS, seconds)] += 1
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class Instrumentation:
+    """Process-wide timing spans, counters and gauges, exported as Prometheus text.
+
+    While disabled, ``span`` hands back a shared no-op object and ``timed``
+    functions call straight through, so instrumented code pays one attribute
+    check per call.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._gauges = {}
+        self._last_file_write = 0.0
+
+    def span(self, name):
+        """Context manager (or ``.stop()``-able handle) timing one section under ``name``."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def timed(self, name=None):
+        """Decorator recording every call of the function as a span."""
+        def decorate(fn):
+            span_name = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = SpanStats()
+            stats.add(seconds)
+
+    def count(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            key = tuple(labels.items())
+            series.pop(key, None)
+            series[key] = value
+            while len(series) > MAX_GAUGE_SERIES:
+                del series[next(iter(series))]
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    # --- Reading ---
+
+    def span_summary(self):
+        """One dict per span name with call count and total/mean/max/last seconds, slowest total first."""
+        with self._lock:
+            rows = [
+                {'span': name, 'calls': s.count, 'totalSeconds': s.total, 'meanSeconds': s.total / s.count,
+                 'maxSeconds': s.max, 'lastSeconds': s.last}
+                for name, s in self._spans.items()
+            ]
+        return sorted(rows, key=lambda row: row['totalSeconds'], reverse=True)
+
+    def counters(self):
+        with self._lock:
+            return [{'name': name, **dict(labels), 'value': value} for (name, labels), value in self._counters.items()]
+
+    def gauges(self, name):
+        with self._lock:
+            return [{**dict(labels), 'value': value} for labels, value in self._gauges.get(name, {}).items()]
+
+    def to_prometheus(self):
+        with self._lock:
+            lines = [
+                '# HELP mspcc_span_seconds Time spent in instrumented helpers and page sections.',
+                '# TYPE mspcc_span_seconds histogram',
+            ]
+            for name, stats in sorted(self._spans.items()):
+                cumulative = 0
+                for bound, hits in zip(SPAN_BUCKETS + ('+Inf',), stats.buckets):
+                    cumulative += hits
+                    lines.append(f"mspcc_span_seconds_bucket{_labels({'span': name, 'le': bound})} {cumulative}")
+                lines.append(f"mspcc_span_seconds_sum{_labels({'span': name})} {stats.total:.6f}")
+                lines.append(f"mspcc_span_seconds_count{_labels({'span': name})} {stats.count}")
+
+            for metric in sorted({name for name, _ in self._counters}):
+                lines.append(f'# TYPE mspcc_{metric} counter')
+                for (name, labels), value in self._counters.items():
+                    if name == metric:
+                        lines.append(f"mspcc_{metric}{_labels(dict(labels))} {value}")
+
+            for metric, series in sorted(self._gauges.items()):
+                lines.append(f'# TYPE mspcc_{metric} gauge')
+                for labels, value in series.items():
+                    lines.append(f"mspcc_{metric}{_labels(dict(labels))} {value}")
+        return '\n'.join(lines) + '\n'
+
+    # --- Export ---
+
+    def write_textfile(self, path, min_interval=0):
+        """Atomically write the Prometheus text to ``path``, at most every ``min_interval`` seconds."""
+        now = time.monotonic()
+        if now - self._last_file_write < min_interval:
+            return False
+        self._last_file_write = now
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+        return True
+
+    def serve(self, port, host='0.0.0.0'):
+        """Serve ``/metrics`` from a daemon thread; returns the server."""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='mspcc-metrics', daemon=True).start()
+        return server
+
+
+_default = Instrumentation(enabled=os.environ.get(ENABLED_ENV, '') not in ('', '0', 'false'))
+
+
+def get_instrumentation():
+    return _default
+
+
+def span(name):
+    return _default.span(name)
+
+
+def timed(name=None):
+    return _default.timed(name)
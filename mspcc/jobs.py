@@ -0,0 +1,154 @@
+import hashlib
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+MAX_WORKERS = 4
+# Finished jobs kept for result reuse before the oldest are evicted
+KEEP_FINISHED = 50
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """A unit of background work plus the state the UI polls."""
+    _ids = itertools.count(1)
+
+    def __init__(self, key, kind, cleanup=None):
+        self.id = next(self._ids)
+        self.key = key
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.cleanup = cleanup
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def report(self, progress, message=None):
+        """Record progress from inside the job; also the point where cancellation takes effect."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.kind!r}, {self.status})"
+
+
+def job_key(kind, *parts):
+    digest = hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:16]
+    return f"{kind}:{digest}"
+
+
+class JobManager:
+    """Thread-pool job registry shared by all sessions.
+
+    Jobs are identified by a key built from their kind and inputs (including
+    the dataset version where the result depends on it). Submitting a key that
+    is already queued, running or done returns the existing job, so identical
+    requests are de-duplicated and finished results are reused.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, keep_finished=KEEP_FINISHED):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mspcc-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_key = {}
+        self.keep_finished = keep_finished
+
+    def submit(self, kind, fn, *args, key_parts=(), cleanup=None, **kwargs):
+        """Run ``fn(job, *args, **kwargs)`` in the background and return its Job."""
+        key = job_key(kind, *key_parts)
+        with self._lock:
+            existing = self._by_key.get(key)
+            if existing is not None and existing.status not in (FAILED, CANCELLED):
+                return existing
+            job = Job(key, kind, cleanup)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            self._evict()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.progress = 1.0
+            self._finish(job, DONE)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = e
+            self._finish(job, FAILED)
+
+    @staticmethod
+    def _finish(job, status):
+        # Eviction sorts done jobs by finish time, so a job must have one before it counts as done
+        job.finished = time.time()
+        job.status = status
+
+    def _evict(self):
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            if job.cleanup is not None and job.status == DONE:
+                job.cleanup(job.result)
+
+    def clear_finished(self):
+        """Forget every finished job (running their cleanup), so resubmitting recomputes."""
+        with self._lock:
+            keep, self.keep_finished = self.keep_finished, 0
+            try:
+                self._evict()
+            finally:
+                self.keep_finished = keep
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def find(self, kind, *key_parts):
+        return self._by_key.get(job_key(kind, *key_parts))
+
+    def jobs(self):
+        return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Process-wide manager, created on first use."""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = JobManager()
+        return _default_manager
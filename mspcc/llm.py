@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from mspcc.instrumentation import span
+
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+MAX_CONCURRENCY = 4
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+CACHE_SIZE = 512
+CACHE_TTL_SECONDS = 60 * 60
+REQUEST_TIMEOUT_SECONDS = 120
+STUB_CHUNK_CHARS = 16
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+_STREAM_END = object()
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# --- Backends ---
+
+class StubBackend:
+    """Offline backend for tests and for running without an API key."""
+    name = 'stub'
+
+    def __init__(self, respond=None, delay=0.0):
+        self.respond = respond or (lambda prompt: "")
+        self.delay = delay
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.respond(prompt)
+
+    async def stream(self, prompt):
+        text = await self.generate(prompt)
+        for start in range(0, len(text), STUB_CHUNK_CHARS):
+            yield text[start:start + STUB_CHUNK_CHARS]
+
+
+class GeminiBackend:
+    name = 'gemini'
+
+    def __init__(self, api_key, model_name=DEFAULT_MODEL):
+        # Imported lazily: the SDK is slow to import and only needed with an API key
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt):
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+# --- Client ---
+
+class _Broadcast:
+    """One backend stream fanned out to every reader's queue; used only on the client loop."""
+
+    def __init__(self):
+        self.parts = []
+        self.listeners = []
+
+    def subscribe(self, chunks):
+        for part in self.parts:
+            chunks.put(part)
+        self.listeners.append(chunks)
+
+    def send(self, item):
+        if isinstance(item, str):
+            self.parts.append(item)
+        for chunks in self.listeners:
+            chunks.put(item)
+
+
+def prompt_key(prompt, fingerprint=''):
+    return hashlib.sha256(f'{fingerprint}\x00{prompt}'.encode('utf-8')).hexdigest()
+
+
+def fingerprint_products(products_df):
+    """Cheap content hash of the product data a prompt was built from."""
+    if products_df is None or products_df.empty:
+        return 'empty'
+    hashed = pd.util.hash_pandas_object(products_df, index=False)
+    return f'{len(products_df)}:{int(hashed.sum()) & 0xFFFFFFFFFFFFFFFF:x}'
+
+
+class LLMClient:
+    """Shared, cached and rate-limited access to the language model.
+
+    Calls run on a private asyncio loop in a background thread. Identical
+    in-flight prompts, and identical streams, are coalesced into one request;
+    finished responses are cached on a hash of the prompt plus a fingerprint
+    of the data it describes.
+    """
+
+    def __init__(self, backend, max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES,
+                 backoff_seconds=BACKOFF_SECONDS, cache=None):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.cache = cache if cache is not None else TTLCache()
+        self._inflight = {}
+        self._streams = {}
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name='llm-client', daemon=True)
+        self._thread.start()
+
+    def _semaphore_for_loop(self):
+        # Created lazily so it binds to the client's own loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _call_backend(self, prompt):
+        async with self._semaphore_for_loop():
+            with span('llm.request'):
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        return await self.backend.generate(prompt)
+                    except Exception as e:
+                        if attempt == self.max_retries:
+                            raise LLMError(f"{self.backend.name} request failed after {attempt + 1} attempts: {e}") from e
+                        # Exponential backoff with jitter
+                        await asyncio.sleep(self.backoff_seconds * (2 ** attempt) * (0.5 + random.random()))
+
+    async def agenerate(self, prompt, fingerprint=''):
+        key = prompt_key(prompt, fingerprint)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_backend(prompt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        text = await asyncio.shield(task)
+        self.cache.set(key, text)
+        return text
+
+    async def _stream_into(self, prompt, key, broadcast):
+        # Runs to completion even if every reader goes away, so the finished text still gets cached
+        try:
+            async with self._semaphore_for_loop():
+                with span('llm.stream'):
+                    for attempt in range(self.max_retries + 1):
+                        try:
+                            async for chunk in self.backend.stream(prompt):
+                                broadcast.send(chunk)
+                            break
+                        except Exception as e:
+                            # Only retry while nothing has been handed to the readers yet
+                            if broadcast.parts or attempt == self.max_retries:
+                                raise LLMError(f"{self.backend.name} stream failed: {e}") from e
+                            await asyncio.sleep(self.backoff_seconds * (2 ** attempt) * (0.5 + random.random()))
+            # Only a complete response is cached
+            self.cache.set(key, ''.join(broadcast.parts))
+            broadcast.send(_STREAM_END)
+        except LLMError as e:
+            broadcast.send(e)
+        finally:
+            self._streams.pop(key, None)
+
+    async def _subscribe(self, prompt, key, chunks):
+        # Runs on the client loop, so joining a stream cannot race with its chunks or its end
+        cached = self.cache.get(key)
+        if cached is not None:
+            chunks.put(cached)
+            chunks.put(_STREAM_END)
+            return
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = _Broadcast()
+            asyncio.ensure_future(self._stream_into(prompt, key, broadcast))
+        broadcast.subscribe(chunks)
+
+    def stream(self, prompt, fingerprint='', timeout=REQUEST_TIMEOUT_SECONDS):
+        """Yield the response in chunks as the model produces them (all at once when cached).
+
+        Identical prompts streamed concurrently share one backend stream; a
+        reader that joins late first gets the chunks it missed.
+        """
+        key = prompt_key(prompt, fingerprint)
+        cached = self.cache.get(key)
+        if cached is not None:
+            if cached:
+                yield cached
+            return
+        chunks = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self._subscribe(prompt, key, chunks), self._loop)
+        while True:
+            try:
+                chunk = chunks.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No response from {self.backend.name} within {timeout}s") from None
+            if chunk is _STREAM_END:
+                return
+            if isinstance(chunk, LLMError):
+                raise chunk
+            if chunk:
+                yield chunk
+
+    def submit(self, prompt, fingerprint=''):
+        """Schedule a request and return a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self.agenerate(prompt, fingerprint), self._loop)
+
+    def generate(self, prompt, fingerprint='', timeout=REQUEST_TIMEOUT_SECONDS):
+        return self.submit(prompt, fingerprint).result(timeout)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def create_backend():
+    api_key = os.environ.get('GOOGLE_API_KEY')
+    if api_key:
+        return GeminiBackend(api_key, os.environ.get('MSPCC_GEMINI_MODEL', DEFAULT_MODEL))
+    return StubBackend()
+
+
+def get_llm_client():
+    """Process-wide client, created on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = LLMClient(create_backend())
+        return _default_client
+
+
+def parse_json_response(text):
+    """Decode a JSON reply, tolerating the Markdown code fences models like to add."""
+    if not text:
+        return None
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[-1].rsplit('```', 1)[0]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
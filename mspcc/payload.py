@@ -0,0 +1,125 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from mspcc.aggregates import RunningAggregates
+from mspcc.instrumentation import timed
+from mspcc.products import as_product_collection
+
+
+DEFAULT_TOKEN_BUDGET = 4_000
+# Rough size of a token in characters of compact JSON
+CHARS_PER_TOKEN = 4
+PAYLOAD_FIELDS = ['name', 'category', 'supplier', 'sellingPrice', 'purchasePrice', 'unitsSoldWeek', 'weeklyProfit', 'margin']
+# Robust z-score (median/MAD) above which a product is reported as an outlier
+OUTLIER_Z = 3.5
+
+# Starting sizes; halved in turn until the payload fits the budget
+INITIAL_LIMITS = {'sample': 40, 'top': 10, 'outliers': 10, 'groups': 25}
+SHRINK_ORDER = ['sample', 'outliers', 'top', 'groups']
+
+
+def estimate_tokens(payload):
+    return len(json.dumps(payload, separators=(',', ':'), default=str)) // CHARS_PER_TOKEN
+
+
+def _records(df):
+    df = df.reindex(columns=PAYLOAD_FIELDS)
+    for col in ('sellingPrice', 'purchasePrice', 'weeklyProfit', 'margin'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype(float).round(2)
+    return json.loads(df.to_json(orient='records'))
+
+
+def _ranked(df, metric, k, largest):
+    values = pd.to_numeric(df[metric], errors='coerce')
+    picked = values.nlargest(k) if largest else values.nsmallest(k)
+    return df.loc[picked.index]
+
+
+def _outliers(df, k):
+    scores = pd.Series(0.0, index=df.index)
+    for metric in ('weeklyProfit', 'margin'):
+        values = pd.to_numeric(df[metric], errors='coerce').replace([np.inf, -np.inf], np.nan)
+        median = values.median()
+        mad = (values - median).abs().median()
+        if mad and not np.isnan(mad):
+            scores = np.maximum(scores, (0.6745 * (values - median).abs() / mad).fillna(0))
+    flagged = scores[scores > OUTLIER_Z].nlargest(k)
+    return df.loc[flagged.index]
+
+
+def _stratified_sample(df, n):
+    if len(df) <= n:
+        return df
+    strata = df['category'].astype(object).where(df['category'].notna(), '') if 'category' in df.columns else pd.Series('', index=df.index)
+    # One pass groups the positions of every category; scanning per category would be O(categories x n)
+    members = strata.groupby(strata.to_numpy(), sort=False).indices
+    counts = pd.Series({stratum: len(positions) for stratum, positions in members.items()}).sort_values(ascending=False, kind='stable')
+    # Proportional allocation, at least one product per category while room remains
+    allocation = np.maximum(1, np.floor(counts / len(df) * n)).astype(int)
+    picked = []
+    for stratum, size in allocation.items():
+        positions = members[stratum]
+        picked.extend(pd.Series(positions).sample(min(size, len(positions)), random_state=0).tolist())
+    return df.iloc[picked[:n]]
+
+
+def _candidates(df, aggregates):
+    # Computed once at the initial sizes; shrinking only truncates these
+    candidates = {key: aggregates.group_totals(key).head(INITIAL_LIMITS['groups']).round(2) for key in RunningAggregates.GROUP_KEYS}
+    for metric in ('weeklyProfit', 'margin'):
+        candidates[f'top_{metric}'] = _ranked(df, metric, INITIAL_LIMITS['top'], largest=True)
+        candidates[f'bottom_{metric}'] = _ranked(df, metric, INITIAL_LIMITS['top'], largest=False)
+    candidates['outliers'] = _outliers(df, INITIAL_LIMITS['outliers'])
+    candidates['sample'] = _stratified_sample(df, INITIAL_LIMITS['sample'])
+    return candidates
+
+
+def _build(aggregates, candidates, limits):
+    payload = {
+        'summary': {
+            'products': aggregates.count,
+            'totalWeeklyProfit': round(float(aggregates.totalWeeklyProfit), 2),
+            'totalWeeklyRevenue': round(float(aggregates.totalWeeklyRevenue), 2),
+            'averageMargin': round(float(aggregates.averageMargin), 2),
+        },
+    }
+    for key in RunningAggregates.GROUP_KEYS:
+        groups = candidates[key]
+        if limits['groups'] and not groups.empty:
+            payload[f'{key}Rollup'] = json.loads(groups.head(limits['groups']).to_json(orient='records'))
+    if limits['top']:
+        for metric in ('weeklyProfit', 'margin'):
+            for side in ('top', 'bottom'):
+                payload[f'{side}_{metric}'] = _records(candidates[f'{side}_{metric}'].head(limits['top']))
+    if limits['outliers']:
+        payload['outliers'] = _records(candidates['outliers'].head(limits['outliers']))
+    if limits['sample']:
+        payload['sample'] = _records(_stratified_sample(candidates['sample'], limits['sample']))
+    return payload
+
+
+@timed('payload.build')
+def build_prompt_payload(products_data, token_budget=DEFAULT_TOKEN_BUDGET, aggregates=None):
+    """Compact, bounded-size summary of the catalog for use in model prompts.
+
+    Holds the overall KPIs, category/supplier rollups, top and bottom products
+    by profit and margin, outliers and a stratified sample. Section sizes are
+    halved in turn until the JSON fits ``token_budget``. Pass the dataset's
+    running ``aggregates`` to skip recomputing the rollups.
+    """
+    df = as_product_collection(products_data).df
+    if aggregates is None:
+        aggregates = RunningAggregates()
+        aggregates.add(df)
+    candidates = _candidates(df, aggregates)
+    limits = dict(INITIAL_LIMITS)
+    payload = _build(aggregates, candidates, limits)
+    while estimate_tokens(payload) > token_budget and any(limits.values()):
+        for key in SHRINK_ORDER:
+            if limits[key]:
+                limits[key] //= 2
+                break
+        payload = _build(aggregates, candidates, limits)
+    return payload
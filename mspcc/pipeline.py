@@ -0,0 +1,271 @@
+"""The analytics pipeline behind the dashboard, usable without Streamlit.
+
+Ingest (parse_unstructured_data) -> calculate_product_metrics -> forecast
+(get_sales_forecast_and_suggestions) -> report (generate_full_pdf_report_content,
+generate_pdf_report), plus the AI helpers the pages call. Progress and
+problems are logged on the ``mspcc.pipeline`` logger; the app shows them on
+the page. Plotly, FPDF and the Gemini SDK are not imported here, so batch
+workers start quickly.
+"""
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from mspcc.forecast import MODEL_NAMES, ForecastCache, SalesHistory, reorder_plan
+from mspcc.ingest import IngestResult, MissingColumnsError, ingest_products
+from mspcc.insights import answer_locally
+from mspcc.instrumentation import timed
+from mspcc.jobs import JobCancelled
+from mspcc.llm import LLMError, fingerprint_products, get_llm_client, parse_json_response
+from mspcc.payload import DEFAULT_TOKEN_BUDGET, build_prompt_payload
+from mspcc.products import as_product_collection, enforce_schema
+from mspcc.web import CatalogIndex, extract_offers, get_web_fetcher, urls_in
+
+
+log = logging.getLogger(__name__)
+
+
+# Model calls go through the shared client in mspcc.llm (Gemini when GOOGLE_API_KEY is set, an offline stub otherwise)
+
+@timed()
+def calculate_product_metrics(df):
+    if df is not None and not df.empty:
+        # Inputs are stored compactly; the metrics are computed in float64 before the schema narrows them
+        df = enforce_schema(df)
+        selling_price = df['sellingPrice'].astype(float)
+        purchase_price = df['purchasePrice'].astype(float)
+        units_sold = df['unitsSoldWeek'].astype(float)
+        df['weeklyProfit'] = (selling_price - purchase_price) * units_sold
+        df['margin'] = ((selling_price - purchase_price) / selling_price) * 100
+        df['weeklyRevenue'] = selling_price * units_sold
+        df = enforce_schema(df)
+    return df
+
+
+def ask_model_json(prompt, fingerprint, default):
+    # Falls back to `default` when the model is unavailable or does not answer in the expected JSON shape
+    try:
+        response = parse_json_response(get_llm_client().generate(prompt, fingerprint))
+    except (LLMError, TimeoutError) as e:
+        log.warning(f"AI request failed: {e}. Using placeholder.")
+        return default
+    return response if isinstance(response, type(default)) else default
+
+def products_prompt_data(products_data, token_budget=DEFAULT_TOKEN_BUDGET):
+    # Compact, token-budgeted catalog summary plus a fingerprint for the response cache;
+    # both are memoized on the collection, i.e. once per dataset version
+    products = as_product_collection(products_data)
+    payload = products.memo(('payload', token_budget), lambda: json.dumps(build_prompt_payload(products, token_budget), separators=(',', ':')))
+    if products.version is not None:
+        fingerprint = f"v{products.version}"
+    else:
+        fingerprint = products.memo('fingerprint', lambda: fingerprint_products(products.df))
+    return payload, fingerprint
+
+@timed()
+def get_ai_insight(products_data, question):
+    log.info(f"AI Insight request for: '{question}' with {len(products_data)} products.")
+    # Common analytical questions are answered from the data; only open-ended ones reach the model
+    local_answer = answer_locally(as_product_collection(products_data).df, question)
+    if local_answer is not None:
+        return local_answer
+    product_json, fingerprint = products_prompt_data(products_data)
+    prompt = (
+        "You are a retail business analyst. Answer the question about the product data below. "
+        'Respond with JSON: {"insight": "<markdown>", "visualization": <Plotly figure JSON or null>}.\n'
+        f"Question: {question}\nProduct data summary: {product_json}"
+    )
+    return ask_model_json(prompt, fingerprint, {"insight": "This is a placeholder AI insight based on your question.", "visualization": None})
+
+@timed()
+def generate_compliance_checklist(location, business_type):
+    log.info(f"Generating compliance checklist for {business_type} in {location}.")
+    prompt = (
+        f"List the general business compliance tasks for a {business_type} in {location}. "
+        'Respond with a JSON array of {"task": "...", "details": "..."} objects.'
+    )
+    return ask_model_json(prompt, '', [{"task": "Placeholder Task 1", "details": "Details for task 1"}, {"task": "Placeholder Task 2", "details": "Details for task 2"}])
+
+@timed()
+def get_marketing_advice(product, discount, lift, new_price, simulated_profit):
+    log.info(f"Generating marketing advice for {product.name}.")
+    prompt = (
+        f"A retailer plans a {discount}% discount on '{product.name}' (price ${product.sellingPrice:.2f}, cost ${product.purchasePrice:.2f}, "
+        f"{product.unitsSoldWeek} units/week), expecting a {lift}% sales lift. The new price would be ${new_price:.2f} and weekly profit ${simulated_profit:.2f}. "
+        'Give marketing advice. Respond with JSON: {"advice": "<markdown>", "visualization": <Plotly figure JSON or null>}.'
+    )
+    return ask_model_json(prompt, '', {"advice": "Placeholder marketing advice.", "visualization": None})
+
+@timed()
+def parse_unstructured_data(file_content, progress=None):
+    log.info("Parsing unstructured data with AI.")
+    try:
+        result = ingest_products(file_content, progress=progress)
+    except JobCancelled:
+        raise
+    except MissingColumnsError:
+        log.warning("Uploaded data does not contain expected columns: name, sellingPrice, purchasePrice, unitsSoldWeek. Using placeholder.")
+        return IngestResult(pd.DataFrame(), pd.DataFrame())
+    except Exception as e:
+        log.warning(f"Could not parse unstructured data as CSV: {e}. Using placeholder.")
+        return IngestResult(pd.DataFrame(), pd.DataFrame())
+    if not result.rejected_df.empty:
+        log.warning(f"Skipped {len(result.rejected_df)} row(s) with missing or non-numeric values.")
+    return result
+
+@timed()
+def get_sales_forecast_and_suggestions(products_data, sales_history=None, forecasts=None, progress=None):
+    log.info("Generating sales forecast and suggestions.")
+    products = as_product_collection(products_data)
+    forecast_df = products.df.copy()
+    if sales_history is None:
+        # No stored history: treat the current snapshot as a single observed week
+        sales_history = SalesHistory()
+        sales_history.record(forecast_df['id'].to_numpy(), pd.to_numeric(forecast_df['unitsSoldWeek']).to_numpy())
+    if forecasts is None:
+        forecasts = ForecastCache()
+    forecasts.update(sales_history, progress)
+
+    positions = sales_history.positions(forecast_df['id'].to_numpy())
+    known = positions >= 0
+    forecasted_sales = np.zeros(len(forecast_df))
+    forecasted_sales[known] = forecasts.forecast[positions[known]]
+    sigma = np.zeros(len(forecast_df))
+    sigma[known] = forecasts.sigma[positions[known]]
+    model = np.zeros(len(forecast_df), dtype=np.int64)
+    model[known] = forecasts.model[positions[known]]
+    stock = pd.to_numeric(forecast_df['stockLevel']).fillna(0).to_numpy(dtype=float) if 'stockLevel' in forecast_df else 0.0
+    safety_stock, reorder_amount = reorder_plan(forecasted_sales, sigma, stock)
+
+    reorder_suggestion = np.where(reorder_amount >= 1, "Reorder " + np.ceil(reorder_amount).astype(int).astype(str), "Sufficient Stock")
+    reorder_suggestion = np.where(stock > (forecasted_sales + safety_stock) * 2, "Potentially Overstocked", reorder_suggestion)
+
+    forecast_df['forecastedSales'] = forecasted_sales
+    forecast_df['safetyStock'] = safety_stock
+    forecast_df['reorderQuantity'] = np.ceil(reorder_amount)
+    forecast_df['forecastModel'] = MODEL_NAMES[model]
+    forecast_df['reorderSuggestion'] = reorder_suggestion
+    return forecast_df
+
+@timed()
+def generate_full_pdf_report_content(metrics, products_data):
+    log.info("Generating full PDF report content.")
+    report_content = {
+        "reportTitle": "MSPCC Audit Report",
+        "reportDate": pd.Timestamp.now().strftime('%Y-%m-%d'),
+        "executiveSummary": {
+            "overview": "This is a placeholder executive summary. Overall business performance is fair.",
+            "keyMetrics": [
+                {"label": "Total Weekly Profit", "value": f"${metrics['totalWeeklyProfit']:.2f}", "status": "Neutral"},
+                {"label": "Total Weekly Revenue", "value": f"${metrics['totalWeeklyRevenue']:.2f}", "status": "Neutral"},
+            ]
+        },
+        "dataQuality": {
+            "summary": "Placeholder data quality summary. Data seems generally good.",
+            "score": "Good",
+            "checks": []
+        },
+        "categoryAnalysis": [],
+        "marketAnalysis": {
+            "topPerformers": metrics.get('topPerformers', ["Product A"]),
+            "underPerformers": metrics.get('underPerformers', ["Product X"]),
+            "opportunityGaps": ["Expand into new categories"]
+        },
+        "strategicRecommendations": [],
+        "conclusion": "Placeholder conclusion."
+    }
+    product_json, fingerprint = products_prompt_data(products_data)
+    prompt = (
+        "Write the narrative sections of a business audit report for the product data below. "
+        'Respond with JSON: {"executiveSummary": {"overview": "..."}, "dataQuality": {"summary": "...", "score": "..."}, '
+        '"strategicRecommendations": ["..."], "conclusion": "..."}.\n'
+        f"Metrics: {json.dumps(metrics, default=float)}\nProduct data summary: {product_json}"
+    )
+    narrative = ask_model_json(prompt, fingerprint, {})
+    report_content["executiveSummary"].update(narrative.get("executiveSummary", {}))
+    report_content["dataQuality"].update(narrative.get("dataQuality", {}))
+    for key in ("strategicRecommendations", "conclusion"):
+        if key in narrative:
+            report_content[key] = narrative[key]
+    return report_content
+
+class OverviewStream:
+    """Chunks of the business overview; ``complete`` tells, once consumed, whether the model answered in full."""
+
+    def __init__(self, metrics, products_data):
+        self.metrics = metrics
+        self.products_data = products_data
+        self.complete = False
+
+    def __iter__(self):
+        product_json, fingerprint = products_prompt_data(self.products_data)
+        prompt = (
+            "Write a short Markdown business overview for a small retailer, starting with a '### Business Overview' heading "
+            "and separating paragraphs with blank lines. Mention any critical alerts.\n"
+            f"Metrics: {json.dumps(self.metrics, default=float)}\nProduct data summary: {product_json}"
+        )
+        streamed = False
+        try:
+            for chunk in get_llm_client().stream(prompt, fingerprint):
+                streamed = streamed or bool(chunk)
+                yield chunk
+            self.complete = True
+        except (LLMError, TimeoutError) as e:
+            log.warning(f"AI request failed: {e}. Using placeholder.")
+        if not streamed:
+            yield "### Business Overview\n\n"
+            yield f"Current total weekly profit: **${self.metrics['totalWeeklyProfit']:.2f}**\n\n"
+            yield "No critical alerts at this time."
+
+def generate_business_overview_stream(metrics, products_data):
+    # An OverviewStream: iterate it for the chunks, then check .complete before caching the text
+    log.info("Generating business overview stream.")
+    return OverviewStream(metrics, products_data)
+
+@timed()
+def extract_web_data(products_data, query):
+    log.info(f"Extracting web data for query: '{query}'")
+    urls = urls_in(query)
+    if urls:
+        return extract_web_pages(products_data, urls)
+    product_json, _ = products_prompt_data(products_data)
+    prompt = (
+        f"Extract structured, publicly available web data for this query: {query}\n"
+        f"Summary of the products the business sells: {product_json}\n"
+        'Respond with JSON: {"headers": ["..."], "data": [[...]]}, including a source column.'
+    )
+    return ask_model_json(prompt, '', {
+        "headers": ["Item", "Price", "Source"],
+        "data": [
+            ["Example Item 1", 10.99, "Simulated Website A"],
+            ["Example Item 2", 24.50, "Simulated Website B"]
+        ]
+    })
+
+
+def extract_web_pages(products_data, urls):
+    # Pages are fetched concurrently through the on-disk HTTP cache; offers are matched to SKUs via the blocking index
+    products = as_product_collection(products_data)
+    results = get_web_fetcher().fetch_many(urls)
+    offers = [offer for result in results if result.ok for offer in extract_offers(result.text, result.url)]
+    index = products.memo('catalog_index', lambda: CatalogIndex(products.df['name']))
+    matched, scores = index.match([name for name, _, _ in offers])
+    names, prices = products.column('name'), products.column('sellingPrice')
+    data = []
+    for (name, price, source), position, score in zip(offers, matched, scores):
+        our_name, our_price = (names[position], float(prices[position])) if position >= 0 else (None, None)
+        data.append([name, price, source, our_name, our_price, round(float(score), 2)])
+    errors = [f"{result.url}: {result.error or f'HTTP {result.status}'}" for result in results if not result.ok]
+    return {"headers": ["Item", "Price", "Source", "Matched Product", "Our Price", "Match Score"], "data": data, "errors": errors}
+
+
+# FPDF Report Generation (translation from reportGenerator.ts)
+@timed()
+def generate_pdf_report(report_content, metrics, products, category_totals=None, path=None, max_workers=None, progress=None):
+    # Streams the full catalog to `path` (a temp file by default, see mspcc.report) and returns the path.
+    # Imported here so FPDF is only loaded when a report is actually rendered
+    from mspcc.report import write_pdf_report
+    return write_pdf_report(report_content, products, path=path, category_totals=category_totals, max_workers=max_workers,
+                            progress=progress)
@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+
+PRODUCT_FIELDS = ['id', 'name', 'purchasePrice', 'sellingPrice', 'unitsSoldWeek', 'category', 'stockLevel', 'supplier']
+METRIC_FIELDS = ['weeklyProfit', 'margin', 'weeklyRevenue']
+CALCULATED_FIELDS = PRODUCT_FIELDS + METRIC_FIELDS
+
+# Optional attributes come back as None (not NaN) to match the Product constructor defaults
+OPTIONAL_FIELDS = frozenset(['category', 'stockLevel', 'supplier'])
+
+# Compact in-memory layout of the product frame. float32 keeps prices exact to the cent
+# below $100,000; metrics that get summed stay float64. Integer columns whose values do
+# not fit 32 bits fall back to 64-bit.
+PRODUCT_SCHEMA = {
+    'id': 'int64',
+    'name': 'string[pyarrow]',
+    'purchasePrice': 'float32',
+    'sellingPrice': 'float32',
+    'unitsSoldWeek': 'int32',
+    'category': 'category',
+    'stockLevel': 'Int32',
+    'supplier': 'category',
+    'weeklyProfit': 'float64',
+    'margin': 'float32',
+    'weeklyRevenue': 'float64',
+}
+# Layout the frame had before the schema (untyped concat results), used by memory_report
+LEGACY_DTYPES = {field: ('object' if dtype in ('string[pyarrow]', 'category', 'Int32') else 'float64')
+                 for field, dtype in PRODUCT_SCHEMA.items()}
+
+
+def _int_dtype(column, dtype):
+    # Widen to 64-bit when values overflow int32, and switch to the nullable type when values are missing
+    values = pd.to_numeric(column, errors='coerce')
+    if values.notna().any() and (values.min() < np.iinfo(np.int32).min or values.max() > np.iinfo(np.int32).max):
+        dtype = dtype.replace('32', '64')
+    if values.isna().any():
+        dtype = dtype.capitalize()
+    return dtype
+
+
+def enforce_schema(df):
+    """Return ``df`` with its product columns cast to PRODUCT_SCHEMA; other columns are kept as they are."""
+    casts = {}
+    for field, dtype in PRODUCT_SCHEMA.items():
+        if field not in df.columns:
+            continue
+        column = df[field]
+        if dtype.lower().startswith('int'):
+            dtype = _int_dtype(column, dtype)
+        if column.dtype != dtype:
+            casts[field] = dtype
+    return df.astype(casts) if casts else df
+
+
+def concat_products(frames):
+    """Concatenate product frames without losing the schema.
+
+    pd.concat turns categoricals with different categories into object
+    columns, so the categories are unioned (existing ones first, keeping the
+    codes of the first frame valid) before concatenating.
+    """
+    frames = [enforce_schema(df) for df in frames]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    for field, dtype in PRODUCT_SCHEMA.items():
+        if dtype != 'category' or not all(field in df.columns for df in frames):
+            continue
+        categories = frames[0][field].cat.categories
+        for df in frames[1:]:
+            categories = categories.append(df[field].cat.categories.difference(categories))
+        frames = [df.assign(**{field: df[field].cat.set_categories(categories)}) for df in frames]
+    return enforce_schema(pd.concat(frames, ignore_index=True))
+
+
+def empty_products(columns=None):
+    return enforce_schema(pd.DataFrame(columns=columns or list(PRODUCT_SCHEMA)))
+
+
+def memory_report(df):
+    """Bytes per product column in the compact schema vs the untyped layout it replaces."""
+    rows = []
+    for field in df.columns:
+        column = df[field]
+        legacy = LEGACY_DTYPES.get(field)
+        if legacy == 'object':
+            legacy_bytes = column.astype(object).memory_usage(index=False, deep=True)
+        elif legacy is not None:
+            legacy_bytes = len(column) * np.dtype(legacy).itemsize
+        else:
+            legacy_bytes = column.memory_usage(index=False, deep=True)
+        rows.append({'column': field, 'dtype': str(column.dtype),
+                     'bytes': column.memory_usage(index=False, deep=True), 'legacyBytes': legacy_bytes})
+    report = pd.DataFrame(rows, columns=['column', 'dtype', 'bytes', 'legacyBytes'])
+    report.loc[len(report)] = ['total', '', report['bytes'].sum(), report['legacyBytes'].sum()]
+    report['savedPercent'] = (1 - report['bytes'] / report['legacyBytes'].where(report['legacyBytes'] > 0)).mul(100).round(1)
+    return report
+
+
+# --- Helper classes (mimicking TypeScript interfaces for type hinting) ---
+
+class Product:
+    def __init__(self, id, name, purchasePrice, sellingPrice, unitsSoldWeek, category=None, stockLevel=None, supplier=None):
+        self.id = id
+        self.name = name
+        self.purchasePrice = purchasePrice
+        self.sellingPrice = sellingPrice
+        self.unitsSoldWeek = unitsSoldWeek
+        self.category = category
+        self.stockLevel = stockLevel
+        self.supplier = supplier
+
+class CalculatedProduct(Product):
+    def __init__(self, id, name, purchasePrice, sellingPrice, unitsSoldWeek, weeklyProfit, margin, weeklyRevenue, category=None, stockLevel=None, supplier=None):
+        super().__init__(id, name, purchasePrice, sellingPrice, unitsSoldWeek, category, stockLevel, supplier)
+        self.weeklyProfit = weeklyProfit
+        self.margin = margin
+        self.weeklyRevenue = weeklyRevenue
+
+
+# --- Columnar product collection ---
+
+class ProductRow:
+    """Lazy, read-only view of one row of a ProductCollection.
+
+    Exposes the same attributes as CalculatedProduct without copying the row.
+    """
+    __slots__ = ('_collection', '_position')
+
+    def __init__(self, collection, position):
+        self._collection = collection
+        self._position = position
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in CALCULATED_FIELDS}
+
+    def __repr__(self):
+        return f"ProductRow(id={self.id!r}, name={self.name!r})"
+
+
+def _row_field(field):
+    def getter(self):
+        return self._collection._value(field, self._position)
+    return property(getter)
+
+for _field in CALCULATED_FIELDS:
+    setattr(ProductRow, _field, _row_field(_field))
+
+
+class ProductCollection:
+    """Sequence of products backed by the columns of a DataFrame.
+
+    Columns are converted to NumPy arrays on first access and rows are only
+    ever handed out as ProductRow views, so nothing is materialized per product.
+    """
+
+    def __init__(self, df, version=None):
+        self.df = df
+        self.version = version
+        self._columns = {}
+        self._memo = {}
+
+    def memo(self, key, build):
+        """Cache a value derived from this (immutable) collection."""
+        if key not in self._memo:
+            self._memo[key] = build()
+        return self._memo[key]
+
+    @classmethod
+    def from_products(cls, products):
+        records = [{field: getattr(p, field, None) for field in CALCULATED_FIELDS} for p in products]
+        return cls(pd.DataFrame.from_records(records, columns=CALCULATED_FIELDS))
+
+    def column(self, field):
+        values = self._columns.get(field)
+        if values is None:
+            if field in self.df.columns:
+                values = self.df[field].to_numpy()
+            else:
+                values = np.full(len(self.df), None, dtype=object)
+            self._columns[field] = values
+        return values
+
+    def _value(self, field, position):
+        value = self.column(field)[position]
+        if field in OPTIONAL_FIELDS and pd.isna(value):
+            return None
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __len__(self):
+        return len(self.df)
+
+    def __iter__(self):
+        for position in range(len(self.df)):
+            yield ProductRow(self, position)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return ProductCollection(self.df.iloc[item])
+        if item < 0:
+            item += len(self.df)
+        if not 0 <= item < len(self.df):
+            raise IndexError("product index out of range")
+        return ProductRow(self, item)
+
+    def __repr__(self):
+        return f"ProductCollection({len(self)} products)"
+
+
+def as_product_collection(products_data):
+    if isinstance(products_data, ProductCollection):
+        return products_data
+    if isinstance(products_data, pd.DataFrame):
+        return ProductCollection(products_data)
+    return ProductCollection.from_products(products_data)
@@ -0,0 +1,314 @@
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from fpdf import FPDF
+
+from mspcc.instrumentation import timed
+from mspcc.products import as_product_collection
+
+
+# Product rows per independently rendered part of the report
+ROWS_PER_PART = 5_000
+# Product rows listed in the report at most (the best by weekly profit). Merging keeps every part in
+# memory (about 27 MB per 100k rows), so this cap is what bounds it; category totals cover every product.
+MAX_DETAIL_ROWS = 100_000
+# Bars drawn in each summary chart
+CHART_BARS = 12
+
+# (field, header, width in mm, alignment)
+TABLE_COLUMNS = [
+    ('name', 'Name', 70, 'L'),
+    ('sellingPrice', 'Selling Price', 28, 'R'),
+    ('unitsSoldWeek', 'Units/Week', 24, 'R'),
+    ('weeklyProfit', 'Weekly Profit', 32, 'R'),
+    ('margin', 'Margin', 22, 'R'),
+]
+TABLE_FIELDS = [field for field, _, _, _ in TABLE_COLUMNS] + ['category']
+ROW_HEIGHT = 5
+
+
+def _latin1(text):
+    # The core PDF fonts only cover Latin-1
+    return str(text).encode('latin-1', 'replace').decode('latin-1')
+
+
+def _money(value):
+    return f"${value:,.2f}" if pd.notna(value) else "-"
+
+
+class ReportPDF(FPDF):
+    def __init__(self, title):
+        super().__init__()
+        self.report_title = _latin1(title)
+        self.section = ''
+        self.set_auto_page_break(True, margin=15)
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font("Arial", 'I', size=8)
+        self.cell(0, 8, _latin1(f"{self.report_title} - {self.section}"), 0, 0, 'C')
+
+    def heading(self, text, size=14):
+        self.set_font("Arial", 'B', size=size)
+        self.cell(0, 10, _latin1(text), ln=True)
+        self.set_font("Arial", size=10)
+
+    def paragraph(self, text):
+        self.set_font("Arial", size=10)
+        self.multi_cell(0, 5, _latin1(text))
+        self.ln(3)
+
+    def bar_chart(self, title, labels, values, width=180, bar_height=5):
+        """Horizontal bar chart drawn with PDF primitives (no image rendering)."""
+        self.heading(title, size=11)
+        self.set_font("Arial", size=8)
+        label_width = 55
+        scale = max((abs(v) for v in values), default=0) or 1
+        for label, value in zip(labels, values):
+            if self.get_y() + bar_height > self.page_break_trigger:
+                self.add_page()
+            y = self.get_y()
+            self.cell(label_width, bar_height, _latin1(label)[:34], 0, 0, 'L')
+            bar = (width - label_width - 30) * abs(value) / scale
+            self.set_fill_color(46, 125, 50) if value >= 0 else self.set_fill_color(198, 40, 40)
+            self.rect(self.get_x(), y + 1, bar, bar_height - 2, 'F')
+            self.set_x(self.get_x() + bar + 2)
+            self.cell(28, bar_height, _money(value), 0, 1, 'L')
+        self.ln(4)
+
+    def table_header(self):
+        self.set_font("Arial", 'B', size=8)
+        self.set_fill_color(230, 230, 230)
+        for _, header, width, _ in TABLE_COLUMNS:
+            self.cell(width, ROW_HEIGHT + 1, header, 1, 0, 'C', True)
+        self.ln()
+        self.set_font("Arial", size=8)
+
+    def product_rows(self, rows):
+        # Columns are formatted in bulk; the loop only places pre-formatted strings
+        cells = [
+            [_latin1(name)[:45] for name in rows['name'].astype(object).to_numpy()],
+            [_money(v) for v in rows['sellingPrice'].to_numpy(dtype=float, na_value=np.nan)],
+            [f"{v:,.0f}" if pd.notna(v) else "-" for v in rows['unitsSoldWeek'].to_numpy(dtype=float, na_value=np.nan)],
+            [_money(v) for v in rows['weeklyProfit'].to_numpy(dtype=float, na_value=np.nan)],
+            [f"{v:.1f}%" if np.isfinite(v) else "-" for v in rows['margin'].to_numpy(dtype=float, na_value=np.nan)],
+        ]
+        layout = [(width, align) for _, _, width, align in TABLE_COLUMNS]
+        for row in zip(*cells):
+            if self.get_y() + ROW_HEIGHT > self.page_break_trigger:
+                self.add_page()
+                self.table_header()
+            for (width, align), value in zip(layout, row):
+                self.cell(width, ROW_HEIGHT, value, 1, 0, align)
+            self.ln()
+
+
+def _draw_summary(pdf, report_content, charts):
+    pdf.section = "Summary"
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 10, txt=_latin1(report_content["reportTitle"]), ln=True, align='C')
+    pdf.cell(0, 10, txt=f"Report Date: {report_content['reportDate']}", ln=True, align='C')
+    pdf.ln(10)
+
+    pdf.heading("Executive Summary")
+    pdf.paragraph(report_content["executiveSummary"]["overview"])
+    for metric in report_content["executiveSummary"]["keyMetrics"]:
+        pdf.cell(0, 5, txt=_latin1(f"{metric['label']}: {metric['value']} ({metric['status']})"), ln=True)
+    pdf.ln(6)
+
+    for title, labels, values in charts:
+        if labels:
+            pdf.bar_chart(title, labels, values)
+
+    data_quality = report_content["dataQuality"]
+    pdf.heading("Data Quality")
+    pdf.paragraph(f"{data_quality['summary']} (Score: {data_quality['score']})")
+
+    market = report_content["marketAnalysis"]
+    pdf.heading("Market Analysis")
+    pdf.paragraph("Top performers: " + ", ".join(map(str, market["topPerformers"])))
+    pdf.paragraph("Under-performers: " + ", ".join(map(str, market["underPerformers"])))
+    pdf.paragraph("Opportunity gaps: " + ", ".join(map(str, market["opportunityGaps"])))
+
+    if report_content["strategicRecommendations"]:
+        pdf.heading("Strategic Recommendations")
+        for recommendation in report_content["strategicRecommendations"]:
+            pdf.paragraph(f"- {recommendation}")
+
+    pdf.heading("Conclusion")
+    pdf.paragraph(report_content["conclusion"])
+
+
+def _draw_products(pdf, sections):
+    for category, totals, rows, continued in sections:
+        pdf.section = f"Products: {category}"
+        pdf.add_page()
+        title = f"{category} (continued)" if continued else category
+        pdf.heading(title, size=12)
+        if not continued:
+            pdf.set_font("Arial", size=9)
+            listed = f" ({totals['listed']:,} listed)" if totals['listed'] < totals['products'] else ""
+            pdf.cell(0, 5, _latin1(f"{totals['products']:,} products{listed}, weekly profit {_money(totals['weeklyProfit'])}, "
+                                    f"weekly revenue {_money(totals['weeklyRevenue'])}"), ln=True)
+            pdf.ln(2)
+        pdf.table_header()
+        pdf.product_rows(rows)
+
+
+def _render_part(args):
+    path, title, kind, payload = args
+    pdf = ReportPDF(title)
+    if kind == 'summary':
+        _draw_summary(pdf, *payload)
+    else:
+        _draw_products(pdf, payload)
+    pdf.output(path, 'F')
+    return path
+
+
+def _plan_product_parts(products_df, rows_per_part, max_rows=MAX_DETAIL_ROWS):
+    """Split the catalog into (category, totals, rows, continued) sections of at most rows_per_part rows.
+
+    Only the ``max_rows`` products with the highest weekly profit are listed;
+    the totals still count every product.
+    """
+    table = products_df.reindex(columns=TABLE_FIELDS + ['weeklyRevenue'])
+    category = table['category'].astype(object).where(table['category'].notna(), 'Uncategorized')
+    table = table.assign(category=category).sort_values(['category', 'weeklyProfit'], ascending=[True, False], kind='stable')
+    totals = table.groupby('category', sort=False).agg(
+        products=('name', 'size'), weeklyProfit=('weeklyProfit', 'sum'), weeklyRevenue=('weeklyRevenue', 'sum'))
+    # Row-wise .loc would upcast the product count to float
+    if max_rows is not None and len(table) > max_rows:
+        listed = pd.to_numeric(table['weeklyProfit'], errors='coerce').fillna(-np.inf).nlargest(max_rows).index
+        table = table[table.index.isin(listed)]
+    listed = table['category'].value_counts()
+    totals = {name: {'products': int(products), 'listed': int(listed.get(name, 0)), 'weeklyProfit': profit,
+                     'weeklyRevenue': revenue}
+              for name, products, profit, revenue in totals.itertuples()}
+
+    parts, current, current_rows = [], [], 0
+    boundaries = table['category'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, boundaries[1:] != boundaries[:-1]])
+    ends = np.r_[starts[1:], len(table)]
+    for start, end in zip(starts, ends):
+        name = boundaries[start]
+        for chunk_start in range(start, end, rows_per_part):
+            chunk_end = min(end, chunk_start + rows_per_part)
+            if current_rows and current_rows + (chunk_end - chunk_start) > rows_per_part:
+                parts.append(current)
+                current, current_rows = [], 0
+            current.append((name, totals[name], table.iloc[chunk_start:chunk_end], chunk_start > start))
+            current_rows += chunk_end - chunk_start
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _summary_charts(products_df, category_totals):
+    charts = []
+    if category_totals is not None and not category_totals.empty:
+        top = category_totals.head(CHART_BARS)
+        labels = top.iloc[:, 0].astype(object).where(top.iloc[:, 0].notna(), 'Uncategorized').tolist()
+        charts.append(("Weekly Profit by Category", labels, top['weeklyProfit'].tolist()))
+    profit = pd.to_numeric(products_df['weeklyProfit'], errors='coerce')
+    top_products = products_df.loc[profit.nlargest(CHART_BARS).index]
+    charts.append(("Top Products by Weekly Profit", top_products['name'].astype(str).tolist(), top_products['weeklyProfit'].astype(float).tolist()))
+    return charts
+
+
+def _pool_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _merge(part_paths, path):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for part in part_paths:
+        writer.append(part)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    writer.close()
+
+
+@timed('report.write_pdf')
+def write_pdf_report(report_content, products_data, path=None, category_totals=None,
+                     rows_per_part=ROWS_PER_PART, max_workers=None, progress=None, max_detail_rows=MAX_DETAIL_ROWS):
+    """Write the full audit report to ``path`` (a new temp file by default) and return the path.
+
+    The summary and each block of up to ``rows_per_part`` product rows are
+    rendered as separate PDFs in worker processes, so no worker holds more
+    than one block, and are then merged in order. Small catalogs, or installs
+    without pypdf, are rendered in-process as a single document. The merge
+    (or single document) is held in memory, so memory grows with the listed
+    rows; at most ``max_detail_rows`` products are listed, the most
+    profitable first.
+
+    ``progress(fraction)`` is called as parts are rendered; if it raises
+    (e.g. a cancelled job), the remaining parts are dropped and the error
+    propagates.
+    """
+    products_df = as_product_collection(products_data).df
+    if path is not None:
+        return _write_report(report_content, products_df, path, category_totals, rows_per_part, max_workers, progress,
+                             max_detail_rows)
+    fd, path = tempfile.mkstemp(prefix='mspcc_report_', suffix='.pdf')
+    os.close(fd)
+    try:
+        return _write_report(report_content, products_df, path, category_totals, rows_per_part, max_workers, progress,
+                             max_detail_rows)
+    except BaseException:
+        # A cancelled or failed report must not leave its temp file behind
+        os.remove(path)
+        raise
+
+
+def _write_report(report_content, products_df, path, category_totals, rows_per_part, max_workers, progress, max_detail_rows):
+    title = report_content["reportTitle"]
+    summary = (report_content, _summary_charts(products_df, category_totals))
+    parts = _plan_product_parts(products_df, rows_per_part, max_detail_rows)
+
+    try:
+        import pypdf  # noqa: F401
+        can_merge = True
+    except ImportError:
+        can_merge = False
+
+    if len(parts) <= 1 or not can_merge:
+        pdf = ReportPDF(title)
+        _draw_summary(pdf, *summary)
+        for i, sections in enumerate(parts, start=1):
+            if progress is not None:
+                progress(i / (len(parts) + 1))
+            _draw_products(pdf, sections)
+        pdf.output(path, 'F')
+        return path
+
+    part_dir = tempfile.mkdtemp(prefix='mspcc_report_parts_')
+    jobs = [(os.path.join(part_dir, 'part-0000.pdf'), title, 'summary', summary)]
+    jobs += [(os.path.join(part_dir, f'part-{i:04d}.pdf'), title, 'products', sections) for i, sections in enumerate(parts, start=1)]
+    try:
+        part_paths = []
+        # Called from job threads: forking a threaded process can deadlock the children
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as pool:
+            try:
+                for part_path in pool.map(_render_part, jobs):
+                    part_paths.append(part_path)
+                    if progress is not None:
+                        # The merge is the last step
+                        progress(len(part_paths) / (len(jobs) + 1))
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+        _merge(part_paths, path)
+    finally:
+        for job in jobs:
+            if os.path.exists(job[0]):
+                os.remove(job[0])
+        os.rmdir(part_dir)
+    return path
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+from mspcc.instrumentation import timed
+from mspcc.products import as_product_collection
+
+
+# Default what-if grid, matching the simulator sliders: 0-50% discount x 0-200% sales lift
+DEFAULT_DISCOUNTS = np.arange(0, 51, dtype=float)
+DEFAULT_LIFTS = np.arange(0, 201, dtype=float)
+
+
+def _numeric(products, field):
+    return pd.to_numeric(products.df[field], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+
+class PromotionGrid:
+    """Simulated price, units and profit for every product over a discount x lift grid.
+
+    Profit is ``(price * (1 - d) - cost) * units * (1 + l)``. Only the
+    per-product price, cost and unit vectors are kept; one product's
+    surface, or the best discounts for one lift scenario, are computed when
+    asked for, so nothing of size products x grid is held.
+    """
+
+    def __init__(self, products, discounts=DEFAULT_DISCOUNTS, lifts=DEFAULT_LIFTS):
+        products = as_product_collection(products)
+        self.products = products
+        self.discounts = np.asarray(discounts, dtype=float)
+        self.lifts = np.asarray(lifts, dtype=float)
+
+        self.purchasePrice = _numeric(products, 'purchasePrice')
+        self.sellingPrice = _numeric(products, 'sellingPrice')
+        self.unitsSoldWeek = _numeric(products, 'unitsSoldWeek')
+        self.baseline_profit = (self.sellingPrice - self.purchasePrice) * self.unitsSoldWeek
+        # Last planner column, as (column, discount, profit); the slider asks for the same one on most reruns
+        self._table_column = None
+
+    def profit_surface(self, position):
+        """Simulated weekly profit of one product, shape (discounts, lifts)."""
+        unit_margin = self.sellingPrice[position] * (1 - self.discounts / 100) - self.purchasePrice[position]
+        simulated_units = self.unitsSoldWeek[position] * (1 + self.lifts / 100)
+        return unit_margin[:, None] * simulated_units[None, :]
+
+    def total_profit(self):
+        """Catalog-wide simulated weekly profit, shape (discounts, lifts)."""
+        # sum((p * (1 - d) - c) * u) = (1 - d) * sum(p * u) - sum(c * u)
+        margin_volume = (1 - self.discounts / 100) * (self.sellingPrice @ self.unitsSoldWeek) - self.purchasePrice @ self.unitsSoldWeek
+        return margin_volume[:, None] * (1 + self.lifts / 100)[None, :]
+
+    def best_discounts(self, positions=None, lifts=None):
+        """Profit-maximizing grid discount for the products at ``positions`` (default: all) in each lift scenario.
+
+        A lift scenario ``l`` means the deepest discount on the grid lifts sales
+        by ``l`` percent and shallower discounts proportionally less. Profit is
+        then concave in the discount, so the best grid point is one of the two
+        neighbours of the closed-form optimum; nothing of size
+        products x discounts is ever allocated.
+
+        Returns ``(discount, profit)`` arrays of shape (products, lifts).
+        """
+        positions = slice(None) if positions is None else np.asarray(positions)
+        lifts = self.lifts if lifts is None else np.asarray(lifts, dtype=float)
+        return self._solve_best_discounts(self.sellingPrice[positions], self.purchasePrice[positions],
+                                          self.unitsSoldWeek[positions], lifts)
+
+    def _solve_best_discounts(self, price, cost, units, lifts):
+        d = self.discounts / 100
+        if len(d) == 0 or d.max() <= 0:
+            best = np.zeros((len(price), len(lifts)))
+            profit = ((price - cost) * units)[:, None] * np.ones_like(best)
+            return best, profit
+
+        slope = (lifts / 100 / d.max())[None, :]
+        p = price[:, None]
+        c = cost[:, None]
+        u = units[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            optimum = (slope * (p - c) - p) / (2 * slope * p)
+        optimum = np.nan_to_num(optimum, nan=0.0, posinf=d.max(), neginf=0.0)
+
+        order = np.argsort(d)
+        sorted_d = d[order]
+        upper = np.clip(np.searchsorted(sorted_d, optimum), 0, len(d) - 1)
+        lower = np.clip(upper - 1, 0, len(d) - 1)
+
+        def profit_at(index):
+            discount = sorted_d[index]
+            return u * (1 + slope * discount) * (p * (1 - discount) - c)
+
+        lower_profit, upper_profit = profit_at(lower), profit_at(upper)
+        pick_upper = upper_profit > lower_profit
+        best_index = np.where(pick_upper, upper, lower)
+        return sorted_d[best_index] * 100, np.where(pick_upper, upper_profit, lower_profit)
+
+    def best_discount_table(self, lift):
+        """Per-product best discount for the lift scenario nearest ``lift``."""
+        column = int(np.abs(self.lifts - lift).argmin())
+        if self._table_column is None or self._table_column[0] != column:
+            best_discount, best_profit = self.best_discounts(lifts=self.lifts[column:column + 1])
+            self._table_column = (column, best_discount[:, 0], best_profit[:, 0])
+        _, best_discount, best_profit = self._table_column
+        table = self.products.df[['id', 'name']].copy()
+        table['baselineProfit'] = self.baseline_profit
+        table['bestDiscount'] = best_discount
+        table['bestProfit'] = best_profit
+        table['profitUplift'] = table['bestProfit'] - table['baselineProfit']
+        return table
+
+
+@timed('simulator.promotion_grid')
+def simulate_promotion_grid(products_data, discounts=DEFAULT_DISCOUNTS, lifts=DEFAULT_LIFTS):
+    return PromotionGrid(products_data, discounts, lifts)
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialised
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+
+DEFAULT_STORE_DIR = os.environ.get('MSPCC_DATA_DIR', '.mspcc_data')
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = 'manifest.lock'
+# Segments are merged into one file once there are more than this many
+COMPACT_SEGMENTS = 32
+# Rows with the same values in these columns replace each other; compaction keeps the last one
+KEY_COLUMNS = ('id', 'week')
+
+
+class DatasetStore:
+    """Append-only product store of Arrow IPC segment files on local disk.
+
+    Every append writes one new segment and atomically swaps the manifest, so
+    readers (other sessions or server processes) never see a partial write.
+    Segments are memory-mapped when read. Later rows supersede earlier ones
+    with the same KEY_COLUMNS, which is all compaction drops.
+
+    Writers serialise on an OS file lock (see ``locked``), so several
+    processes, or several stores on the same directory, can append safely.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_DIR):
+        self.path = path
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def locked(self):
+        """Hold the store's write lock: no other thread or process can change the manifest meanwhile.
+
+        Re-entrant within a thread, so a caller can read the manifest, decide
+        what to write and ``append`` it in one critical section.
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(self._file(LOCK_FILE), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def manifest(self):
+        try:
+            with open(self._file(MANIFEST_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': 0, 'next_product_id': 1, 'segments': []}
+
+    def _write_manifest(self, manifest):
+        tmp = self._file(f'{MANIFEST_FILE}.{uuid.uuid4().hex}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._file(MANIFEST_FILE))
+
+    def _write_segment(self, table):
+        name = f'segment-{uuid.uuid4().hex}.arrow'
+        with pa.OSFile(self._file(name), 'wb') as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return name
+
+    def read_segment(self, name):
+        with pa.memory_map(self._file(name), 'r') as source:
+            return ipc.open_file(source).read_all()
+
+    def append(self, table, next_product_id):
+        """Add ``table`` as a new segment and return the new manifest.
+
+        Callers that allocated product ids from the manifest must hold
+        ``locked()`` from reading it until this returns.
+        """
+        with self.locked():
+            manifest = self.manifest()
+            manifest['segments'].append(self._write_segment(table))
+            manifest['version'] += 1
+            manifest['next_product_id'] = max(manifest['next_product_id'], next_product_id)
+            self._write_manifest(manifest)
+            return manifest
+
+    def compact_if_needed(self):
+        """Merge the segments into one once there are more than COMPACT_SEGMENTS; returns whether it did."""
+        if len(self.manifest()['segments']) <= COMPACT_SEGMENTS:
+            return False
+        with self.locked():
+            manifest = self.manifest()
+            if len(manifest['segments']) <= COMPACT_SEGMENTS:
+                return False
+            self._compact(manifest)
+            return True
+
+    def _compact(self, manifest):
+        old_segments = manifest['segments']
+        tables = [_decode_dictionaries(self.read_segment(name)) for name in old_segments]
+        merged = pa.concat_tables(tables, promote_options='permissive').combine_chunks()
+        merged = merged.filter(pa.array(_last_per_key(merged)))
+        # Segments replaced by the previous compaction; readers have had a whole compaction cycle to move on
+        expired = manifest.get('compacted', {}).get('from', [])
+        manifest['segments'] = [self._write_segment(merged)]
+        # Readers that applied every merged segment swap them for the new one instead of reloading.
+        # The merged files stay until the next compaction, as readers may still hold the old manifest.
+        manifest['compacted'] = {'into': manifest['segments'][0], 'from': old_segments}
+        self._write_manifest(manifest)
+        for name in expired:
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+
+
+def _decode_dictionaries(table):
+    # Segments written at different times may dictionary-encode a column or not; concat needs one type
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+
+def _last_per_key(table):
+    if not all(name in table.column_names for name in KEY_COLUMNS):
+        return np.ones(table.num_rows, dtype=bool)
+    keys = pd.DataFrame({name: table.column(name).to_numpy() for name in KEY_COLUMNS})
+    return ~keys.duplicated(keep='last').to_numpy()
+
@@ -0,0 +1,37 @@
+import time
+
+
+# Redraws per second while a response streams in
+REDRAW_RATE = 10
+
+
+def render_stream(chunks, container, redraw_rate=REDRAW_RATE, clock=time.monotonic):
+    """Render streamed Markdown into a Streamlit container and return the full text.
+
+    Finished paragraphs are written once into their own element; only the
+    paragraph still being streamed is redrawn, at most ``redraw_rate`` times a
+    second. Each update therefore carries the current paragraph rather than the
+    whole text accumulated so far.
+    """
+    paragraphs = []
+    tail = ''
+    live = container.empty()
+    last_draw = None
+    for chunk in chunks:
+        tail += chunk
+        if '\n\n' in tail:
+            *finished, tail = tail.split('\n\n')
+            for paragraph in finished:
+                if paragraph.strip():
+                    live.markdown(paragraph)
+                    paragraphs.append(paragraph)
+                    live = container.empty()
+            last_draw = None
+        now = clock()
+        if tail and (last_draw is None or now - last_draw >= 1 / redraw_rate):
+            live.markdown(tail)
+            last_draw = now
+    if tail.strip():
+        live.markdown(tail)
+        paragraphs.append(tail)
+    return '\n\n'.join(paragraphs)
@@ -0,0 +1,273 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from mspcc.products import CALCULATED_FIELDS, PRODUCT_SCHEMA, empty_products
+
+
+INITIAL_CAPACITY = 1024
+# Name columns are stored as a list of Arrow chunks; merged once there are more than this many
+MAX_STRING_CHUNKS = 64
+# Spelled out rather than \s so Arrow (RE2) and Python agree on what counts as whitespace
+WHITESPACE = r'[ \t\n\r\f]+'
+
+
+def product_key(names):
+    """Stable upsert key for product names: trimmed, case-folded, inner whitespace collapsed."""
+    names = pd.Series(names, dtype='string[pyarrow]')
+    return names.str.casefold().str.replace(WHITESPACE, ' ', regex=True).str.strip(' ')
+
+
+def _name_key(name):
+    # Scalar twin of product_key for single lookups
+    return re.sub(WHITESPACE, ' ', str(name).casefold()).strip(' ')
+
+
+def _readonly(values):
+    values.flags.writeable = False
+    return values
+
+
+class _NumericColumn:
+    def __init__(self, dtype, capacity):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.shared = False
+
+    def _own(self):
+        # Snapshots handed out so far view the buffer; copy before writing into rows they can see
+        if self.shared:
+            self.data = self.data.copy()
+            self.shared = False
+
+    def _values(self, values):
+        values = np.asarray(values)
+        if np.result_type(values.dtype, self.data.dtype) != self.data.dtype:
+            self.data = self.data.astype(np.result_type(values.dtype, self.data.dtype))
+            self.shared = False
+        return values
+
+    def grow(self, capacity):
+        grown = np.zeros(capacity, dtype=self.data.dtype)
+        grown[:len(self.data)] = self.data
+        self.data = grown
+        self.shared = False
+
+    def write(self, start, series):
+        self.data[start:start + len(series)] = self._values(series.to_numpy())
+
+    def update(self, positions, series):
+        values = self._values(series.to_numpy())
+        self._own()
+        self.data[positions] = values
+
+    def view(self, size):
+        self.shared = True
+        return _readonly(self.data[:size])
+
+
+class _NullableIntColumn(_NumericColumn):
+    def __init__(self, dtype, capacity):
+        super().__init__(dtype.lower(), capacity)
+        self.mask = np.ones(capacity, dtype=bool)
+
+    def _own(self):
+        if self.shared:
+            self.mask = self.mask.copy()
+        super()._own()
+
+    def grow(self, capacity):
+        mask = np.ones(capacity, dtype=bool)
+        mask[:len(self.mask)] = self.mask
+        self.mask = mask
+        super().grow(capacity)
+
+    def write(self, start, series):
+        array = series.array
+        self.data[start:start + len(series)] = self._values(array.to_numpy(dtype=array.dtype.numpy_dtype, na_value=0))
+        self.mask[start:start + len(series)] = array.isna()
+
+    def update(self, positions, series):
+        array = series.array
+        values = self._values(array.to_numpy(dtype=array.dtype.numpy_dtype, na_value=0))
+        self._own()
+        self.data[positions] = values
+        self.mask[positions] = array.isna()
+
+    def view(self, size):
+        self.shared = True
+        return pd.arrays.IntegerArray(_readonly(self.data[:size]), _readonly(self.mask[:size]))
+
+
+class _CategoryColumn:
+    """Codes buffer plus an append-only category list, so existing codes never change."""
+
+    def __init__(self, dtype, capacity):
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.categories = []
+        self._code_of = {}
+        self.shared = False
+
+    def _codes(self, series):
+        codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=True)
+        mapping = np.empty(len(uniques) + 1, dtype=np.int32)
+        mapping[-1] = -1
+        for i, value in enumerate(uniques):
+            code = self._code_of.get(value)
+            if code is None:
+                code = self._code_of[value] = len(self.categories)
+                self.categories.append(value)
+            mapping[i] = code
+        return mapping[codes]
+
+    def grow(self, capacity):
+        grown = np.full(capacity, -1, dtype=np.int32)
+        grown[:len(self.codes)] = self.codes
+        self.codes = grown
+        self.shared = False
+
+    def write(self, start, series):
+        self.codes[start:start + len(series)] = self._codes(series)
+
+    def update(self, positions, series):
+        codes = self._codes(series)
+        if self.shared:
+            self.codes = self.codes.copy()
+            self.shared = False
+        self.codes[positions] = codes
+
+    def view(self, size):
+        self.shared = True
+        return pd.Categorical.from_codes(self.codes[:size], dtype=pd.CategoricalDtype(pd.Index(self.categories)))
+
+
+class _StringColumn:
+    """Arrow string chunks; appending adds a chunk, so existing chunks are never copied."""
+
+    def __init__(self, dtype, capacity):
+        self.chunks = []
+
+    def grow(self, capacity):
+        pass
+
+    def _array(self, series):
+        return pa.array(series.astype('string[pyarrow]').array, type=pa.large_string())
+
+    def write(self, start, series):
+        self.chunks.append(self._array(series))
+        if len(self.chunks) > MAX_STRING_CHUNKS:
+            self.chunks = [pa.concat_arrays(self.chunks)]
+
+    def update(self, positions, series):
+        # Arrow arrays are immutable: rebuild the column with the replaced values (updates only)
+        column = pa.concat_arrays(self.chunks) if self.chunks else pa.array([], type=pa.large_string())
+        mask = np.zeros(len(column), dtype=bool)
+        mask[positions] = True
+        order = np.argsort(positions, kind='stable')
+        replacements = self._array(series).take(pa.array(order))
+        self.chunks = [pc.replace_with_mask(column, pa.array(mask), replacements)]
+
+    def view(self, size):
+        chunked = pa.chunked_array(self.chunks, type=pa.large_string())
+        return pd.arrays.ArrowStringArray(chunked.slice(0, size))
+
+
+def _column_for(dtype, capacity):
+    if dtype == 'category':
+        return _CategoryColumn(dtype, capacity)
+    if dtype == 'string[pyarrow]':
+        return _StringColumn(dtype, capacity)
+    if dtype[0].isupper():
+        return _NullableIntColumn(dtype, capacity)
+    return _NumericColumn(dtype, capacity)
+
+
+class ProductTable:
+    """Growable columnar storage for the product catalog, with hash indexes by id and name.
+
+    Column buffers double their capacity when full, so appending a batch
+    costs O(batch) amortized instead of copying the whole frame. ``frame()``
+    returns a read-only DataFrame over the filled part of the buffers; rows
+    are updated copy-on-write, so a frame handed out earlier never changes.
+    Row positions are stable and double as the frame's index labels.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.size = 0
+        self.capacity = capacity
+        self._columns = {field: _column_for(PRODUCT_SCHEMA[field], capacity) for field in CALCULATED_FIELDS}
+        self._by_id = {}
+        self._by_key = {}
+        self._frame = None
+
+    def __len__(self):
+        return self.size
+
+    # --- Lookups (O(1) per product) ---
+
+    def position_of_id(self, product_id):
+        return self._by_id.get(product_id)
+
+    def position_of_name(self, name):
+        return self._by_key.get(_name_key(name))
+
+    def positions_of_ids(self, ids):
+        """Row positions for ``ids``; -1 where the id is unknown."""
+        return np.fromiter((self._by_id.get(i, -1) for i in ids), dtype=np.int64, count=len(ids))
+
+    def positions_of_keys(self, keys):
+        return np.fromiter((self._by_key.get(k, -1) for k in keys), dtype=np.int64, count=len(keys))
+
+    # --- Writes ---
+
+    def _reserve(self, size):
+        if size <= self.capacity:
+            return
+        capacity = max(size, self.capacity * 2)
+        for column in self._columns.values():
+            column.grow(capacity)
+        self.capacity = capacity
+
+    def append(self, batch):
+        """Append rows (with ids) and return their positions."""
+        start = self.size
+        self._reserve(start + len(batch))
+        for field, column in self._columns.items():
+            column.write(start, batch[field].reset_index(drop=True))
+        self.size += len(batch)
+        positions = np.arange(start, self.size)
+        self._index(batch, positions)
+        self._frame = None
+        return positions
+
+    def update(self, positions, batch):
+        """Overwrite the rows at ``positions`` with ``batch`` (same order)."""
+        if not len(positions):
+            return
+        positions = np.asarray(positions)
+        old_keys = product_key(self._columns['name'].view(self.size).take(positions))
+        for key in old_keys:
+            self._by_key.pop(key, None)
+        for field, column in self._columns.items():
+            column.update(positions, batch[field].reset_index(drop=True))
+        self._index(batch, positions)
+        self._frame = None
+
+    def _index(self, batch, positions):
+        self._by_id.update(zip(batch['id'].tolist(), positions.tolist()))
+        self._by_key.update(zip(product_key(batch['name']).tolist(), positions.tolist()))
+
+    def rows(self, positions):
+        return self.frame().iloc[positions]
+
+    def frame(self):
+        """Snapshot DataFrame of the table, cached until the next write."""
+        if self._frame is None:
+            if self.size == 0:
+                self._frame = empty_products(CALCULATED_FIELDS)
+            else:
+                self._frame = pd.DataFrame({field: column.view(self.size) for field, column in self._columns.items()},
+                                           copy=False)
+        return self._frame
@@ -0,0 +1,548 @@
+import asyncio
+import hashlib
+import ipaddress
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+
+import numpy as np
+import pandas as pd
+
+from mspcc.instrumentation import span
+from mspcc.table import product_key
+
+
+HTTP_CACHE_DIR = os.environ.get('MSPCC_HTTP_CACHE_DIR', '.mspcc_http_cache')
+# Freshness for responses that carry no Cache-Control max-age or Expires header
+DEFAULT_TTL_SECONDS = 60 * 60
+MAX_CONNECTIONS = 32
+MAX_PER_HOST = 4
+MAX_RETRIES = 2
+BACKOFF_SECONDS = 0.5
+REQUEST_TIMEOUT_SECONDS = 30
+# Larger bodies are truncated (and not cached); product pages are far smaller
+MAX_BODY_BYTES = 5 * 2**20
+READ_CHUNK_BYTES = 64 * 2**10
+USER_AGENT = 'mspcc-dashboard/1.0'
+# Response headers kept with a cache entry, as a 304 that omits them leaves them in force
+CACHE_HEADERS = ('cache-control', 'expires')
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = frozenset([301, 302, 303, 307, 308])
+
+URL = re.compile(r"https?://[^\s'\"<>]+")
+
+
+class WebFetchError(RuntimeError):
+    pass
+
+
+class FetchResult:
+    """Outcome of fetching one URL; ``error`` is set instead of ``text`` when it failed."""
+
+    def __init__(self, url, status=None, text=None, from_cache=False, error=None):
+        self.url = url
+        self.status = status
+        self.text = text
+        self.from_cache = from_cache
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None and self.status == 200
+
+    def __repr__(self):
+        return f"FetchResult({self.url!r}, status={self.status}, from_cache={self.from_cache}, error={self.error!r})"
+
+
+def urls_in(text):
+    """URLs written out in a query, in order, without duplicates or trailing punctuation."""
+    return list(dict.fromkeys(url.rstrip('.,;:)]') for url in URL.findall(text or '')))
+
+
+def _decode(body, content_type):
+    charset = re.search(r"charset=([\w-]+)", content_type or '')
+    try:
+        return body.decode(charset.group(1) if charset else 'utf-8', errors='replace')
+    except LookupError:
+        return body.decode('utf-8', errors='replace')
+
+
+# --- On-disk HTTP cache ---
+
+def _expires(headers, default_ttl, now):
+    """Expiry time for a response (lower-cased header names), or None when it must not be stored."""
+    cache_control = headers.get('cache-control', '').lower()
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return now
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    if max_age:
+        return now + int(max_age.group(1))
+    if 'expires' in headers:
+        try:
+            return parsedate_to_datetime(headers['expires']).timestamp()
+        except (TypeError, ValueError):
+            return now
+    return now + default_ttl
+
+
+class HTTPCache:
+    """On-disk cache of successful GET responses, keyed by URL.
+
+    Fresh entries (Cache-Control max-age or Expires, else ``default_ttl``)
+    are served without a request. Stale entries with an ETag or
+    Last-Modified are revalidated with a conditional request, and a 304
+    renews them. Files are replaced atomically, so concurrent processes can
+    share the directory.
+    """
+
+    def __init__(self, path=HTTP_CACHE_DIR, default_ttl=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.default_ttl = default_ttl
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, url, suffix):
+        return os.path.join(self.path, hashlib.sha256(url.encode('utf-8')).hexdigest() + suffix)
+
+    def _write(self, file, data):
+        tmp = f"{file}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, file)
+
+    def get(self, url):
+        """``(entry, body)`` stored for ``url``, or ``(None, None)``."""
+        try:
+            with open(self._file(url, '.json'), encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(self._file(url, '.body'), 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if entry.get('url') != url or len(body) != entry.get('length'):
+            # Hash collision, or a body written by another process after this entry
+            return None, None
+        return entry, body
+
+    @staticmethod
+    def fresh(entry):
+        return entry['expires'] > time.time()
+
+    @staticmethod
+    def validators(entry):
+        """Conditional request headers for revalidating ``entry``."""
+        headers = {}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry.get('lastModified'):
+            headers['If-Modified-Since'] = entry['lastModified']
+        return headers
+
+    def store(self, url, headers, body):
+        now = time.time()
+        expires = _expires(headers, self.default_ttl, now)
+        if expires is None:
+            return
+        entry = {'url': url, 'fetched': now, 'expires': expires, 'length': len(body),
+                 'etag': headers.get('etag'), 'lastModified': headers.get('last-modified'),
+                 'contentType': headers.get('content-type', ''),
+                 'cacheHeaders': {name: headers[name] for name in CACHE_HEADERS if name in headers}}
+        # Body first: an entry is only trusted once its body length matches
+        self._write(self._file(url, '.body'), body)
+        self._write(self._file(url, '.json'), json.dumps(entry).encode('utf-8'))
+
+    def renew(self, url, entry, headers):
+        # A 304 only carries the headers that changed; the stored response's caching headers still apply
+        headers = {**entry.get('cacheHeaders', {}), **headers}
+        expires = _expires(headers, self.default_ttl, time.time())
+        if expires is None:
+            return
+        entry = dict(entry, expires=expires, etag=headers.get('etag', entry.get('etag')),
+                     cacheHeaders={name: headers[name] for name in CACHE_HEADERS if name in headers})
+        self._write(self._file(url, '.json'), json.dumps(entry).encode('utf-8'))
+
+
+# --- Fetcher ---
+
+def _blocked_address(address):
+    """Whether ``address`` is loopback, link-local, private or otherwise not a public internet host."""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return not ip.is_global or ip.is_multicast
+
+
+def _public_resolver():
+    import aiohttp
+
+    class PublicResolver(aiohttp.ThreadedResolver):
+        # Checked again when connecting: a name may resolve differently than when the URL was checked
+        async def resolve(self, host, *args, **kwargs):
+            hosts = await super().resolve(host, *args, **kwargs)
+            if any(_blocked_address(entry['host']) for entry in hosts):
+                raise OSError(f"{host} resolves to a private or local address")
+            return hosts
+
+    return PublicResolver()
+
+
+async def _read_body(response):
+    """The response body up to MAX_BODY_BYTES, read to EOF; returns ``(body, complete)``."""
+    # content.read(n) returns whatever is buffered, which for large pages is a fraction of the body
+    chunks, size = [], 0
+    async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+        chunks.append(chunk[:MAX_BODY_BYTES - size])
+        size += len(chunks[-1])
+        if size >= MAX_BODY_BYTES:
+            return b''.join(chunks), response.content.at_eof()
+    return b''.join(chunks), True
+
+
+class WebFetcher:
+    """Concurrent, cached HTTP GETs on a pooled aiohttp session.
+
+    Like LLMClient, requests run on a private asyncio loop in a background
+    thread. The connector caps connections overall and per host; identical
+    in-flight URLs are coalesced, and failed requests (connection errors,
+    timeouts, 5xx) are retried with exponential backoff.
+
+    URLs come from users, so unless ``allow_private`` is set only public
+    hosts are fetched: URLs and redirects whose host is (or resolves to) a
+    loopback, link-local or private address are refused.
+    """
+
+    def __init__(self, cache=None, max_connections=MAX_CONNECTIONS, max_per_host=MAX_PER_HOST,
+                 max_retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS, timeout=REQUEST_TIMEOUT_SECONDS,
+                 allow_private=False):
+        self.cache = cache
+        self.allow_private = allow_private
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self._session = None
+        self._inflight = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='web-fetcher', daemon=True)
+        self._thread.start()
+
+    def _session_for_loop(self):
+        # Imported lazily: only web extraction needs aiohttp, and the session must be created on the fetcher's loop
+        if self._session is None:
+            import aiohttp
+            resolver = None if self.allow_private else _public_resolver()
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_per_host, resolver=resolver)
+            self._session = aiohttp.ClientSession(connector=connector, headers={'User-Agent': USER_AGENT},
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _check_public(self, url):
+        if self.allow_private:
+            return
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise WebFetchError(f"{url} is not an http(s) URL")
+        try:
+            addresses = await self._loop.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                                     type=socket.SOCK_STREAM)
+        except OSError as e:
+            raise WebFetchError(f"{url}: cannot resolve {parts.hostname}: {e}") from e
+        if any(_blocked_address(address[4][0]) for address in addresses):
+            raise WebFetchError(f"{url} points to a private or local address; only public hosts are fetched")
+
+    async def _request(self, url, request_headers):
+        # Redirects are followed here rather than by aiohttp so every hop is checked like the first URL
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers, body, complete = await self._request_once(url, request_headers)
+            location = headers.get('location')
+            if status not in REDIRECT_STATUSES or not location:
+                return status, headers, body, complete
+            url = urllib.parse.urljoin(url, location)
+            # Cache validators belong to the original URL
+            request_headers = {}
+            await self._check_public(url)
+        raise WebFetchError(f"{url}: more than {MAX_REDIRECTS} redirects")
+
+    async def _request_once(self, url, request_headers):
+        import aiohttp
+        session = self._session_for_loop()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.get(url, headers=request_headers, allow_redirects=False) as response:
+                    if response.status < 500 or attempt == self.max_retries:
+                        headers = {name.lower(): value for name, value in response.headers.items()}
+                        body, complete = await _read_body(response)
+                        return response.status, headers, body, complete
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise WebFetchError(f"{url} failed after {attempt + 1} attempts: {e or type(e).__name__}") from e
+                error = e
+            # Exponential backoff with jitter
+            await asyncio.sleep(self.backoff_seconds * (2 ** attempt) * (0.5 + random.random()))
+        raise WebFetchError(f"{url} failed: {error}")
+
+    async def _fetch(self, url):
+        await self._check_public(url)
+        entry, body = self.cache.get(url) if self.cache is not None else (None, None)
+        if entry is not None and HTTPCache.fresh(entry):
+            return FetchResult(url, 200, _decode(body, entry['contentType']), from_cache=True)
+        with span('web.fetch'):
+            status, headers, new_body, complete = await self._request(url, HTTPCache.validators(entry))
+        if status == 304 and entry is not None:
+            self.cache.renew(url, entry, headers)
+            return FetchResult(url, 200, _decode(body, entry['contentType']), from_cache=True)
+        if status == 200 and complete and self.cache is not None:
+            self.cache.store(url, headers, new_body)
+        return FetchResult(url, status, _decode(new_body, headers.get('content-type')))
+
+    async def afetch(self, url):
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        try:
+            return await asyncio.shield(task)
+        except WebFetchError as e:
+            return FetchResult(url, error=str(e))
+
+    async def _gather(self, urls):
+        return await asyncio.gather(*(self.afetch(url) for url in urls))
+
+    def fetch_many(self, urls, timeout=None):
+        """Fetch ``urls`` concurrently; returns a FetchResult per URL, in order."""
+        if not urls:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._gather(list(urls)), self._loop)
+        return future.result(timeout if timeout is not None else self.timeout * (self.max_retries + 1))
+
+    def fetch(self, url, timeout=None):
+        return self.fetch_many([url], timeout)[0]
+
+    def close(self):
+        """Close the session and stop the loop thread; waits so the session is closed on return."""
+        async def shutdown():
+            if self._session is not None:
+                await self._session.close()
+            self._loop.call_soon(self._loop.stop)
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(self.timeout)
+        self._thread.join(self.timeout)
+        self._loop.close()
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_web_fetcher():
+    """Process-wide fetcher with the on-disk cache, created on first use."""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = WebFetcher(HTTPCache())
+        return _default_fetcher
+
+
+# --- Offer extraction ---
+
+PRICE = re.compile(r"[$£€]\s?(\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?)")
+BLOCK_TAGS = frozenset(['p', 'div', 'li', 'tr', 'td', 'th', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'article', 'section', 'br', 'span'])
+MAX_NAME_CHARS = 200
+
+
+class _PageParser(HTMLParser):
+    """Collects JSON-LD scripts and the page text split into blocks."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.json_ld = []
+        self.blocks = []
+        self._text = []
+        self._script = None
+        self._skip = 0
+
+    def _flush(self):
+        text = ' '.join(''.join(self._text).split())
+        if text:
+            self.blocks.append(text)
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'script':
+            self._script = [] if dict(attrs).get('type') == 'application/ld+json' else None
+            self._skip += 1
+        elif tag == 'style':
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            if tag == 'script' and self._script is not None:
+                self.json_ld.append(''.join(self._script))
+                self._script = None
+            self._skip = max(self._skip - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script.append(data)
+        elif not self._skip:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _price(value):
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+
+
+def _json_ld_offers(node, found):
+    if isinstance(node, list):
+        for item in node:
+            _json_ld_offers(item, found)
+        return
+    if not isinstance(node, dict):
+        return
+    types = node.get('@type')
+    types = types if isinstance(types, list) else [types]
+    if 'Product' in types and node.get('name'):
+        offers = node.get('offers')
+        offers = offers if isinstance(offers, list) else [offers]
+        for offer in offers:
+            if isinstance(offer, dict):
+                price = _price(offer.get('price', offer.get('lowPrice')))
+                if price is not None:
+                    found.append((str(node['name']), price))
+                    break
+    for key in ('@graph', 'itemListElement', 'item'):
+        if key in node:
+            _json_ld_offers(node[key], found)
+
+
+def extract_offers(page, source):
+    """``(item, price, source)`` offers found on a page.
+
+    Structured data (schema.org Product JSON-LD) is used when the page has
+    it; otherwise every text block with a price is an offer, named by the
+    text before the price or, failing that, the block above it.
+    """
+    parser = _PageParser()
+    parser.feed(page)
+    parser.close()
+    found = []
+    for script in parser.json_ld:
+        try:
+            _json_ld_offers(json.loads(script), found)
+        except ValueError:
+            continue
+    if not found:
+        previous = ''
+        for block in parser.blocks:
+            match = PRICE.search(block)
+            if match:
+                name = block[:match.start()].strip(' -:|') or previous
+                if re.search(r"[^\W\d_]{2}", name):
+                    found.append((name[:MAX_NAME_CHARS], _price(match.group(1))))
+            previous = block
+    return [(name, price, source) for name, price in found]
+
+
+# --- Catalog matching ---
+
+# Blocks (tokens or token prefixes) shared by more products than this are too common to narrow anything down
+MAX_BLOCK_SIZE = 5_000
+# Candidates scored per item, taken in order of blocks shared
+MAX_CANDIDATES = 50
+PREFIX_CHARS = 4
+MATCH_THRESHOLD = 0.5
+TOKEN = r"[^\W_]+"
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a, b):
+    # Jaccard similarity of the names' character trigrams
+    a, b = _trigrams(a), _trigrams(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class CatalogIndex:
+    """Blocking index over product names for matching scraped items to SKUs.
+
+    Names are normalized with product_key and indexed by their tokens and
+    token prefixes. An item is only scored (trigram similarity) against the
+    products sharing its most selective blocks, so matching costs
+    O(items x MAX_CANDIDATES) instead of O(items x catalog).
+    """
+
+    def __init__(self, names):
+        self.keys = product_key(names).fillna('').reset_index(drop=True)
+        tokens = self.keys.str.findall(TOKEN).explode().dropna()
+        tokens = tokens[tokens.str.len() > 1]
+        prefixes = tokens[tokens.str.len() > PREFIX_CHARS].str[:PREFIX_CHARS]
+        blocks = pd.concat([tokens, '~' + prefixes])
+        codes, uniques = pd.factorize(blocks.to_numpy(dtype=object))
+        positions = blocks.index.to_numpy(dtype=np.int64)
+        # CSR postings: products of block b are positions[starts[b]:starts[b + 1]]
+        order = np.lexsort((positions, codes))
+        self._positions = positions[order]
+        self._starts = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+        self._block_ids = {block: i for i, block in enumerate(uniques)}
+
+    def _blocks(self, key):
+        tokens = [t for t in re.findall(TOKEN, key) if len(t) > 1]
+        blocks = tokens + ['~' + t[:PREFIX_CHARS] for t in tokens if len(t) > PREFIX_CHARS]
+        return [self._block_ids[b] for b in dict.fromkeys(blocks) if b in self._block_ids]
+
+    def candidates(self, key):
+        """Positions of the products sharing the most blocks with ``key`` (at most MAX_CANDIDATES)."""
+        blocks = self._blocks(key)
+        if not blocks:
+            return np.empty(0, dtype=np.int64)
+        sizes = np.array([self._starts[b + 1] - self._starts[b] for b in blocks])
+        selective = [b for b, size in zip(blocks, sizes) if size <= MAX_BLOCK_SIZE]
+        if not selective:
+            # Only common words: fall back to the least common one
+            selective = [blocks[int(np.argmin(sizes))]]
+        postings = np.concatenate([self._positions[self._starts[b]:self._starts[b + 1]] for b in selective])
+        positions, shared = np.unique(postings, return_counts=True)
+        if len(positions) > MAX_CANDIDATES:
+            positions = positions[np.argsort(-shared, kind='stable')[:MAX_CANDIDATES]]
+        return positions
+
+    def match(self, names, threshold=MATCH_THRESHOLD):
+        """Best catalog position and similarity per name; position is -1 below ``threshold``."""
+        keys = product_key(names).fillna('').tolist()
+        matched = np.full(len(keys), -1, dtype=np.int64)
+        scores = np.zeros(len(keys))
+        for i, key in enumerate(keys):
+            positions = self.candidates(key)
+            if not len(positions):
+                continue
+            similarities = [_similarity(key, candidate) for candidate in self.keys.iloc[positions].tolist()]
+            best = int(np.argmax(similarities))
+            scores[i] = similarities[best]
+            if scores[i] >= threshold:
+                matched[i] = positions[best]
+        return matched, scores
@@ -0,0 +1,156 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from mspcc.llm import LLMClient, LLMError, StubBackend, TTLCache
+
+
+def echo(prompt):
+    return f"answer to {prompt}"
+
+
+class FlakyBackend(StubBackend):
+    """Fails the first ``failures`` calls, then answers like StubBackend."""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(echo, **kwargs)
+        self.failures = failures
+
+    async def generate(self, prompt):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError(f"failure {self.calls}")
+        return self.respond(prompt)
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(backend, **kwargs):
+        client = LLMClient(backend, **kwargs)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_ttl_cache_hit_and_expiry():
+    cache = TTLCache(ttl=0.05)
+    cache.set('key', 'value')
+    assert cache.get('key') == 'value'
+    time.sleep(0.1)
+    assert cache.get('key') is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_repeated_prompt_is_served_from_cache(make_client):
+    backend = StubBackend(echo)
+    client = make_client(backend)
+    assert client.generate('q', 'v1') == 'answer to q'
+    assert client.generate('q', 'v1') == 'answer to q'
+    assert backend.calls == 1
+    # A different data fingerprint is a different cache entry
+    client.generate('q', 'v2')
+    assert backend.calls == 2
+
+
+def test_concurrent_identical_prompts_are_coalesced(make_client):
+    backend = StubBackend(echo, delay=0.2)
+    client = make_client(backend)
+    futures = [client.submit('same prompt') for _ in range(5)]
+    assert [future.result(5) for future in futures] == ['answer to same prompt'] * 5
+    assert backend.calls == 1
+
+
+def test_concurrent_identical_streams_share_one_backend_stream(make_client):
+    backend = StubBackend(lambda prompt: 'x' * 100, delay=0.2)
+    client = make_client(backend)
+    results = [None] * 3
+
+    def read(i):
+        results[i] = ''.join(client.stream('overview'))
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['x' * 100] * 3
+    assert backend.calls == 1
+
+
+def test_failed_requests_are_retried_with_backoff(make_client):
+    backend = FlakyBackend(failures=2)
+    client = make_client(backend, max_retries=3, backoff_seconds=0.05)
+    started = time.monotonic()
+    assert client.generate('q') == 'answer to q'
+    assert backend.calls == 3
+    # Two backoffs of at least half of 0.05 * 2**attempt each
+    assert time.monotonic() - started >= 0.05 * (1 + 2) / 2
+
+
+def test_gives_up_after_max_retries(make_client):
+    backend = FlakyBackend(failures=10)
+    client = make_client(backend, max_retries=2, backoff_seconds=0.001)
+    with pytest.raises(LLMError, match='after 3 attempts'):
+        client.generate('q')
+    assert backend.calls == 3
+
+
+def test_failed_response_is_not_cached(make_client):
+    backend = FlakyBackend(failures=1)
+    client = make_client(backend, max_retries=0)
+    with pytest.raises(LLMError):
+        client.generate('q')
+    assert client.generate('q') == 'answer to q'
+
+
+def test_generate_times_out(make_client):
+    backend = StubBackend(echo, delay=0.3)
+    client = make_client(backend)
+    with pytest.raises(concurrent.futures.TimeoutError):
+        client.generate('slow', timeout=0.05)
+    # The request carries on in the background; a later caller joins it instead of starting another
+    assert client.generate('slow', timeout=5) == 'answer to slow'
+    assert backend.calls == 1
+
+
+def test_stream_times_out(make_client):
+    backend = StubBackend(echo, delay=0.3)
+    client = make_client(backend)
+    with pytest.raises(TimeoutError):
+        list(client.stream('slow', timeout=0.05))
+    assert ''.join(client.stream('slow', timeout=5)) == 'answer to slow'
+    assert backend.calls == 1
+
+
+def test_stream_of_cached_response_is_one_chunk(make_client):
+    backend = StubBackend(lambda prompt: 'y' * 40)
+    client = make_client(backend)
+    assert len(list(client.stream('p'))) > 1
+    assert list(client.stream('p')) == ['y' * 40]
+    assert backend.calls == 1
+
+
+def test_stub_backend_streams_in_chunks():
+    async def collect():
+        return [chunk async for chunk in StubBackend(lambda prompt: 'z' * 40).stream('p')]
+
+    assert ''.join(asyncio.run(collect())) == 'z' * 40
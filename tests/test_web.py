@@ -0,0 +1,161 @@
+import http.server
+import threading
+
+import pytest
+
+import mspcc.web as web
+from mspcc.web import HTTPCache, WebFetcher
+
+# Several socket reads (64 KB each), so a body cut at whatever is buffered shows up
+LARGE_BODY = b'<html><p>' + b'0123456789abcdef' * 46_080 + b'</p></html>'
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    """Serves ``server.pages``: path -> (body, extra headers). Bodies go out whole, or chunked under /chunked."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path not in self.server.pages:
+            self.send_error(404)
+            return
+        body, headers = self.server.pages[self.path]
+        etag = headers.get('ETag')
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(headers.get('status', 200))
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        for name, value in headers.items():
+            if name != 'status':
+                self.send_header(name, value)
+        if self.path.startswith('/chunked'):
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(body), 10_000):
+                chunk = body[start:start + 10_000]
+                self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    server.pages = {}
+    server.requests = []
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_fetcher(tmp_path):
+    fetchers = []
+
+    def make(allow_private=True, **kwargs):
+        fetcher = WebFetcher(HTTPCache(str(tmp_path / 'http')), allow_private=allow_private,
+                             backoff_seconds=0.01, timeout=10, **kwargs)
+        fetchers.append(fetcher)
+        return fetcher
+
+    yield make
+    for fetcher in fetchers:
+        fetcher.close()
+
+
+def test_large_body_is_read_to_eof(server, make_fetcher):
+    server.pages['/large'] = (LARGE_BODY, {'Cache-Control': 'no-cache'})
+    fetcher = make_fetcher()
+    result = fetcher.fetch(server.url + '/large')
+    assert result.ok
+    assert result.text.encode('utf-8') == LARGE_BODY
+
+
+def test_chunked_body_is_read_to_eof(server, make_fetcher):
+    server.pages['/chunked'] = (LARGE_BODY, {})
+    result = make_fetcher().fetch(server.url + '/chunked')
+    assert result.ok
+    assert result.text.encode('utf-8') == LARGE_BODY
+
+
+def test_truncated_body_is_not_cached(server, make_fetcher, monkeypatch):
+    monkeypatch.setattr(web, 'MAX_BODY_BYTES', 100_000)
+    server.pages['/large'] = (LARGE_BODY, {'Cache-Control': 'max-age=3600'})
+    fetcher = make_fetcher()
+    result = fetcher.fetch(server.url + '/large')
+    assert len(result.text) == 100_000
+    assert fetcher.cache.get(server.url + '/large') == (None, None)
+    assert not fetcher.fetch(server.url + '/large').from_cache
+    assert server.requests == ['/large', '/large']
+
+
+def test_fresh_entry_is_served_from_cache(server, make_fetcher):
+    server.pages['/page'] = (b'<html>hello</html>', {'Cache-Control': 'max-age=3600'})
+    fetcher = make_fetcher()
+    first = fetcher.fetch(server.url + '/page')
+    second = fetcher.fetch(server.url + '/page')
+    assert not first.from_cache
+    assert second.from_cache and second.text == '<html>hello</html>'
+    assert server.requests == ['/page']
+
+
+def test_stale_entry_is_revalidated_with_etag(server, make_fetcher):
+    server.pages['/page'] = (b'<html>hello</html>', {'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+    fetcher = make_fetcher()
+    fetcher.fetch(server.url + '/page')
+    revalidated = fetcher.fetch(server.url + '/page')
+    assert revalidated.from_cache and revalidated.text == '<html>hello</html>'
+    assert server.requests == ['/page', '/page']
+
+    server.pages['/page'] = (b'<html>changed</html>', {'Cache-Control': 'no-cache', 'ETag': '"v2"'})
+    changed = fetcher.fetch(server.url + '/page')
+    assert not changed.from_cache and changed.text == '<html>changed</html>'
+
+
+def test_redirect_is_followed(server, make_fetcher):
+    server.pages['/old'] = (b'', {'status': 301, 'Location': '/new'})
+    server.pages['/new'] = (b'<html>moved</html>', {})
+    result = make_fetcher().fetch(server.url + '/old')
+    assert result.ok and result.text == '<html>moved</html>'
+
+
+def test_private_address_is_refused(server, make_fetcher):
+    server.pages['/page'] = (b'<html>internal</html>', {})
+    result = make_fetcher(allow_private=False).fetch(server.url + '/page')
+    assert not result.ok
+    assert 'private or local address' in result.error
+    assert server.requests == []
+
+
+def test_non_http_url_is_refused(make_fetcher):
+    result = make_fetcher(allow_private=False).fetch('file:///etc/passwd')
+    assert not result.ok and 'http(s)' in result.error
+
+
+@pytest.mark.parametrize('address, blocked', [
+    ('127.0.0.1', True),
+    ('10.0.0.1', True),
+    ('192.168.1.20', True),
+    ('169.254.169.254', True),
+    ('::1', True),
+    ('fe80::1%eth0', True),
+    ('::ffff:127.0.0.1', True),
+    ('224.0.0.1', True),
+    ('8.8.8.8', False),
+    ('2606:4700:4700::1111', False),
+])
+def test_blocked_address(address, blocked):
+    assert web._blocked_address(address) is blocked